@@ -0,0 +1,153 @@
+"""
+Inverted-file (IVF) approximate nearest-neighbour index over unit-length embeddings.
+
+Rows are clustered with spherical k-means; a query scores the centroids,
+probes the `nprobe` closest lists and runs the exact dot product only on the
+rows in those lists. With nlist ~ 4*sqrt(n) a probe touches a few hundred rows
+instead of the whole code system.
+
+Every row carries a hash of (code, vector). When the embeddings are
+regenerated, update() keeps the list of every unchanged row, assigns new or
+changed rows to their nearest existing centroid and drops removed ones; it
+only retrains the centroids when more than RETRAIN_FRACTION of the rows changed.
+
+`python -m ann_index` builds/updates the index of every system in the
+embeddings manifest (generate_mappings.py does this after saving embeddings).
+"""
+import hashlib
+import os
+
+import numpy as np
+
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+RETRAIN_FRACTION = 0.25
+KMEANS_ITERS = 12
+# k-means is trained on at most this many rows per list
+TRAIN_ROWS_PER_LIST = 64
+_CHUNK = 8192
+
+
+def default_nlist(rows: int) -> int:
+    return int(max(1, min(rows, round(4 * np.sqrt(rows)))))
+
+
+def row_hashes(codes, matrix) -> np.ndarray:
+    """64-bit hash of every (code, vector) row, used to detect changed rows."""
+    out = np.empty(len(codes), dtype=np.uint64)
+    for i, code in enumerate(codes):
+        h = hashlib.blake2b(str(code).encode("utf-8"), digest_size=8)
+        h.update(np.ascontiguousarray(matrix[i]).tobytes())
+        out[i] = int.from_bytes(h.digest(), "little")
+    return out
+
+
+def _assign(matrix, centroids) -> np.ndarray:
+    """Nearest centroid (max dot product) of every row, in chunks."""
+    out = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), _CHUNK):
+        block = np.asarray(matrix[start:start + _CHUNK], dtype=np.float32)
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def train_centroids(matrix, nlist, iters=KMEANS_ITERS, seed=0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(matrix), nlist * TRAIN_ROWS_PER_LIST)
+    sample = np.asarray(matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iters):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=nlist)
+        empty = counts == 0
+        # re-seed empty lists with random sample rows
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms == 0, 1, norms)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    def __init__(self, centroids, assignments, hashes):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.assignments = np.asarray(assignments, dtype=np.int32)
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        # rows grouped by list: rows of list c are order[offsets[c]:offsets[c + 1]]
+        self.order = np.argsort(self.assignments, kind="stable").astype(np.int32)
+        counts = np.bincount(self.assignments, minlength=self.nlist)
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.assignments)
+
+    @classmethod
+    def build(cls, matrix, hashes, nlist=None, seed=0):
+        if len(matrix) == 0:
+            return cls(np.zeros((1, matrix.shape[1]), np.float32), np.zeros(0, np.int32), hashes)
+        centroids = train_centroids(matrix, nlist or default_nlist(len(matrix)), seed=seed)
+        return cls(centroids, _assign(matrix, centroids), hashes)
+
+    def update(self, matrix, hashes):
+        """Index for new embeddings reusing this one's lists; returns (index, stats)."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(self.centroids) and matrix.shape[1:] != self.centroids.shape[1:]:
+            return IVFIndex.build(matrix, hashes), {"rows": len(hashes), "retrained": True}
+        previous = dict(zip(self.hashes.tolist(), self.assignments.tolist()))
+        assignments = np.fromiter((previous.get(h, -1) for h in hashes.tolist()), dtype=np.int32, count=len(hashes))
+        changed = np.flatnonzero(assignments < 0)
+        removed = len(set(self.hashes.tolist()) - set(hashes.tolist()))
+        stats = {"rows": len(hashes), "reused": len(hashes) - len(changed), "assigned": len(changed),
+                 "removed": removed, "retrained": False}
+        if len(changed) + removed > RETRAIN_FRACTION * max(len(hashes), 1):
+            stats["retrained"] = True
+            return IVFIndex.build(matrix, hashes), stats
+        if len(changed):
+            assignments[changed] = _assign(np.asarray(matrix[changed]), self.centroids)
+        return IVFIndex(self.centroids, assignments, hashes), stats
+
+    def search(self, matrix, query, top_k=10, nprobe=ANN_NPROBE):
+        """(rows, scores) of the best top_k rows in the nprobe lists closest to query."""
+        q = np.asarray(query, dtype=np.float32)
+        nprobe = min(max(nprobe, 1), self.nlist)
+        centroid_scores = self.centroids @ q
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe] if nprobe < self.nlist else np.arange(self.nlist)
+        rows = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probe])
+        k = min(top_k, len(rows))
+        if k <= 0:
+            return np.zeros(0, np.int64), np.zeros(0, np.float32)
+        rows.sort()  # sequential reads from the mmap
+        scores = np.asarray(matrix[rows], dtype=np.float32) @ q
+        top = np.argpartition(-scores, k - 1)[:k]
+        return rows[top].astype(np.int64), scores[top]
+
+    def save(self, path, source_digest):
+        np.savez(path, centroids=self.centroids, assignments=self.assignments, hashes=self.hashes,
+                 source_digest=np.array(source_digest))
+
+    @classmethod
+    def load(cls, path, source_digest=None):
+        """Index saved for the given embeddings digest, or None if it is missing or stale."""
+        try:
+            with np.load(path) as data:
+                if source_digest is not None and str(data["source_digest"]) != source_digest:
+                    return None
+                return cls(data["centroids"], data["assignments"], data["hashes"])
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+def main():
+    from embedding_index import EMBEDDINGS_DIR, EmbeddingIndex, build_ann
+
+    for system in EmbeddingIndex(EMBEDDINGS_DIR).systems:
+        stats = build_ann(EMBEDDINGS_DIR, system)
+        print(f"✅ {system}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
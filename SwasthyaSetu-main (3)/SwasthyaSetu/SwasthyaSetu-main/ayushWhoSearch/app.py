@@ -1,20 +1,26 @@
 # sih/ayush/app.py  (full file)
 import os, json, uuid, logging
-from fastapi import FastAPI, Body, Depends, HTTPException
+from fastapi import FastAPI, Body, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional
 from datetime import datetime
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.exceptions import RequestValidationError
 # local imports
 from app_.database import SessionLocal
 from app_ import models
 from app_.security import oauth2_scheme, validate_abha_token
-from app_.icd_sync import sync_terms_to_db
+from app_.sync_jobs import SyncJobRunner
 from app_ import who_client
-from search_utils import fuzzy_search_with_explain
-from app_.translate_utils import translate_ayush_code
+from search_utils import cached_search
+from search_cache import search_cache
+from mapping_store import loaded_stores
+from embedding_index import semantic_search
+from fhir_cache import FHIR_MEDIA_TYPE, codesystem, conceptmap, fhir_response
+from code_index import EXPAND_DEFAULT_COUNT, expansion, get_index, lookup_parameters
+from app_.translate_utils import translate_ayush_code, translate_ayush_codes
+from app_ import reverse_map
 
 # configure logging
 logging.basicConfig(level=logging.INFO)
@@ -36,6 +42,11 @@ class SearchRequest(BaseModel):
     top_k: int = 20
     min_similarity: float = 0.5
 
+class SemanticSearchRequest(BaseModel):
+    query: str
+    top_k: int = 10
+    systems: Optional[List[str]] = None  # "AYUSH", "TM2", "Biomedicine"; default all
+
 class TranslateRequest(BaseModel):
     system: str
     code: str
@@ -43,7 +54,8 @@ class TranslateRequest(BaseModel):
 # health & version
 @app.get("/health")
 def health():
-    return {"status":"ok", "time": datetime.utcnow().isoformat()}
+    return {"status":"ok", "time": datetime.utcnow().isoformat(), "search_cache": search_cache.stats(),
+            "mapping_stores": loaded_stores()}
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request, exc):
@@ -64,42 +76,93 @@ def version():
 def search(req: SearchRequest):
     # reuse your Pandas rapidfuzz logic (imported or embedded)
    
-    results = fuzzy_search_with_explain(req.query, top_k=req.top_k, min_similarity=req.min_similarity)
+    results = cached_search(req.query, top_k=req.top_k, min_similarity=req.min_similarity)
+    return {"query": req.query, "results": results}
+
+# vector search over the embeddings saved by generate_mappings.py
+@app.post("/search/semantic", tags=["Search"])
+def search_semantic(req: SemanticSearchRequest):
+    try:
+        results = semantic_search(req.query, top_k=req.top_k, systems=req.systems)
+    except LookupError as e:
+        raise HTTPException(503, str(e))
     return {"query": req.query, "results": results}
 
-# ICD sync trigger
-@app.post("/sync/icd", tags=["Sync"])
+# ICD sync: runs as a background job (see app_.sync_jobs); poll /sync/jobs/{job_id}
+sync_runner = SyncJobRunner()
+
+@app.on_event("startup")
+def resume_sync_jobs():
+    resumed = sync_runner.resume_pending()
+    if resumed:
+        logger.info("Resuming %d interrupted sync job(s)", len(resumed))
+
+@app.post("/sync/icd", tags=["Sync"], status_code=202)
 def sync_icd(token: str = Depends(oauth2_scheme)):
     user = validate_abha_token(token)
     # load NAMASTE terms to query
     codes = None
-    cs_path = "./data/namaste-combined-codesystem.json"
-    if os.path.exists(cs_path):
-        codes = json.load(open(cs_path)).get("concept",[])
+    cs = codesystem.get()
+    if cs is not None:
+        codes = cs.get("concept",[])
     term_list = [c.get("display") for c in codes if c.get("display")] if codes else ["fever","cough"]
-    added = sync_terms_to_db(term_list[:50], limit_per_term=2)
-    # audit log
-    db = SessionLocal(); 
-    db.add(models.AuditLog(action="sync_icd", by_user=user.get("sub","system"), details={"added": added}))
-    db.commit(); db.close()
-    return {"status":"ok", "added": added}
-
-# FHIR CodeSystem & ConceptMap endpoints (serve generated files)
+    # one sync at a time: a second POST gets the job that is already queued or running
+    job_id, created = sync_runner.submit_once(term_list, limit_per_term=2, by_user=user.get("sub","system"))
+    return {"status": "queued" if created else "already_running", "job_id": job_id}
+
+@app.get("/sync/jobs/{job_id}", tags=["Sync"])
+def sync_job(job_id: str):
+    progress = sync_runner.progress(job_id)
+    if progress is None:
+        raise HTTPException(404, "Sync job not found")
+    return progress
+
+# FHIR CodeSystem & ConceptMap endpoints (serve the generated files from memory, see fhir_cache)
 @app.get("/fhir/CodeSystem/namaste")
-def get_codesystem():
-    path = "./data/namaste-combined-codesystem.json"
-    if not os.path.exists(path):
-        raise HTTPException(404, "CodeSystem not found; run generator")
-    cs = json.load(open(path, encoding="utf-8"))
-    return cs
+def get_codesystem(request: Request):
+    return fhir_response(request, codesystem, "CodeSystem not found; run generator")
 
 @app.get("/fhir/ConceptMap/namaste-to-icd11")
-def get_conceptmap():
-    path = "./data/namaste-combined-conceptmap.json"
-    if not os.path.exists(path):
+def get_conceptmap(request: Request):
+    return fhir_response(request, conceptmap, "ConceptMap not found; run generator")
+
+def _code_index(system=None):
+    index = get_index()
+    if index is None:
+        raise HTTPException(404, "CodeSystem not found; run generator")
+    if system and system not in (index.url, f"{index.url}?vs"):
+        raise HTTPException(404, f"Unknown system: {system}")
+    return index
+
+# $lookup: one code, without downloading the CodeSystem
+@app.get("/fhir/CodeSystem/$lookup", tags=["FHIR"])
+@app.get("/fhir/CodeSystem/namaste/$lookup", tags=["FHIR"])
+def codesystem_lookup(code: str, system: Optional[str] = None):
+    index = _code_index(system)
+    concept = index.lookup(code)
+    if concept is None:
+        raise HTTPException(404, f"Code {code} not found in {index.url}")
+    return JSONResponse(lookup_parameters(index, concept), media_type=FHIR_MEDIA_TYPE)
+
+# $expand: paged (and optionally filtered) expansion of the whole CodeSystem, e.g. for autocomplete
+@app.get("/fhir/ValueSet/$expand", tags=["FHIR"])
+@app.get("/fhir/ValueSet/namaste/$expand", tags=["FHIR"])
+def valueset_expand(url: Optional[str] = None, filter: Optional[str] = None,
+                    count: int = Query(EXPAND_DEFAULT_COUNT, ge=0), offset: int = Query(0, ge=0)):
+    index = _code_index(url)
+    return JSONResponse(expansion(index, filter, offset, count), media_type=FHIR_MEDIA_TYPE)
+
+# $translate over the indexed ConceptMap, NAMASTE -> ICD-11 or (reverse) ICD-11 -> NAMASTE
+@app.get("/fhir/ConceptMap/$translate", tags=["FHIR"])
+@app.get("/fhir/ConceptMap/namaste-to-icd11/$translate", tags=["FHIR"])
+def conceptmap_translate(code: str, system: Optional[str] = None, reverse: bool = False):
+    index = reverse_map.get_index()
+    if index is None:
         raise HTTPException(404, "ConceptMap not found; run generator")
-    cm = json.load(open(path, encoding="utf-8"))
-    return cm
+    if system and system not in (index.source, index.target):
+        raise HTTPException(404, f"Unknown system: {system}")
+    reverse = reverse or (system is not None and system == index.target)
+    return JSONResponse(reverse_map.translate_parameters(index, code, reverse), media_type=FHIR_MEDIA_TYPE)
 
 # Translate operation (NAMASTE -> ICD)
 class TranslateRequest(BaseModel):
@@ -122,6 +185,31 @@ def translate(req: TranslateRequest):
     }
 
 
+# Batch translate (NAMASTE -> ICD), results in request order; NDJSON with ?stream=true
+# or Accept: application/x-ndjson so very large batches are never held in memory
+class BatchTranslateRequest(BaseModel):
+    system: str = "NAMASTE"
+    codes: List[str]
+    target_lang: Optional[str] = "hi"  # null: no term translation
+
+@app.post("/translate/batch")
+def translate_batch(req: BatchTranslateRequest, request: Request, stream: bool = False):
+    if req.system.upper() != "NAMASTE":
+        return {"error": "unsupported_system"}
+    results = translate_ayush_codes(req.codes, req.target_lang)
+    if stream or "application/x-ndjson" in request.headers.get("accept", ""):
+        lines = (json.dumps(r, ensure_ascii=False) + "\n" for r in results)
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+    return {"results": list(results)}
+
+# ICD-11 -> NAMASTE for many codes at once, results in request order
+class ReverseTranslateRequest(BaseModel):
+    codes: List[str]
+
+@app.post("/translate/reverse")
+def translate_reverse(req: ReverseTranslateRequest):
+    return {"results": reverse_map.icd_to_ayush_batch(req.codes)}
+
 
 # Bundle ingestion (FHIR Bundle)
 @app.post("/fhir/Bundle", tags=["FHIR"])
@@ -0,0 +1,94 @@
+"""
+Batched writes of WHO search results into icd_entities.
+
+IcdEntityWriter buffers entities, dedupes them by icd_uri in memory (the
+last one seen wins) and writes each batch as one executemany of
+INSERT ... ON CONFLICT (icd_uri) DO UPDATE in its own transaction, on SQLite
+and PostgreSQL alike. One SELECT per batch tells new rows from updated ones.
+"""
+import os
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .database import engine as default_engine
+from .models import IcdEntity
+
+INGEST_BATCH_SIZE = int(os.getenv("ICD_INGEST_BATCH_SIZE", "500"))
+UPSERT_COLUMNS = ["icd_code", "label", "definition", "source_query", "raw_json"]
+
+
+def entity_row(e, source_query) -> dict:
+    """icd_entities row of one WHO search entity."""
+    label = e.get("title", {}).get("@value") if isinstance(e.get("title"), dict) else e.get("title") or ''
+    return {
+        "icd_uri": e.get("id") or e.get("@id") or e.get("uri"),
+        "icd_code": e.get("mms") or e.get("code") or '',
+        "label": label,
+        "definition": e.get("definition", ""),
+        "source_query": source_query,
+        "raw_json": e,
+    }
+
+
+def _insert(dialect):
+    return (postgresql if dialect == "postgresql" else sqlite).insert(IcdEntity.__table__)
+
+
+class IcdEntityWriter:
+    def __init__(self, engine=None, batch_size=INGEST_BATCH_SIZE):
+        self.engine = engine if engine is not None else default_engine
+        self.batch_size = batch_size
+        self.inserted = 0
+        self.updated = 0
+        self._buffer = {}
+        self._statement = None
+
+    def _upsert(self):
+        if self._statement is None:
+            stmt = _insert(self.engine.dialect.name)
+            self._statement = stmt.on_conflict_do_update(
+                index_elements=[IcdEntity.__table__.c.icd_uri],
+                set_={**{name: stmt.excluded[name] for name in UPSERT_COLUMNS}, "updated_at": func.now()})
+        return self._statement
+
+    def add(self, row: dict):
+        if not row.get("icd_uri"):
+            return
+        self._buffer[row["icd_uri"]] = row
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def add_many(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def flush(self):
+        if not self._buffer:
+            return
+        rows = list(self._buffer.values())
+        self._buffer = {}
+        with self.engine.begin() as conn:
+            self.write(conn, rows)
+
+    def write(self, conn, rows):
+        """Upsert already deduped rows inside the caller's transaction."""
+        table = IcdEntity.__table__
+        if rows:
+            existing = conn.execute(select(func.count()).select_from(table)
+                                    .where(table.c.icd_uri.in_([r["icd_uri"] for r in rows]))).scalar()
+            # one executemany of a cached statement; on PostgreSQL SQLAlchemy sends it as
+            # multi-row VALUES pages ("insertmanyvalues"), SQLite runs it as one prepared statement
+            conn.execute(self._upsert(), rows)
+            self.inserted += len(rows) - existing
+            self.updated += existing
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.flush()
@@ -1,28 +1,19 @@
-from .who_client import icd_search
-from .database import SessionLocal
-from .models import IcdEntity
-from sqlalchemy.exc import IntegrityError
+from who_sync import run_sync
+from .who_client import API_BASE, fetch_token
+from .icd_ingest import IcdEntityWriter, entity_row
+
+def fetch_pages(term_list, limit_per_term=3):
+    """{(term, page): entities} for every term, fetched concurrently (see who_sync)."""
+    pages = {}
+    run_sync(term_list, max_pages=limit_per_term, base=API_BASE, token_provider=fetch_token,
+             on_page=lambda term, page, resp, entities: pages.__setitem__((term, page), entities))
+    return pages
 
 def sync_terms_to_db(term_list, limit_per_term=3):
-    db = SessionLocal()
-    added = 0
-    for term in term_list:
-        for page in range(1, limit_per_term+1):
-            resp = icd_search(term, page=page)
-            entities = resp.get("destinationEntities") or resp.get("items") or []
-            for e in entities:
-                icd_uri = e.get("id") or e.get("@id") or e.get("uri")
-                icd_code = e.get("mms") or e.get("code") or ''
-                label = e.get("title", {}).get("@value") if isinstance(e.get("title"), dict) else e.get("title") or ''
-                raw = e
-                existing = db.query(IcdEntity).filter(IcdEntity.icd_uri==icd_uri).first()
-                if not existing:
-                    ent = IcdEntity(icd_uri=icd_uri, icd_code=icd_code, label=label, definition=e.get("definition",""), source_query=term, raw_json=raw)
-                    db.add(ent)
-                    try:
-                        db.commit()
-                        added += 1
-                    except IntegrityError:
-                        db.rollback()
-    db.close()
-    return added
+    pages = fetch_pages(term_list, limit_per_term)
+    # one multi-row upsert and commit per batch (see icd_ingest)
+    with IcdEntityWriter() as writer:
+        for term in term_list:
+            for page in range(1, limit_per_term+1):
+                writer.add_many(entity_row(e, term) for e in pages.get((term, page), []))
+    return writer.inserted
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, JSON, DateTime, ForeignKey, Float, func
+from sqlalchemy import Column, Integer, String, Text, JSON, DateTime, ForeignKey, Float, UniqueConstraint, func
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -38,3 +38,38 @@ class AuditLog(Base):
     by_user = Column(String)
     details = Column(JSON)
     ts = Column(DateTime(timezone=True), server_default=func.now())
+
+class SyncJob(Base):
+    __tablename__ = "sync_jobs"
+    id = Column(String, primary_key=True)
+    status = Column(String, nullable=False, default="queued")  # queued, running, done, failed
+    by_user = Column(String)
+    terms = Column(JSON, nullable=False)
+    limit_per_term = Column(Integer, nullable=False)
+    done_terms = Column(Integer, nullable=False, default=0)
+    done_pages = Column(Integer, nullable=False, default=0)
+    entities = Column(Integer, nullable=False, default=0)
+    added = Column(Integer, nullable=False, default=0)
+    failed_terms = Column(Integer, nullable=False, default=0)
+    # counters when the current run started (a resumed job continues from its checkpoints)
+    resumed_terms = Column(Integer, nullable=False, default=0)
+    resumed_pages = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    # the runner (SyncJobRunner.worker_id) that claimed the job, and its last checkpoint commit
+    claimed_by = Column(String)
+    heartbeat_at = Column(DateTime(timezone=True))
+    # 1 while a submit_once job is queued or running, NULL otherwise: at most one such job at a time
+    exclusive = Column(Integer, unique=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+
+class SyncCheckpoint(Base):
+    __tablename__ = "sync_checkpoints"
+    __table_args__ = (UniqueConstraint("job_id", "term", "page"),)
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, ForeignKey("sync_jobs.id"), nullable=False, index=True)
+    term = Column(String, nullable=False)
+    page = Column(Integer, nullable=False)
+    entities = Column(Integer, nullable=False)
+    last = Column(Integer, nullable=False, default=0)  # 1 when this was the term's final page
@@ -1,13 +1,116 @@
-import json, os
+"""
+ICD-11 <-> AYUSH lookups over the generated ConceptMap.
+
+ConceptMapIndex hashes the ConceptMap once (AYUSH code -> targets, ICD code ->
+AYUSH sources, over every element of every group) instead of scanning every
+element and target per call. It is
+built from the copy fhir_cache keeps in memory and rebuilt when that file
+changes. Similarity scores are not part of the ConceptMap; they are joined in
+from the candidate-mapping CSV when it is available, and the index is rebuilt
+when get_store reloads that CSV too.
+"""
+import os
+import threading
+
+from fhir_cache import conceptmap
+from mapping_store import get_store
+
+MAPPINGS_CSV = "./data/candidate_mappings_semantic_v2.csv"
+
+
+def _mapping_store(path):
+    return get_store(path) if os.path.exists(path) else None
+
+
+def _mapping_scores(store) -> dict:
+    """(AYUSH code, WHO code) -> best Similarity_Score in the mapping store (None: no CSV)."""
+    if store is None:
+        return {}
+    scores = {}
+    for pair, score in zip(zip(store.column("AYUSH_Code").tolist(), store.column("WHO_Code_Candidate").tolist()),
+                           store.similarity.tolist()):
+        if score > scores.get(pair, -1.0):
+            scores[pair] = score
+    return scores
+
+
+class ConceptMapIndex:
+    def __init__(self, resource, scores=None, scores_version=None):
+        self.resource = resource
+        self.scores_version = scores_version
+        scores = scores or {}
+        first = (resource.get("group") or [{}])[0]
+        self.source = first.get("source") or resource.get("sourceUri")
+        self.target = first.get("target") or resource.get("targetUri")
+        # code -> [(system of the other side, target / source match)], in ConceptMap order;
+        # a code may have several elements and appear in several groups
+        self.forward = {}
+        self.reverse = {}
+        for group in resource.get("group") or []:
+            source = group.get("source") or resource.get("sourceUri")
+            target = group.get("target") or resource.get("targetUri")
+            for el in group.get("element", []):
+                code = el.get("code")
+                for t in el.get("target", []):
+                    self.forward.setdefault(code, []).append((target, t))
+                    self.reverse.setdefault(t.get("code"), []).append((source, {
+                        "AYUSH_Code": code,
+                        "AYUSH_Term": el.get("display"),
+                        "relationship": t.get("equivalence"),
+                        "Similarity_Score": scores.get((code, t.get("code"))),
+                    }))
+
+    def targets(self, ayush_code) -> list:
+        return [dict(t) for _, t in self.forward.get(ayush_code, [])]
+
+    def sources(self, icd_code) -> list:
+        return [dict(m) for _, m in self.reverse.get(icd_code, [])]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The ConceptMapIndex of the current ConceptMap file, or None when it has not been generated."""
+    global _index
+    resource = conceptmap.get()
+    if resource is None:
+        return None
+    store = _mapping_store(MAPPINGS_CSV)
+    version = None if store is None else store.version
+    with _index_lock:
+        if _index is None or _index.resource is not resource or _index.scores_version != version:
+            _index = ConceptMapIndex(resource, _mapping_scores(store), version)
+        return _index
+
 
 def icd_to_ayush(icd_code: str):
-    cm_path = "./data/namaste-combined-conceptmap.json"
-    if not os.path.exists(cm_path):
-        return []
-    cm = json.load(open(cm_path))
-    results = []
-    for el in cm.get("group", [{}])[0].get("element", []):
-        for t in el.get("target", []):
-            if t.get("code") == icd_code:
-                results.append({"AYUSH_Code": el.get("code"), "AYUSH_Term": el.get("display")})
-    return results
+    index = get_index()
+    return [] if index is None else index.sources(icd_code)
+
+
+def icd_to_ayush_batch(icd_codes) -> list:
+    """One {"ICD_Code", "matches"} entry per requested code, in request order."""
+    index = get_index()
+    return [{"ICD_Code": code, "matches": [] if index is None else index.sources(code)} for code in icd_codes]
+
+
+def translate_parameters(index, code, reverse=False) -> dict:
+    """FHIR Parameters for ConceptMap $translate (reverse=True: ICD-11 code -> AYUSH codes)."""
+    if reverse:
+        matches = [(m["relationship"], system, m["AYUSH_Code"], m["AYUSH_Term"])
+                   for system, m in index.reverse.get(code, [])]
+    else:
+        matches = [(t.get("equivalence"), system, t.get("code"), t.get("display"))
+                   for system, t in index.forward.get(code, [])]
+    params = [{"name": "result", "valueBoolean": bool(matches)}]
+    if not matches:
+        params.append({"name": "message", "valueString": f"No mapping found for code {code}"})
+    for equivalence, system, target_code, display in matches:
+        coding = {"system": system, "code": target_code}
+        if display:
+            coding["display"] = display
+        params.append({"name": "match", "part": [{"name": "equivalence", "valueCode": equivalence},
+                                                 {"name": "concept", "valueCoding": coding}]})
+    return {"resourceType": "Parameters", "parameter": params}
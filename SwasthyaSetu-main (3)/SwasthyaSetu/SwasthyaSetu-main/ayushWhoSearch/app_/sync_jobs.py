@@ -0,0 +1,292 @@
+"""
+Background WHO sync jobs behind POST /sync/icd.
+
+A job is a row in sync_jobs; SyncJobRunner runs jobs on a small thread pool
+(SYNC_JOB_WORKERS), each through the concurrent who_sync engine. Fetched
+pages are buffered and committed together with their checkpoints: one
+transaction upserts the entities (icd_ingest), records one sync_checkpoints
+row per (term, page) and advances the job's counters, so what the database
+says is done is really done.
+
+All jobs share one TokenBucket, so however many workers run, WHO sees at
+most WHO_SYNC_RATE requests/s from this process; submit_once() hands back
+the job already queued or running instead of starting another (the unique
+sync_jobs.exclusive column settles a race between processes).
+
+A runner only runs a job it has claimed: one UPDATE sets claimed_by to its
+worker_id where the job is queued or running and unclaimed, already its own,
+or left by a runner whose last checkpoint commit (heartbeat_at) is older
+than SYNC_JOB_LEASE seconds. Several uvicorn workers resuming at startup
+therefore run each job once.
+
+After a crash, resume_pending() restarts every queued or running job it can
+claim: terms whose final page is checkpointed are skipped and the others
+continue from the page after their last checkpoint. Pages fetched but not
+yet committed are fetched again; the upsert makes that harmless. A job
+still leased by a stopped worker is taken over by the next submit_once().
+"""
+import asyncio
+import logging
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from who_sync import PAGE_SIZE, WHO_SYNC_BURST, WHO_SYNC_RATE, TokenBucket, run_sync
+from .database import Base, engine as default_engine
+from .icd_ingest import INGEST_BATCH_SIZE, IcdEntityWriter, entity_row
+from .models import AuditLog, SyncCheckpoint, SyncJob
+from .who_client import API_BASE, fetch_token
+
+SYNC_JOB_WORKERS = int(os.getenv("SYNC_JOB_WORKERS", "2"))
+# a claimed job without a checkpoint commit for this long may be taken over by another runner
+SYNC_JOB_LEASE = float(os.getenv("SYNC_JOB_LEASE", "300"))
+ACTIVE = ("queued", "running")
+
+logger = logging.getLogger("sync-jobs")
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _utc(ts):
+    # SQLite hands timestamps back without their timezone
+    return ts if ts is None or ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+class _JobSink:
+    """on_page target of one run: buffers rows and pages, commits them with their checkpoints."""
+
+    def __init__(self, engine, job_id, limit_per_term, page_size, batch_size=INGEST_BATCH_SIZE):
+        self.engine = engine
+        self.job_id = job_id
+        self.limit_per_term = limit_per_term
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.writer = IcdEntityWriter(engine, batch_size)
+        self.rows = {}
+        self.pages = []
+        self._lock = asyncio.Lock()
+
+    async def on_page(self, term, page, response, entities):
+        for e in entities:
+            row = entity_row(e, term)
+            if row["icd_uri"]:
+                self.rows[row["icd_uri"]] = row
+        last = len(entities) < self.page_size or page == self.limit_per_term
+        self.pages.append({"job_id": self.job_id, "term": term, "page": page, "entities": len(entities),
+                           "last": int(last)})
+        if len(self.rows) >= self.batch_size:
+            async with self._lock:
+                rows, pages = self._take()
+                await asyncio.to_thread(self._commit, rows, pages)
+
+    def _take(self):
+        rows, pages = list(self.rows.values()), self.pages
+        self.rows, self.pages = {}, []
+        return rows, pages
+
+    def flush(self):
+        self._commit(*self._take())
+
+    def _commit(self, rows, pages):
+        if not pages:
+            return
+        before = self.writer.inserted
+        with self.engine.begin() as conn:
+            self.writer.write(conn, rows)
+            conn.execute(insert(SyncCheckpoint), pages)
+            conn.execute(update(SyncJob).where(SyncJob.id == self.job_id).values(
+                done_pages=SyncJob.done_pages + len(pages),
+                done_terms=SyncJob.done_terms + sum(p["last"] for p in pages),
+                entities=SyncJob.entities + sum(p["entities"] for p in pages),
+                added=SyncJob.added + (self.writer.inserted - before), heartbeat_at=_now()))
+
+
+class SyncJobRunner:
+    def __init__(self, engine=None, workers=SYNC_JOB_WORKERS, sync_options=None, lease=SYNC_JOB_LEASE):
+        self.engine = engine if engine is not None else default_engine
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease = lease
+        self.sessions = sessionmaker(bind=self.engine)
+        self.executor = ThreadPoolExecutor(max(1, workers), thread_name_prefix="sync-job")
+        # passed to who_sync.run_sync (tests point it at the mock WHO server)
+        options = sync_options if sync_options is not None else {"base": API_BASE, "token_provider": fetch_token}
+        # one rate limit for all workers: jobs running side by side split the WHO quota
+        self.bucket = TokenBucket(options.get("rate", WHO_SYNC_RATE), options.get("burst", WHO_SYNC_BURST))
+        self.sync_options = {**options, "bucket": self.bucket}
+        self._tables_ready = False
+        self._active = set()
+        self._lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+
+    def _ensure_tables(self):
+        if not self._tables_ready:
+            Base.metadata.create_all(self.engine, tables=[SyncJob.__table__, SyncCheckpoint.__table__,
+                                                          AuditLog.__table__])
+            self._tables_ready = True
+
+    def create(self, terms, limit_per_term=2, by_user="system", exclusive=False) -> str:
+        """Insert a queued job; with exclusive=True, IntegrityError when another exclusive job is active."""
+        self._ensure_tables()
+        job_id = str(uuid.uuid4())
+        with self.sessions.begin() as db:
+            db.add(SyncJob(id=job_id, status="queued", by_user=by_user, terms=list(dict.fromkeys(terms)),
+                           limit_per_term=limit_per_term, exclusive=1 if exclusive else None))
+        return job_id
+
+    def submit(self, terms, limit_per_term=2, by_user="system") -> str:
+        """Queue a new job and return its id immediately."""
+        job_id = self.create(terms, limit_per_term, by_user)
+        self._start(job_id)
+        return job_id
+
+    def active_job(self):
+        """Id of the oldest queued or running job, or None."""
+        self._ensure_tables()
+        with self.sessions() as db:
+            return db.scalars(select(SyncJob.id).where(SyncJob.status.in_(ACTIVE))
+                              .order_by(SyncJob.created_at).limit(1)).first()
+
+    def submit_once(self, terms, limit_per_term=2, by_user="system"):
+        """(job id, created): a new job, or the one already queued or running."""
+        with self._submit_lock:
+            while True:
+                job_id = self.active_job()
+                if job_id is not None:
+                    # picks the job up if its runner stopped; a no-op while that runner is alive
+                    self._start(job_id)
+                    return job_id, False
+                try:
+                    job_id = self.create(terms, limit_per_term, by_user, exclusive=True)
+                except IntegrityError:
+                    continue  # another process queued one between the check and the insert
+                self._start(job_id)
+                return job_id, True
+
+    def _claim(self, job_id) -> bool:
+        """Atomically take the job for this runner (see the module docstring); True when it is ours."""
+        now = _now()
+        with self.engine.begin() as conn:
+            claimed = conn.execute(update(SyncJob).where(
+                SyncJob.id == job_id, SyncJob.status.in_(ACTIVE),
+                or_(SyncJob.claimed_by.is_(None), SyncJob.claimed_by == self.worker_id,
+                    SyncJob.heartbeat_at < now - timedelta(seconds=self.lease)),
+            ).values(status="running", claimed_by=self.worker_id, heartbeat_at=now)).rowcount
+        return claimed == 1
+
+    def _take(self, job_id) -> bool:
+        """Claim the job for one run in this process; False when it is already running (here or elsewhere)."""
+        with self._lock:
+            if job_id in self._active or not self._claim(job_id):
+                return False
+            self._active.add(job_id)
+            return True
+
+    def _release(self, job_id):
+        with self._lock:
+            self._active.discard(job_id)
+
+    def _start(self, job_id) -> bool:
+        """Claim the job and run it on the pool; False when it is already running."""
+        if not self._take(job_id):
+            return False
+        self.executor.submit(self._run_logged, job_id)
+        return True
+
+    def resume_pending(self) -> list:
+        """Restart the jobs left queued or running (e.g. by a crash) that this runner claims; returns their ids."""
+        self._ensure_tables()
+        with self.sessions() as db:
+            ids = db.scalars(select(SyncJob.id).where(SyncJob.status.in_(ACTIVE))).all()
+        return [job_id for job_id in ids if self._start(job_id)]
+
+    def _run_logged(self, job_id):
+        try:
+            self._run(job_id)
+        except Exception:
+            logger.exception("sync job %s crashed", job_id)
+        finally:
+            self._release(job_id)
+
+    def _start_pages(self, db, job_id):
+        """(finished terms, {term: next page}) from the job's checkpoints."""
+        rows = db.execute(select(SyncCheckpoint.term, func.max(SyncCheckpoint.page), func.max(SyncCheckpoint.last))
+                          .where(SyncCheckpoint.job_id == job_id).group_by(SyncCheckpoint.term)).all()
+        finished = {term for term, _, last in rows if last}
+        return finished, {term: page + 1 for term, page, last in rows if not last}
+
+    def run(self, job_id) -> bool:
+        """Run (or resume) one job in the calling thread; False when it is already running."""
+        if not self._take(job_id):
+            logger.info("sync job %s is already running", job_id)
+            return False
+        try:
+            self._run(job_id)
+        finally:
+            self._release(job_id)
+        return True
+
+    def _run(self, job_id):
+        with self.sessions.begin() as db:
+            job = db.get(SyncJob, job_id)
+            finished, start_pages = self._start_pages(db, job_id)
+            terms = [t for t in job.terms if t not in finished]
+            limit_per_term, by_user = job.limit_per_term, job.by_user
+            job.status, job.started_at, job.finished_at, job.error = "running", _now(), None, None
+            job.resumed_terms, job.resumed_pages = job.done_terms, job.done_pages
+        page_size = self.sync_options.get("page_size", PAGE_SIZE)
+        sink = _JobSink(self.engine, job_id, limit_per_term, page_size)
+        try:
+            stats = run_sync(terms, max_pages=limit_per_term, on_page=sink.on_page, start_pages=start_pages,
+                             **self.sync_options)
+            sink.flush()
+        except Exception as e:
+            with self.sessions.begin() as db:
+                job = db.get(SyncJob, job_id)
+                job.status, job.error, job.finished_at, job.exclusive = "failed", str(e), _now(), None
+            raise
+        with self.sessions.begin() as db:
+            job = db.get(SyncJob, job_id)
+            job.status, job.finished_at, job.failed_terms = "done", _now(), stats["failed_terms"]
+            job.exclusive = None
+            db.add(AuditLog(action="sync_icd", by_user=by_user,
+                            details={"job_id": job_id, "added": job.added, "failed_terms": job.failed_terms}))
+
+    def progress(self, job_id):
+        """Job state with throughput of the current run and an ETA; None for an unknown id."""
+        self._ensure_tables()
+        with self.sessions() as db:
+            job = db.get(SyncJob, job_id)
+            if job is None:
+                return None
+            started, finished = _utc(job.started_at), _utc(job.finished_at)
+            elapsed = ((finished or _now()) - started).total_seconds() if started else 0.0
+            terms_per_s = (job.done_terms - job.resumed_terms) / elapsed if elapsed > 0 else 0.0
+            remaining = len(job.terms) - job.done_terms
+            eta = remaining / terms_per_s if job.status == "running" and terms_per_s > 0 else None
+            return {
+                "job_id": job.id,
+                "status": job.status,
+                "terms": {"total": len(job.terms), "done": job.done_terms, "failed": job.failed_terms},
+                "pages": job.done_pages,
+                "entities": job.entities,
+                "added": job.added,
+                "elapsed_seconds": round(elapsed, 1),
+                "throughput": {
+                    "terms_per_second": round(terms_per_s, 2),
+                    "pages_per_second": round((job.done_pages - job.resumed_pages) / elapsed, 2) if elapsed > 0 else 0.0,
+                },
+                "eta_seconds": None if eta is None else round(eta, 1),
+                "created_at": job.created_at.isoformat() if job.created_at else None,
+                "started_at": started.isoformat() if started else None,
+                "finished_at": finished.isoformat() if finished else None,
+                "error": job.error,
+            }
@@ -1,11 +1,37 @@
-import pandas as pd
-from googletrans import Translator
+import threading
+
+import numpy as np
+from mapping_store import get_store
+from translation_memory import (TRANSLATION_PREWARM_LANGS, BackgroundFiller, TranslationMemory, make_translator,
+                                split_who_term, who_terms)
 
-# Load CSV once
 CSV = "./data/candidate_mappings_semantic_v2.csv"
-df = pd.read_csv(CSV, dtype=str).fillna("")
 
-translator = Translator()
+def current_store():
+    """Same store instance search_utils uses; reloaded by get_store once the CSV is regenerated."""
+    return get_store(CSV)
+
+current_store()  # load at import, as before
+# codes resolved (and terms translated) per chunk of a batch
+BATCH_CHUNK = 1000
+TARGET_COLUMNS = ["AYUSH_Term", "WHO_Code_Candidate", "WHO_Term_Candidate", "Similarity_Score", "Suggested_Relationship"]
+
+# requests only read the translation memory; misses are translated in the background.
+# Both are opened on first use (TRANSLATION_MEMORY_PATH, TRANSLATOR), not on import.
+memory = None
+filler = None
+_open_lock = threading.Lock()
+
+def _translation_memory():
+    """(memory, filler), opening them and queueing the TRANSLATION_PREWARM_LANGS fill on first use."""
+    global memory, filler
+    with _open_lock:
+        if memory is None:
+            memory = TranslationMemory()
+            filler = BackgroundFiller(memory, make_translator())
+            for lang in filter(None, (l.strip() for l in TRANSLATION_PREWARM_LANGS.split(","))):
+                filler.request(memory.missing(who_terms(CSV), lang), lang)
+        return memory, filler
 
 # Optional: manual mapping for AYUSH terms
 MANUAL_AYUSH_MAP = {
@@ -14,55 +40,66 @@ MANUAL_AYUSH_MAP = {
     # add more Sanskrit -> Hindi mappings here
 }
 
-def translate_term(term: str, target_lang: str = "hi") -> str:
+def translate_terms(terms, target_lang: str = "hi") -> dict:
     """
-    Translate a term using Google Translate.
-    Falls back to original if translation fails.
+    term -> translation from the translation memory.
+    Terms not translated yet map to themselves and are queued for background fill.
     """
-    try:
-        return translator.translate(term, dest=target_lang).text
-    except Exception:
-        return term
-
-def clean_term(term: str) -> str:
-    # Remove leading dashes and extra spaces
-    return term.replace("-", "").strip()
+    memory, filler = _translation_memory()
+    found = memory.get_many(terms, target_lang)
+    missing = [t for t in terms if t not in found]
+    if missing:
+        filler.request(missing, target_lang)
+    return {t: found.get(t, t) for t in terms}
 
-def translate_ayush_code(ayush_code: str, target_lang: str = "hi") -> dict:
-    row = df[df["AYUSH_Code"] == ayush_code]
-    if row.empty:
-        return {"AYUSH_Code": ayush_code, "AYUSH_Term": "", "AYUSH_Term_Translated": "", "targets": []}
-
-    ayush_term = row.iloc[0]["AYUSH_Term"]
-    ayush_translated = MANUAL_AYUSH_MAP.get(ayush_term, ayush_term)
-
-    targets = []
-    for _, r in row.iterrows():
-        who_term = r["WHO_Term_Candidate"]
-        # preserve (TM2) tag
-        tag = ""
-        if "(" in who_term and ")" in who_term:
-            parts = who_term.split("(")
-            base_term = parts[0].strip()
-            tag = "(" + parts[1]
-        else:
-            base_term = who_term
+def translate_term(term: str, target_lang: str = "hi") -> str:
+    return translate_terms([term], target_lang)[term]
 
-        base_term_clean = clean_term(base_term)
-        translated_base = translate_term(base_term_clean, target_lang)
-        who_term_translated = f"{translated_base} {tag}".strip()
+def _translate_who_terms(who_terms, target_lang: str) -> dict:
+    # preserve (TM2) tag, only the base term is translated
+    split = {w: split_who_term(w) for w in who_terms}
+    translated = translate_terms(list(dict.fromkeys(base for base, _ in split.values())), target_lang)
+    return {w: f"{translated[base]} {tag}".strip() for w, (base, tag) in split.items()}
 
-        targets.append({
-            "WHO_Code": r["WHO_Code_Candidate"],
-            "WHO_Term": who_term,
-            "WHO_Term_Translated": who_term_translated,
-            "Similarity_Score": r["Similarity_Score"],
-            "Suggested_Relationship": r["Suggested_Relationship"]
-        })
+def translate_ayush_code(ayush_code: str, target_lang: str = "hi") -> dict:
+    return next(translate_ayush_codes([ayush_code], target_lang))
 
-    return {
-        "AYUSH_Code": ayush_code,
-        "AYUSH_Term": ayush_term,
-        "AYUSH_Term_Translated": ayush_translated,
-        "targets": targets
-    }
+def translate_ayush_codes(ayush_codes, target_lang: str = "hi"):
+    """
+    translate_ayush_code for many codes, yielded in request order.
+    Codes are resolved BATCH_CHUNK at a time through the store's code -> row-range
+    index, columns are read once per chunk and the distinct WHO terms of a chunk
+    are looked up in the translation memory together. target_lang=None skips translation.
+    """
+    ayush_codes = list(ayush_codes)
+    store = current_store()  # one CSV version for the whole batch
+    for start in range(0, len(ayush_codes), BATCH_CHUNK):
+        chunk = ayush_codes[start:start + BATCH_CHUNK]
+        row_sets = store.rows_equal_many("AYUSH_Code", chunk)
+        rows = np.concatenate(row_sets) if row_sets else np.zeros(0, dtype=np.int64)
+        cols = {name: store.column(name, rows).tolist() for name in TARGET_COLUMNS}
+        translated = _translate_who_terms(set(cols["WHO_Term_Candidate"]), target_lang) if target_lang else {}
+        pos = 0
+        for ayush_code, code_rows in zip(chunk, row_sets):
+            n = len(code_rows)
+            if n == 0:
+                yield {"AYUSH_Code": ayush_code, "AYUSH_Term": "", "AYUSH_Term_Translated": "", "targets": []}
+                continue
+            ayush_term = cols["AYUSH_Term"][pos]
+            targets = []
+            for i in range(pos, pos + n):
+                who_term = cols["WHO_Term_Candidate"][i]
+                targets.append({
+                    "WHO_Code": cols["WHO_Code_Candidate"][i],
+                    "WHO_Term": who_term,
+                    "WHO_Term_Translated": translated[who_term] if target_lang else None,
+                    "Similarity_Score": str(cols["Similarity_Score"][i]),
+                    "Suggested_Relationship": cols["Suggested_Relationship"][i]
+                })
+            pos += n
+            yield {
+                "AYUSH_Code": ayush_code,
+                "AYUSH_Term": ayush_term,
+                "AYUSH_Term_Translated": MANUAL_AYUSH_MAP.get(ayush_term, ayush_term) if target_lang else None,
+                "targets": targets
+            }
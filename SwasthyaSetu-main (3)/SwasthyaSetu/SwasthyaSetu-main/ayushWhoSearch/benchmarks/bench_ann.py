@@ -0,0 +1,108 @@
+"""
+recall@k vs latency of the IVF index against exact cosine search.
+
+Embeds the shipped datasets with the offline HashingEncoder (the production
+model needs a download): AYUSH terms from the *_processed.csv files, TM2 from
+icd11_tm2_data.csv and the Biomedicine candidates in the mapping CSV. AYUSH
+terms are then used as queries against every system, the way the mapper
+uses them, and each nprobe setting is compared with exact search.
+
+The shipped systems are small enough that exact search is already sub-ms;
+--synthetic N adds N clustered 768-d vectors to show the full ICD-11 MMS scale
+the index is meant for.
+
+Run from the ayushWhoSearch directory:
+    python -m benchmarks.bench_ann --queries 200 --k 10 --synthetic 40000
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from ann_index import IVFIndex
+from embedding_index import EmbeddingIndex, HashingEncoder, ann_path, build_ann, normalize, save_embeddings
+
+
+def load_datasets():
+    ayush = pd.concat([
+        pd.read_csv("ayurveda_processed.csv", dtype=str)[["NAMC_CODE", "NAMC_term"]].set_axis(["code", "term"], axis=1),
+        pd.read_csv("siddha_processed.csv", dtype=str)[["NAMC_CODE", "NAMC_TERM"]].set_axis(["code", "term"], axis=1),
+        pd.read_csv("unani_processed.csv", dtype=str)[["NUMC_CODE", "NUMC_TERM"]].set_axis(["code", "term"], axis=1),
+    ]).dropna().drop_duplicates("term")
+    tm2 = pd.read_csv("icd11_tm2_data.csv", dtype=str)[["Code", "Title"]].set_axis(["code", "term"], axis=1).dropna()
+    mappings = pd.read_csv("data/candidate_mappings_semantic_v2.csv", dtype=str).fillna("")
+    biomed = (mappings[mappings["Target_System"] == "Biomedicine"][["WHO_Code_Candidate", "WHO_Term_Candidate"]]
+              .set_axis(["code", "term"], axis=1).drop_duplicates("code"))
+    return {"AYUSH": ayush, "TM2": tm2, "Biomedicine": biomed}
+
+
+def synthetic(rows, dim=768, clusters=400, seed=0):
+    """Unit vectors scattered around random topic centres, plus a query sampler with the same spread."""
+    rng = np.random.default_rng(seed)
+    centres = normalize(rng.standard_normal((clusters, dim)))
+    sample = lambda n: normalize(centres[rng.integers(0, clusters, n)] + 3 * rng.standard_normal((n, dim)) / np.sqrt(dim))
+    return sample(rows), sample
+
+
+def p50_ms(samples):
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--nlist-factor", type=float, default=None, help="nlist = factor * sqrt(rows)")
+    parser.add_argument("--synthetic", type=int, default=0, help="also benchmark N synthetic 768-d vectors")
+    args = parser.parse_args()
+
+    encoder = HashingEncoder(args.dim)
+    datasets = {system: (frame["code"].tolist(), frame["term"].tolist(), encoder.encode(frame["term"].tolist()))
+                for system, frame in load_datasets().items()}
+    rng = np.random.default_rng(0)
+    ayush_terms = np.array(datasets["AYUSH"][1], dtype=object)
+    queries = {system: encoder.encode(rng.choice(ayush_terms, args.queries, replace=False).tolist()) for system in datasets}
+    if args.synthetic:
+        vectors, sample = synthetic(args.synthetic)
+        labels = [f"S{i}" for i in range(args.synthetic)]
+        datasets["Synthetic"] = (labels, labels, vectors)
+        queries["Synthetic"] = sample(args.queries)
+
+    folder = tempfile.mkdtemp(prefix="ann-bench-")
+    for system, (codes, terms, vectors) in datasets.items():
+        # one manifest per model: the synthetic set is registered under the encoder's name too
+        save_embeddings(folder, system, codes, terms, vectors, encoder.name)
+        started = time.perf_counter()
+        nlist = int(args.nlist_factor * np.sqrt(len(codes))) if args.nlist_factor else None
+        stats = build_ann(folder, system, nlist)
+        print(f"{system:12s} {len(codes):6d} rows  nlist={stats['nlist']:4d}  build {time.perf_counter() - started:.2f}s")
+
+    index = EmbeddingIndex(folder)
+    for system in index.systems:
+        # benchmark every system, including those below ANN_MIN_ROWS that the service searches exactly
+        ann = IVFIndex.load(ann_path(folder, index.files[system]))
+        exact, exact_times = [], []
+        for q in queries[system]:
+            started = time.perf_counter()
+            scores = index.scores(system, q)
+            exact.append(set(np.argpartition(-scores, args.k - 1)[:args.k].tolist()))
+            exact_times.append(time.perf_counter() - started)
+        print(f"\n{system}: exact p50={p50_ms(exact_times):.2f} ms")
+        for nprobe in (1, 2, 4, 8, 16, 32, 64):
+            if nprobe > ann.nlist:
+                break
+            recalls, times = [], []
+            for q, truth in zip(queries[system], exact):
+                started = time.perf_counter()
+                rows, _ = ann.search(index.matrices[system], q, args.k, nprobe)
+                times.append(time.perf_counter() - started)
+                recalls.append(len(truth & set(rows.tolist())) / len(truth))
+            print(f"  nprobe={nprobe:3d}  recall@{args.k}={statistics.mean(recalls):.3f}  p50={p50_ms(times):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Build time and serialized size of the ConceptMap elements: one element per
+CSV row (the original iterrows builder) vs one grouped element per AYUSH code.
+
+Run from the ayushWhoSearch directory:
+    python -m benchmarks.bench_conceptmap --csv data/candidate_mappings_semantic_v2.csv --runs 5
+"""
+import argparse
+import json
+import statistics
+import time
+
+import pandas as pd
+
+import generate_fhir
+
+
+def legacy_elements(path):
+    """Pre-grouping implementation, kept here only as the benchmark baseline."""
+    elements = []
+    df = pd.read_csv(path, dtype=str).fillna("")
+    for _, row in df.iterrows():
+        ayush_code = row.get("AYUSH_Code", "").strip()
+        who_code = row.get("WHO_Code_Candidate", "").strip()
+        who_term = row.get("WHO_Term_Candidate", "").strip()
+        relationship = row.get("Suggested_Relationship", "related-to").strip()
+        if not ayush_code or not who_code:
+            continue
+        elements.append({"code": ayush_code,
+                         "target": [{"code": who_code, "display": who_term, "equivalence": relationship}]})
+    return elements
+
+
+def grouped_elements(path):
+    generate_fhir.AI_MAPPINGS_CSV = path
+    return [element for _, element in generate_fhir._read_mapping_groups()]
+
+
+def measure(name, build, path, runs):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        elements = build(path)
+        times.append(time.perf_counter() - started)
+    compact = len(json.dumps(elements, separators=(",", ":")))
+    pretty = len(json.dumps(elements, indent=4))
+    targets = sum(len(el["target"]) for el in elements)
+    print(f"{name:8s} {len(elements):6d} elements  {targets:6d} targets  build p50={statistics.median(times) * 1000:7.1f} ms  "
+          f"compact={compact / 2**20:5.2f} MB  indent=4: {pretty / 2**20:5.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", default=generate_fhir.AI_MAPPINGS_CSV)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    measure("per-row", legacy_elements, args.csv, args.runs)
+    measure("grouped", grouped_elements, args.csv, args.runs)
+
+
+if __name__ == "__main__":
+    main()
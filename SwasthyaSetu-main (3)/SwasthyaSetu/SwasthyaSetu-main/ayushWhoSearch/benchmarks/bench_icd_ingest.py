@@ -0,0 +1,75 @@
+"""
+Rows/second writing WHO search entities into icd_entities: the old per-entity
+SELECT + INSERT + COMMIT loop of sync_terms_to_db vs the batched
+IcdEntityWriter upsert.
+
+Runs against a fresh SQLite file by default; pass a PostgreSQL URL to
+measure there (the icd_entities table is dropped and recreated). Name the
+psycopg2 driver: SQLAlchemy 2.1 maps a bare postgresql:// to psycopg 3,
+which is not in requirements.txt.
+    python -m benchmarks.bench_icd_ingest --rows 20000
+    python -m benchmarks.bench_icd_ingest --url postgresql+psycopg2://user:pw@localhost/bench --rows 20000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from app_.database import Base
+from app_.icd_ingest import INGEST_BATCH_SIZE, IcdEntityWriter, entity_row
+from app_.models import IcdEntity
+
+
+def entities(n, offset=0):
+    return [{"id": f"http://id.who.int/icd/entity/{i}", "title": {"@value": f"Entity {i}"}, "code": f"X{i}",
+             "definition": "synthetic entity " * 4} for i in range(offset, offset + n)]
+
+
+def legacy(engine, rows):
+    """The pre-batching loop, kept here only as the benchmark baseline."""
+    db = sessionmaker(bind=engine)()
+    for row in rows:
+        existing = db.query(IcdEntity).filter(IcdEntity.icd_uri == row["icd_uri"]).first()
+        if not existing:
+            db.add(IcdEntity(**row))
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+    db.close()
+
+
+def batched(engine, rows, batch_size):
+    with IcdEntityWriter(engine, batch_size) as writer:
+        writer.add_many(rows)
+
+
+def timed(label, fn, engine, rows):
+    Base.metadata.drop_all(engine, tables=[IcdEntity.__table__])
+    Base.metadata.create_all(engine, tables=[IcdEntity.__table__])
+    started = time.perf_counter()
+    fn(engine, rows)
+    elapsed = time.perf_counter() - started
+    print(f"  {label:28s} {elapsed:7.2f} s  {len(rows) / elapsed:9.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    args = parser.parse_args()
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='icd-ingest-'), 'bench.db')}"
+    engine = create_engine(url)
+    rows = [entity_row(e, "bench") for e in entities(args.rows)]
+    print(f"{engine.dialect.name}: {args.rows} entities")
+    timed("per-row query + commit", legacy, engine, rows)
+    timed(f"batched upsert ({args.batch_size}/batch)", lambda e, r: batched(e, r, args.batch_size), engine, rows)
+
+
+if __name__ == "__main__":
+    main()
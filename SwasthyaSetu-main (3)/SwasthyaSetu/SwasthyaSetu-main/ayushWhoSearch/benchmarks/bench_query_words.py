@@ -0,0 +1,65 @@
+"""
+Latency of multi-word fuzzy search as the number of query words grows.
+
+"before" is the original loop used by /search/{term} (two Series.apply passes
+per word); "after" is query_planner.fuzzy_mask. Both must return the same mask.
+
+Run from the ayushWhoSearch directory:
+    python -m benchmarks.bench_query_words --runs 5
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz
+
+from ngram_index import IndexedColumn
+from query_planner import fuzzy_mask
+
+CSV_PATH = "candidate_mappings_semantic_v2.csv"
+WORDS = ["chronic", "fever", "with", "cough", "and", "headache"]
+
+
+def legacy_mask(df, term, threshold):
+    def fuzzy_match(word, candidates):
+        return candidates.apply(lambda x: fuzz.partial_ratio(str(x).lower(), word.lower()) >= threshold)
+    mask = pd.Series(False, index=df.index)
+    for word in term.lower().split():
+        mask |= fuzzy_match(word, df["AYUSH_Term_lower"])
+        mask |= fuzzy_match(word, df["WHO_Term_lower"])
+    return mask.to_numpy()
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--threshold", type=int, default=80)
+    args = parser.parse_args()
+
+    df = pd.read_csv(CSV_PATH)
+    df["AYUSH_Term_lower"] = df["AYUSH_Term"].str.lower()
+    df["WHO_Term_lower"] = df["WHO_Term_Candidate"].str.lower()
+    columns = (IndexedColumn(df["AYUSH_Term_lower"]), IndexedColumn(df["WHO_Term_lower"]))
+
+    print(f"{'words':>5} {'before (ms)':>12} {'after (ms)':>11}")
+    for n in range(1, len(WORDS) + 1):
+        term = " ".join(WORDS[:n])
+        before = legacy_mask(df, term, args.threshold)
+        assert (before == fuzzy_mask(term, columns, args.threshold)).all(), f"mask mismatch for {term!r}"
+        t_before = timed(lambda: legacy_mask(df, term, args.threshold), 1)
+        t_after = timed(lambda: fuzzy_mask(term, columns, args.threshold), args.runs)
+        print(f"{n:>5} {t_before:>12.1f} {t_after:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
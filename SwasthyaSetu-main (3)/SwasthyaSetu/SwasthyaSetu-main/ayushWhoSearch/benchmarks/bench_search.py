@@ -0,0 +1,96 @@
+"""
+Latency benchmark for search_utils.fuzzy_search_with_explain.
+
+Compares the original row-by-row implementation (iterrows + two partial_ratio
+calls per row) with the batched scorer and reports p50/p99 per query.
+
+Run from the ayushWhoSearch directory:
+    python -m benchmarks.bench_search --runs 20
+"""
+import argparse
+import statistics
+import time
+
+import pandas as pd
+from rapidfuzz import fuzz
+
+import search_utils
+from search_utils import CSV, get_confidence_label
+
+QUERIES = ["fever", "jvara", "cough", "diabetes", "headache", "vata", "pitta constitution", "amavata", "insomnia", "kasa"]
+
+
+df = pd.read_csv(CSV, dtype=str).fillna("")
+df["AYUSH_Term_lower"] = df["AYUSH_Term"].str.lower()
+df["WHO_Term_lower"] = df["WHO_Term_Candidate"].str.lower()
+df["Similarity_Score"] = pd.to_numeric(df.get("Similarity_Score", 0), errors="coerce").fillna(0)
+
+
+def legacy_search(query, top_k=20, min_similarity=0.5):
+    """Pre-vectorization implementation, kept here only as the benchmark baseline."""
+    q = query.lower()
+    results = []
+    for i, row in df.iterrows():
+        score_fuzzy_ayush = fuzz.partial_ratio(q, row["AYUSH_Term_lower"])/100
+        score_fuzzy_who = fuzz.partial_ratio(q, row["WHO_Term_lower"])/100
+        sim = float(row.get("Similarity_Score", 0))
+        combined = max(score_fuzzy_ayush, score_fuzzy_who) * 0.6 + sim * 0.4
+        if combined >= min_similarity:
+            results.append({
+                "AYUSH_Code": row.get("AYUSH_Code"),
+                "AYUSH_Term": row.get("AYUSH_Term"),
+                "WHO_Code": row.get("WHO_Code_Candidate"),
+                "WHO_Term": row.get("WHO_Term_Candidate"),
+                "similarity": sim,
+                "fuzzy_ayush": score_fuzzy_ayush,
+                "fuzzy_who": score_fuzzy_who,
+                "combined": combined,
+                "confidence": get_confidence_label(combined),
+                "relationship": row.get("Suggested_Relationship"),
+                "explain": {"fuzzy_ayush": score_fuzzy_ayush, "fuzzy_who": score_fuzzy_who, "semantic": sim}
+            })
+    return sorted(results, key=lambda x: x["combined"], reverse=True)[:top_k]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def measure(fn, runs):
+    samples = []
+    for _ in range(runs):
+        for q in QUERIES:
+            t0 = time.perf_counter()
+            fn(q)
+            samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def report(name, samples):
+    if not samples:
+        return
+    print(f"{name:<12} n={len(samples):<5} p50={percentile(samples, 50):8.2f} ms  "
+          f"p99={percentile(samples, 99):8.2f} ms  mean={statistics.mean(samples):8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--legacy-runs", type=int, default=1)
+    args = parser.parse_args()
+
+    for q in QUERIES:
+        assert legacy_search(q) == search_utils.fuzzy_search_with_explain(q), f"result mismatch for {q!r}"
+    print(f"✅ identical results for {len(QUERIES)} queries over {len(df)} rows")
+    store = search_utils.current_store()
+    unique_terms = len(store.ayush.dictionary) + len(store.who.dictionary)
+    print(f"fuzzy comparisons per query (max): {2 * len(df)} rows -> {unique_terms} unique terms")
+
+    report("before", measure(legacy_search, args.legacy_runs))
+    report("after", measure(search_utils.fuzzy_search_with_explain, args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Cold-start and per-worker memory of loading the mapping store from CSV vs snapshot.
+
+Starts --workers fresh interpreters at once for each mode (like uvicorn
+--workers N), each loading the store and then idling. Reports the load time
+reported by each worker plus RSS and PSS from /proc (PSS splits shared pages
+between the processes mapping them, so it shows what mmap sharing saves).
+
+Run from the ayushWhoSearch directory after `python -m mapping_snapshot`:
+    python -m benchmarks.bench_store_load --workers 4
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from mapping_snapshot import read_manifest, snapshot_path
+
+CSV = "./data/candidate_mappings_semantic_v2.csv"
+
+WORKER = """
+import json, sys, time
+started = time.perf_counter()
+from mapping_store import get_store
+store = get_store(sys.argv[1])
+print(json.dumps({"cold_start": time.perf_counter() - started, "load": store.load_seconds,
+                  "source": store.source}), flush=True)
+sys.stdin.read()
+"""
+
+
+def _memory_kb(pid):
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Shared_Clean:"):
+                values[parts[0][:-1]] = int(parts[1])
+    return values
+
+
+def run(mode, workers, csv_path):
+    env = dict(os.environ, MAPPING_SNAPSHOT="1" if mode == "snapshot" else "0")
+    procs = [subprocess.Popen([sys.executable, "-c", WORKER, csv_path], stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE, text=True, env=env) for _ in range(workers)]
+    try:
+        reports = [json.loads(p.stdout.readline()) for p in procs]
+        memory = [_memory_kb(p.pid) for p in procs]
+    finally:
+        for p in procs:
+            p.stdin.close()
+            p.wait()
+    assert all(r["source"] == mode for r in reports), f"{mode}: workers loaded {reports}"
+    mb = lambda key: statistics.mean(m[key] for m in memory) / 1024
+    print(f"{mode:9s} cold start p50={statistics.median(r['cold_start'] for r in reports) * 1000:7.1f} ms  "
+          f"store load p50={statistics.median(r['load'] for r in reports) * 1000:7.1f} ms  "
+          f"RSS={mb('Rss'):6.1f} MB  PSS={mb('Pss'):6.1f} MB  shared={mb('Shared_Clean'):6.1f} MB per worker")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--csv", default=CSV)
+    args = parser.parse_args()
+    if read_manifest(snapshot_path(args.csv)) is None:
+        sys.exit(f"no snapshot for {args.csv}; run `python -m mapping_snapshot {args.csv}` first")
+    print(f"{args.workers} concurrent workers, {args.csv}")
+    for mode in ("csv", "snapshot"):
+        run(mode, args.workers, args.csv)
+
+
+if __name__ == "__main__":
+    main()
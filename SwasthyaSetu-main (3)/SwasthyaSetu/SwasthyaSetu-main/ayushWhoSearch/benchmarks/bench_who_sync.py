@@ -0,0 +1,48 @@
+"""
+Wall time of a WHO search sync against the mock WHO server with simulated latency:
+the old sequential walk (one request at a time plus the fixed 0.15 s sleep per
+page) vs who_sync with bounded concurrency under the token bucket.
+
+The mock runs in-process (httpx.ASGITransport), so only the simulated
+latency is measured, not real network or server time.
+
+Run from the ayushWhoSearch directory:
+    python -m benchmarks.bench_who_sync --terms 200 --latency 0.2 --rate 40 --concurrency 16
+"""
+import argparse
+import time
+
+import httpx
+
+from tests.mock_who_server import make_app
+from who_sync import run_sync
+
+OLD_PAGE_SLEEP = 0.15
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--terms", type=int, default=200)
+    parser.add_argument("--entities", type=int, default=120, help="results per term (pages of 50)")
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated seconds per WHO request")
+    parser.add_argument("--rate", type=float, default=40, help="token bucket requests/s")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    terms = [f"term{i}" for i in range(args.terms)]
+    pages = args.terms * -(-args.entities // 50)
+    # the old loop is strictly sequential: latency + sleep for every page but the last of each term
+    old = pages * args.latency + (pages - args.terms) * OLD_PAGE_SLEEP
+    print(f"{args.terms} terms, {pages} pages, {args.latency * 1000:.0f} ms per request")
+    print(f"  sequential (computed)       {old:8.1f} s")
+
+    started = time.perf_counter()
+    stats = run_sync(terms, base="http://who.test", rate=args.rate, burst=args.concurrency,
+                     concurrency=args.concurrency, transport=httpx.ASGITransport(make_app(args.entities, args.latency)))
+    elapsed = time.perf_counter() - started
+    print(f"  who_sync c={args.concurrency:<3d} rate={args.rate:<5g} {elapsed:8.1f} s  "
+          f"({stats['pages'] / elapsed:.1f} pages/s, {stats['requests']} requests)")
+
+
+if __name__ == "__main__":
+    main()
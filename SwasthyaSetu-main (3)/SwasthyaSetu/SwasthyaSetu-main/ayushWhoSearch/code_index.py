@@ -0,0 +1,174 @@
+"""
+In-memory index of the NAMASTE CodeSystem for the FHIR $lookup and $expand operations.
+
+Built from the resource fhir_cache already holds and rebuilt whenever that
+file changes:
+
+- a code -> position dict, so $lookup is one dict probe;
+- a sorted array of lower-cased words (display words and the code itself),
+  bisected for word-prefix filters;
+- trigram postings over code + display, intersected and then verified for
+  substring filters of 3+ characters.
+
+The position list a filter matches is kept in a small LRU, so every page of
+an $expand after the first is a slice of size `count`.
+"""
+import os
+import re
+import threading
+import uuid
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+
+from fhir_cache import codesystem
+
+EXPAND_DEFAULT_COUNT = int(os.getenv("FHIR_EXPAND_COUNT", "50"))
+EXPAND_MAX_COUNT = int(os.getenv("FHIR_EXPAND_MAX_COUNT", "1000"))
+FILTER_CACHE_SIZE = 256
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _flatten(concepts):
+    for concept in concepts:
+        yield concept
+        yield from _flatten(concept.get("concept", ()))
+
+
+class CodeIndex:
+    def __init__(self, resource):
+        self.resource = resource
+        self.url = resource.get("url")
+        self.version = resource.get("version")
+        self.concepts = list(_flatten(resource.get("concept", [])))
+        self.by_code = {c.get("code"): i for i, c in enumerate(self.concepts)}
+        self.texts = [f"{c.get('code', '')}\x00{c.get('display', '')}".lower() for c in self.concepts]
+
+        words = []
+        grams = {}
+        for pos, text in enumerate(self.texts):
+            code, _, display = text.partition("\x00")
+            words.extend((w, pos) for w in {code, *_WORD.findall(display)})
+            for g in _trigrams(text):
+                grams.setdefault(g, []).append(pos)
+        words.sort()
+        self.words = [w for w, _ in words]
+        self.word_positions = np.fromiter((p for _, p in words), dtype=np.int32, count=len(words))
+        self.grams = {g: np.asarray(p, dtype=np.int32) for g, p in grams.items()}
+        self._matches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.concepts)
+
+    def lookup(self, code):
+        pos = self.by_code.get(code)
+        return None if pos is None else self.concepts[pos]
+
+    def _prefix(self, text):
+        lo = bisect_left(self.words, text)
+        hi = bisect_left(self.words, text + "\U0010ffff", lo)
+        return np.unique(self.word_positions[lo:hi])
+
+    def _substring(self, text):
+        if len(text) < 3:
+            return np.zeros(0, dtype=np.int32)
+        postings = sorted((self.grams.get(g) for g in _trigrams(text)), key=lambda p: 0 if p is None else len(p))
+        if postings[0] is None:
+            return np.zeros(0, dtype=np.int32)
+        candidates = postings[0]
+        for p in postings[1:]:
+            candidates = np.intersect1d(candidates, p, assume_unique=True)
+        return np.asarray([i for i in candidates.tolist() if text in self.texts[i]], dtype=np.int32)
+
+    def matches(self, text):
+        """Positions matching a filter: word-prefix matches first, then other substring matches.
+
+        None means no filter (every concept, in CodeSystem order).
+        """
+        text = " ".join(text.lower().split()) if text else ""
+        if not text:
+            return None
+        with self._lock:
+            found = self._matches.get(text)
+            if found is not None:
+                self._matches.move_to_end(text)
+                return found
+        prefix = self._prefix(text)
+        found = np.concatenate([prefix, np.setdiff1d(self._substring(text), prefix, assume_unique=True)])
+        with self._lock:
+            self._matches[text] = found
+            while len(self._matches) > FILTER_CACHE_SIZE:
+                self._matches.popitem(last=False)
+        return found
+
+    def page(self, text, offset, count):
+        """(total, concepts) for one page of the matches of a filter."""
+        found = self.matches(text)
+        if found is None:
+            return len(self.concepts), self.concepts[offset:offset + count]
+        return len(found), [self.concepts[i] for i in found[offset:offset + count].tolist()]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The CodeIndex of the current CodeSystem file, or None when it has not been generated."""
+    global _index
+    resource = codesystem.get()
+    if resource is None:
+        return None
+    with _index_lock:
+        if _index is None or _index.resource is not resource:
+            _index = CodeIndex(resource)
+        return _index
+
+
+def lookup_parameters(index, concept) -> dict:
+    """FHIR Parameters for a CodeSystem $lookup result."""
+    params = [{"name": "name", "valueString": index.resource.get("name", "")}]
+    if index.version:
+        params.append({"name": "version", "valueString": index.version})
+    params.append({"name": "display", "valueString": concept.get("display", "")})
+    for designation in concept.get("designation", []):
+        part = [{"name": "value", "valueString": designation.get("value", "")}]
+        if designation.get("language"):
+            part.insert(0, {"name": "language", "valueCode": designation["language"]})
+        params.append({"name": "designation", "part": part})
+    if concept.get("definition"):
+        params.append({"name": "property", "part": [{"name": "code", "valueCode": "definition"},
+                                                    {"name": "value", "valueString": concept["definition"]}]})
+    return {"resourceType": "Parameters", "parameter": params}
+
+
+def expansion(index, text=None, offset=0, count=EXPAND_DEFAULT_COUNT) -> dict:
+    """FHIR ValueSet with one page of the expansion of the whole CodeSystem (optionally filtered)."""
+    count = min(count, EXPAND_MAX_COUNT)
+    total, concepts = index.page(text, offset, count)
+    parameter = [{"name": "offset", "valueInteger": offset}, {"name": "count", "valueInteger": count}]
+    if text:
+        parameter.insert(0, {"name": "filter", "valueString": text})
+    return {
+        "resourceType": "ValueSet",
+        "url": f"{index.url}?vs",
+        "status": index.resource.get("status", "active"),
+        "compose": {"include": [{"system": index.url}]},
+        "expansion": {
+            "identifier": f"urn:uuid:{uuid.uuid4()}",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "total": total,
+            "offset": offset,
+            "parameter": parameter,
+            "contains": [{"system": index.url, "version": index.version, "code": c.get("code"),
+                          "display": c.get("display")} for c in concepts],
+        },
+    }
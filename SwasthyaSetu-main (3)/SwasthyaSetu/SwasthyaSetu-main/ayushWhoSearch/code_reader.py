@@ -0,0 +1,150 @@
+"""
+Streaming readers for the code tables behind generate_mappings.py.
+
+Rows are read through a server-side (named) cursor in FETCH_ITERSIZE batches
+over one pooled connection, and go straight into compact columns: every
+column is a single UTF-8 buffer plus an offsets array, instead of one dict
+and several str objects per row. Memory stays flat in the row count
+apart from the text itself, even for the full ICD-11 biomedicine chapter.
+
+DATABASE_URL may also be sqlite:///path.db (same tables and queries), which
+is what the tests use.
+"""
+import itertools
+import os
+import sqlite3
+import threading
+from array import array
+from contextlib import contextmanager
+
+import numpy as np
+
+FETCH_ITERSIZE = int(os.getenv("FETCH_ITERSIZE", "5000"))
+
+# system -> (query, table, title column, column appended to the title in the embedded text)
+CODE_TABLES = {
+    "AYUSH": ("SELECT code, display, definition FROM codes", "codes", "display", "definition"),
+    "TM2": ("SELECT code, title, index_terms FROM who_tm2_codes", "who_tm2_codes", "title", "index_terms"),
+    "Biomedicine": ("SELECT code, title, definition FROM biomedicine_codes", "biomedicine_codes", "title", "definition"),
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+_cursor_ids = itertools.count()
+
+
+class StringColumn:
+    """Immutable list of strings stored as one UTF-8 buffer and int64 offsets."""
+
+    def __init__(self, buffer, offsets: np.ndarray):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def tolist(self) -> list:
+        return list(self)
+
+    def memory_bytes(self) -> int:
+        return len(self.buffer) + self.offsets.nbytes
+
+
+class _ColumnBuilder:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offsets = array("q", [0])
+
+    def append(self, value: str):
+        self.buffer += value.encode("utf-8")
+        self.offsets.append(len(self.buffer))
+
+    def build(self) -> StringColumn:
+        # no copies: the column keeps the builder's buffers
+        return StringColumn(self.buffer, np.frombuffer(self.offsets, dtype=np.int64))
+
+
+class CodeTable:
+    """Code, title and embedding text of every row of one code system."""
+
+    def __init__(self, system, codes: StringColumn, titles: StringColumn, texts: StringColumn):
+        self.system = system
+        self.codes = codes
+        self.titles = titles
+        self.texts = texts
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def from_rows(cls, system, rows):
+        """Build from an iterable of (code, title, extra) tuples, one row at a time."""
+        codes, titles, texts = _ColumnBuilder(), _ColumnBuilder(), _ColumnBuilder()
+        for code, title, extra in rows:
+            codes.append(str(code))
+            titles.append(title if title is not None else "")
+            texts.append(f"{title}. {extra or ''}")
+        return cls(system, codes.build(), titles.build(), texts.build())
+
+    def memory_bytes(self) -> int:
+        return self.codes.memory_bytes() + self.titles.memory_bytes() + self.texts.memory_bytes()
+
+
+def _pool(url):
+    with _pools_lock:
+        if url not in _pools:
+            from psycopg2.pool import ThreadedConnectionPool
+            _pools[url] = ThreadedConnectionPool(1, 1, url)
+        return _pools[url]
+
+
+@contextmanager
+def connection(url):
+    """A connection from the pool of `url` (PostgreSQL) or a fresh SQLite connection."""
+    if url.startswith("sqlite:///"):
+        conn = sqlite3.connect(url[len("sqlite:///"):])
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+    pool = _pool(url)
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        conn.rollback()  # ends the read transaction the named cursors ran in
+        pool.putconn(conn)
+
+
+def stream_rows(conn, query, itersize=FETCH_ITERSIZE):
+    """Rows of `query`, fetched from the server itersize at a time."""
+    if isinstance(conn, sqlite3.Connection):
+        cursor = conn.cursor()
+    else:
+        # a named cursor is a server-side cursor: the result set stays on the server
+        cursor = conn.cursor(name=f"stream_{next(_cursor_ids)}")
+        cursor.itersize = itersize
+    try:
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(itersize)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def read_code_table(conn, system, itersize=FETCH_ITERSIZE) -> CodeTable:
+    query = CODE_TABLES[system][0]
+    return CodeTable.from_rows(system, stream_rows(conn, query, itersize))
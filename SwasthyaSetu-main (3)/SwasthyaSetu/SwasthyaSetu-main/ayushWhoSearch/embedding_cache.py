@@ -0,0 +1,93 @@
+"""
+Persistent embedding cache so generate_mappings.py only encodes new or changed texts.
+
+Vectors are stored in a local SQLite file keyed by (model name, sha1 of the
+text) as the float32 bytes the encoder returned, so a hit is bit-identical to
+re-encoding. CachedEncoder wraps any encoder (see embedding_index) and counts
+hits and misses per encode() call. Both are safe to share between threads.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from embedding_index import EMBEDDINGS_DIR
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(EMBEDDINGS_DIR, "encode_cache.sqlite"))
+# SQLite's default limit on host parameters per statement is 999
+_LOOKUP_BATCH = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings "
+                              "(model TEXT, hash TEXT, vector BLOB, PRIMARY KEY (model, hash))")
+
+    def get_many(self, model, hashes) -> dict:
+        """hash -> float32 vector for every hash already cached for this model."""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), _LOOKUP_BATCH):
+            batch = unique[start:start + _LOOKUP_BATCH]
+            with self._lock:
+                rows = self.conn.execute(f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN "
+                                         f"({','.join('?' * len(batch))})", [model, *batch]).fetchall()
+            found.update((h, np.frombuffer(blob, dtype=np.float32)) for h, blob in rows)
+        return found
+
+    def put_many(self, model, hashes, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                                  ((model, h, v.tobytes()) for h, v in zip(hashes, vectors)))
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class CachedEncoder:
+    """Encoder wrapper that only sends cache misses to the wrapped model."""
+
+    def __init__(self, encoder, cache: EmbeddingCache):
+        self.encoder = encoder
+        self.cache = cache
+        self.name = encoder.name
+        self.last_stats = {"texts": 0, "hits": 0, "misses": 0}
+
+    def encode(self, texts, show_progress_bar=False) -> np.ndarray:
+        vectors, self.last_stats = self.encode_counted(texts, show_progress_bar)
+        return vectors
+
+    def encode_counted(self, texts, show_progress_bar=False):
+        """(vectors, {"texts", "hits", "misses"}) for one call."""
+        texts = list(texts)
+        hashes = [text_hash(t) for t in texts]
+        found = self.cache.get_many(self.name, hashes)
+        missing = list(dict.fromkeys(h for h in hashes if h not in found))
+        hits = len(texts) - sum(h not in found for h in hashes)
+        if missing:
+            text_of = dict(zip(hashes, texts))
+            vectors = self.encoder.encode([text_of[h] for h in missing], show_progress_bar=show_progress_bar)
+            vectors = np.asarray(vectors, dtype=np.float32)
+            self.cache.put_many(self.name, missing, vectors)
+            found.update(zip(missing, vectors))
+        stats = {"texts": len(texts), "hits": hits, "misses": len(texts) - hits}
+        if not texts:
+            return np.asarray(self.encoder.encode([]), dtype=np.float32), stats
+        return np.stack([found[h] for h in hashes]), stats
@@ -0,0 +1,319 @@
+"""
+Precomputed term embeddings for vector search over AYUSH, TM2 and Biomedicine codes.
+
+generate_mappings.py saves one L2-normalized float16 matrix per code system
+(embeddings/<system>.npy) plus the code/term of every row
+(embeddings/<system>.codes.json) and a manifest naming the model. The search
+service memory-maps the matrices and ranks rows by dot product, which is the
+cosine similarity since every row is unit length.
+
+The query must be embedded by the same model that produced the matrices, so
+encoders are pluggable: SentenceTransformerEncoder for the real model and
+HashingEncoder, a small deterministic character-trigram model that needs no
+download, for tests and offline demos.
+"""
+import hashlib
+import json
+import os
+import threading
+import zlib
+
+import numpy as np
+
+from ann_index import ANN_NPROBE, IVFIndex, row_hashes
+from search_cache import data_version, search_cache
+
+EMBEDDINGS_DIR = os.getenv("EMBEDDINGS_DIR", "embeddings")
+SYSTEM_FILES = {"AYUSH": "ayush", "TM2": "tm2", "Biomedicine": "biomedicine"}
+# float16 -> float32 conversion dominates a streamed scan, so by default each
+# matrix is upcast once and kept resident; EMBEDDINGS_RESIDENT=0 scans the
+# float16 mmap in CHUNK_ROWS blocks instead (half the memory, ~8x slower)
+EMBEDDINGS_RESIDENT = os.getenv("EMBEDDINGS_RESIDENT", "1") != "0"
+CHUNK_ROWS = 16384
+# systems with at least this many rows are searched through their IVF index (see ann_index)
+# (below ~20k rows exact search is already about a millisecond, see benchmarks/bench_ann.py)
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "20000"))
+USE_ANN = os.getenv("SEMANTIC_ANN", "1") != "0"
+
+
+def normalize(vectors) -> np.ndarray:
+    """Rows scaled to unit length as float32 (all-zero rows stay zero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class HashingEncoder:
+    """Deterministic bag of hashed character trigrams; no model download, stable across runs."""
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _vector(self, text):
+        vec = np.zeros(self.dim, dtype=np.float32)
+        padded = f" {text.lower()} "
+        for i in range(len(padded) - 2):
+            h = zlib.crc32(padded[i:i + 3].encode("utf-8"))
+            vec[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return vec
+
+    def encode(self, texts, show_progress_bar=False) -> np.ndarray:
+        return normalize(np.stack([self._vector(t) for t in texts])) if texts else np.zeros((0, self.dim), np.float32)
+
+
+class SentenceTransformerEncoder:
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer  # heavy, only loaded when used
+        self.name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts, show_progress_bar=False) -> np.ndarray:
+        return normalize(self.model.encode(list(texts), show_progress_bar=show_progress_bar))
+
+
+def load_encoder(name: str):
+    if name.startswith("hashing"):
+        dim = name.partition("-")[2]
+        return HashingEncoder(int(dim)) if dim else HashingEncoder()
+    return SentenceTransformerEncoder(name)
+
+
+class EncoderMismatch(LookupError):
+    """The query encoder is not the model the embeddings were made with (served as 503, like missing embeddings)."""
+
+
+def _read_manifest(folder):
+    try:
+        with open(os.path.join(folder, "manifest.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"model": None, "systems": {}}
+
+
+def top_k_blocks(queries, targets, k, row_chunk=128, col_chunk=16384):
+    """Yield (start, indices, scores) for each block of query rows: the k most similar targets, best first.
+
+    Both inputs must be unit-normalized. Scores are float32 dot products computed
+    one row_chunk x col_chunk tile at a time and merged into a running top-k,
+    so peak memory depends on the chunk sizes, not on len(queries) * len(targets).
+    Equal scores within the top k are ordered by descending target index, like argsort()[-k:][::-1].
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    targets = np.asarray(targets, dtype=np.float32)
+    k = min(k, len(targets))
+    for start in range(0, len(queries), row_chunk):
+        block = queries[start:start + row_chunk]
+        best_idx = np.zeros((len(block), 0), dtype=np.int64)
+        best_scores = np.zeros((len(block), 0), dtype=np.float32)
+        for col in range(0, len(targets) if k else 0, col_chunk):
+            # negated in place: argpartition then selects the largest scores without another tile copy
+            tile = block @ targets[col:col + col_chunk].T
+            np.negative(tile, out=tile)
+            kk = min(k, tile.shape[1])
+            part = np.argpartition(tile, kk - 1, axis=1)[:, :kk]
+            best_idx = np.concatenate([best_idx, part + col], axis=1)
+            best_scores = np.concatenate([best_scores, -np.take_along_axis(tile, part, axis=1)], axis=1)
+            if best_idx.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_idx = np.take_along_axis(best_idx, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        order = np.lexsort((-best_idx, -best_scores), axis=-1)
+        yield start, np.take_along_axis(best_idx, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def ann_path(folder, file):
+    return os.path.join(folder, file + ".ivf.npz")
+
+
+def _source_digest(folder, file) -> str:
+    """sha1 of a system's matrix and labels; ties a saved IVF index to the embeddings it was built from."""
+    digest = hashlib.sha1()
+    for suffix in (".npy", ".codes.json"):
+        with open(os.path.join(folder, file + suffix), "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def build_ann(folder, system, nlist=None) -> dict:
+    """Build the IVF index of one system, or update the existing one incrementally."""
+    file = _read_manifest(folder)["systems"][system]["file"]
+    matrix = np.load(os.path.join(folder, file + ".npy"), mmap_mode="r")
+    with open(os.path.join(folder, file + ".codes.json"), encoding="utf-8") as f:
+        codes = json.load(f)["codes"]
+    hashes = row_hashes(codes, matrix)
+    previous = IVFIndex.load(ann_path(folder, file))
+    if previous is None or nlist is not None:
+        index, stats = IVFIndex.build(matrix, hashes, nlist), {"rows": len(codes), "retrained": True}
+    else:
+        index, stats = previous.update(matrix, hashes)
+    index.save(ann_path(folder, file), _source_digest(folder, file))
+    stats["nlist"] = index.nlist
+    return stats
+
+
+def _replace(path, write):
+    """Write a file next to `path` and swap it in: a server that has the old file memory-mapped keeps reading it."""
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def save_embeddings(folder, system, codes, terms, embeddings, model_name):
+    """Persist one system's embeddings (normalized float16) and register them in the manifest."""
+    os.makedirs(folder, exist_ok=True)
+    name = SYSTEM_FILES.get(system, system.lower())
+    matrix = normalize(embeddings).astype(np.float16)
+    _replace(os.path.join(folder, name + ".npy"), lambda f: np.save(f, matrix))
+    labels = json.dumps({"codes": list(codes), "terms": list(terms)}, ensure_ascii=False).encode("utf-8")
+    _replace(os.path.join(folder, name + ".codes.json"), lambda f: f.write(labels))
+    manifest = _read_manifest(folder)
+    if manifest.get("model") != model_name:
+        # vectors from another model are not comparable, start a fresh manifest
+        manifest = {"model": model_name, "systems": {}}
+    manifest["dim"] = int(matrix.shape[1]) if matrix.ndim == 2 else 0
+    manifest["dtype"] = "float16"
+    manifest["systems"][system] = {"file": name, "rows": int(matrix.shape[0])}
+    # written last: a server reloads its index once the manifest changes (see get_index)
+    _replace(os.path.join(folder, "manifest.json"), lambda f: f.write(json.dumps(manifest, indent=2).encode("utf-8")))
+
+
+class EmbeddingIndex:
+    """Memory-mapped embedding matrices of every system listed in a manifest."""
+
+    def __init__(self, folder=EMBEDDINGS_DIR):
+        self.folder = folder
+        # taken before reading, so a manifest rewritten during the load still triggers a reload
+        self.version = data_version(self.manifest_path)
+        manifest = _read_manifest(folder)
+        self.model = manifest.get("model")
+        self.matrices = {}
+        self._resident = {}
+        self._ann = {}
+        self.files = {}
+        self.codes = {}
+        self.terms = {}
+        for system, meta in manifest.get("systems", {}).items():
+            self.files[system] = meta["file"]
+            self.matrices[system] = np.load(os.path.join(folder, meta["file"] + ".npy"), mmap_mode="r")
+            with open(os.path.join(folder, meta["file"] + ".codes.json"), encoding="utf-8") as f:
+                labels = json.load(f)
+            self.codes[system] = labels["codes"]
+            self.terms[system] = labels["terms"]
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.folder, "manifest.json")
+
+    @property
+    def systems(self):
+        return list(self.matrices)
+
+    def __len__(self):
+        return sum(len(m) for m in self.matrices.values())
+
+    def scores(self, system, query_vector) -> np.ndarray:
+        """Cosine similarity of a unit query vector with every row of one system."""
+        q = np.asarray(query_vector, dtype=np.float32)
+        if EMBEDDINGS_RESIDENT:
+            matrix = self._resident.get(system)
+            if matrix is None:
+                matrix = self._resident[system] = self.matrices[system].astype(np.float32)
+            return matrix @ q
+        matrix = self.matrices[system]
+        out = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), CHUNK_ROWS):
+            out[start:start + CHUNK_ROWS] = matrix[start:start + CHUNK_ROWS].astype(np.float32) @ q
+        return out
+
+    def ann(self, system):
+        """The system's IVF index, loaded on first use; None when small, disabled, missing or stale."""
+        if system not in self._ann:
+            index = None
+            if USE_ANN and len(self.matrices[system]) >= ANN_MIN_ROWS:
+                file = self.files[system]
+                index = IVFIndex.load(ann_path(self.folder, file), _source_digest(self.folder, file))
+            self._ann[system] = index
+        return self._ann[system]
+
+    def search(self, query_vector, top_k=10, systems=None, exact=False, nprobe=ANN_NPROBE) -> list:
+        """Best top_k rows across the requested systems, highest cosine first.
+
+        Large systems go through their IVF index unless exact=True.
+        """
+        hits = []
+        for system in systems or self.systems:
+            if system not in self.matrices or top_k <= 0:
+                continue
+            ann = None if exact else self.ann(system)
+            if ann is not None:
+                rows, scores = ann.search(self.matrices[system], query_vector, top_k, nprobe)
+                hits.extend((float(s), system, int(i)) for i, s in zip(rows, scores))
+                continue
+            scores = self.scores(system, query_vector)
+            k = min(top_k, len(scores))
+            if k == 0:
+                continue
+            top = np.argpartition(-scores, k - 1)[:k]
+            hits.extend((float(scores[i]), system, int(i)) for i in top)
+        hits.sort(key=lambda h: -h[0])
+        return [{"system": system, "code": self.codes[system][i], "term": self.terms[system][i],
+                 "score": round(score, 4)} for score, system, i in hits[:top_k]]
+
+
+# process-wide index and query encoder, created on first use
+_index = None
+_encoder = None
+_encoder_pinned = False
+_lock = threading.Lock()
+
+
+def get_index() -> EmbeddingIndex:
+    """The process-wide index, reloaded once its manifest changes (generate_mappings saved new embeddings)."""
+    global _index
+    with _lock:
+        if _index is None:
+            _index = EmbeddingIndex(EMBEDDINGS_DIR)
+            search_cache.watch(_index.manifest_path)
+        elif data_version(_index.manifest_path) != _index.version:
+            _index = EmbeddingIndex(_index.folder)
+        return _index
+
+
+def get_encoder():
+    """Query encoder: SEMANTIC_ENCODER if set, otherwise the model recorded in the manifest."""
+    global _encoder
+    name = os.getenv("SEMANTIC_ENCODER") or get_index().model
+    if _encoder is not None and (_encoder_pinned or _encoder.name == name):
+        return _encoder
+    if not name:
+        raise LookupError(f"No embeddings found in '{EMBEDDINGS_DIR}'; run generate_mappings.py")
+    with _lock:
+        if _encoder is None or (not _encoder_pinned and _encoder.name != name):
+            _encoder = load_encoder(name)
+    return _encoder
+
+
+def set_encoder(encoder, index=None):
+    """Plug in a local encoder (and optionally an index), e.g. HashingEncoder in tests."""
+    global _encoder, _index, _encoder_pinned
+    with _lock:
+        _encoder = encoder
+        _encoder_pinned = True
+        if index is not None:
+            _index = index
+
+
+def semantic_search(query: str, top_k: int = 10, systems=None) -> list:
+    """Embed the query and return the top_k most similar codes (cached)."""
+    index = get_index()
+    encoder = get_encoder()
+    if index.model and encoder.name != index.model:
+        raise EncoderMismatch(f"Encoder '{encoder.name}' does not match the embeddings model '{index.model}'")
+    systems = list(systems) if systems else index.systems
+    # keyed on the exact text the encoder sees and the manifest version the index was loaded from
+    key = search_cache.make_key("vector", query, index.version,
+                                top_k=top_k, systems=",".join(sorted(systems)), model=encoder.name)
+    return search_cache.get_or_compute(key, lambda: index.search(encoder.encode([query])[0], top_k, systems))
@@ -0,0 +1,85 @@
+"""
+Multi-process CPU encoding for generate_mappings.py.
+
+Texts are cut into ENCODE_BATCH_SIZE batches and spread over ENCODE_WORKERS
+processes, each holding its own copy of the model and limited to
+ENCODE_THREADS intra-op threads, so a CPU-only host is kept busy without the
+workers fighting over cores. Batches come back in submission order, so the
+result is row-for-row what a single encoder returns.
+
+EncodingPool has the same encode()/name interface as the encoders in
+embedding_index and can be wrapped by embedding_cache.CachedEncoder.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+ENCODE_THREADS = int(os.getenv("ENCODE_THREADS", "1"))
+ENCODE_WORKERS = int(os.getenv("ENCODE_WORKERS", str(max(1, (os.cpu_count() or 1) // ENCODE_THREADS))))
+ENCODE_BATCH_SIZE = int(os.getenv("ENCODE_BATCH_SIZE", "64"))
+
+_worker_encoder = None
+
+
+def _init_worker(model_name, threads):
+    global _worker_encoder
+    # set before torch/numpy BLAS spin up their thread pools in this process
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from embedding_index import load_encoder
+    _worker_encoder = load_encoder(model_name)
+
+
+def _worker_model_name():
+    return _worker_encoder.name
+
+
+def _encode_batch(texts):
+    return np.asarray(_worker_encoder.encode(texts), dtype=np.float32)
+
+
+class EncodingPool:
+    def __init__(self, model_name, workers=ENCODE_WORKERS, batch_size=ENCODE_BATCH_SIZE, threads=ENCODE_THREADS):
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.encoder = self._executor = None
+        # a single in-process model is not shared between pipeline threads
+        self._lock = threading.Lock()
+        if self.workers == 1:
+            from embedding_index import load_encoder
+            self.encoder = load_encoder(model_name)
+            self.name = self.encoder.name
+            return
+        # spawn, not fork: forking the threaded pipeline (or a process with torch loaded) can deadlock
+        self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker, initargs=(model_name, threads))
+        self.name = self._executor.submit(_worker_model_name).result()
+
+    def encode(self, texts, show_progress_bar=False) -> np.ndarray:
+        texts = list(texts)
+        if self.encoder is not None:
+            with self._lock:
+                return np.asarray(self.encoder.encode(texts, show_progress_bar=show_progress_bar), dtype=np.float32)
+        if not texts:
+            return self._executor.submit(_encode_batch, []).result()
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        return np.concatenate(list(self._executor.map(_encode_batch, batches)))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,32 +1,21 @@
-import os, time, json, logging, requests
+import os, json, logging
 from pathlib import Path
-from urllib.parse import urljoin
 import psycopg2
+from psycopg2.extras import execute_values
 from datetime import datetime
+from who_delta import append_changes, delta_sync, load_state
 
 DATA_DIR = Path(__file__).resolve().parents[0]
 ICD_TM2_CSV = DATA_DIR / "icd11_tm2_data.csv"
 ICD_PROCESSED_CSV = DATA_DIR / "icd11_processed.csv"
 ICD_SYNC_META = DATA_DIR / "icd_sync_meta.json"
+ICD_SYNC_RESULTS = DATA_DIR / "icd11_sync_results.json"
+ICD_SYNC_CHANGES = DATA_DIR / "icd11_sync_changes.jsonl"
 
-WHO_BASE = os.getenv("WHO_ICD_API_BASE", "https://id.who.int")
-WHO_SEARCH_PATH = "/icd/release/11/mms/search"   # common WHO search path (adjust if docs differ)
-PAGE_SIZE = int(os.getenv("WHO_ICD_PAGE_SIZE", "50"))
 API_KEY = os.getenv("WHO_ICD_API_KEY", None)
-RATE_LIMIT_SLEEP = 0.15
 
 logger = logging.getLogger(__name__)
 
-def _request_search(q, page=1):
-    url = urljoin(WHO_BASE, WHO_SEARCH_PATH)
-    headers = {"Accept": "application/json"}
-    params = {"q": q, "page": page, "pageSize": PAGE_SIZE}
-    if API_KEY:
-        headers["Api-Key"] = API_KEY
-    resp = requests.get(url, params=params, headers=headers, timeout=20)
-    resp.raise_for_status()
-    return resp.json()
-
 def _extract_entities_from_search(json_resp):
     """
     Generic extractor: WHO JSON-LD formats vary; we look for recognizable keys.
@@ -68,49 +57,40 @@ def _extract_entities_from_search(json_resp):
         entities.append(x)
     return entities
 
-def sync_terms(term_list, save_csv=True):
-    """Sync a list of search terms -> returns list of found entities"""
-    collected = []
-    for term in term_list:
-        page = 1
-        while True:
-            try:
-                resp = _request_search(term, page=page)
-            except Exception as e:
-                logger.exception("WHO search failed for %s: %s", term, e)
-                break
-            ents = _extract_entities_from_search(resp)
-            if not ents:
-                break
-            for e in ents:
-                e['source_query'] = term
-                collected.append(e)
-            # basic pagination heuristics: stop if fewer than PAGE_SIZE returned
-            if len(ents) < PAGE_SIZE:
-                break
-            page += 1
-            time.sleep(RATE_LIMIT_SLEEP)
-    # optionally dedupe by id or label
-    dedup = {}
-    for e in collected:
-        key = e.get('id') or e.get('label')
-        if not key: continue
-        if key not in dedup:
-            dedup[key] = e
-    entities = list(dedup.values())
+def sync_terms(term_list, save_csv=True, delta=False):
+    """Sync a list of search terms -> returns list of found entities
+
+    Every run diffs against the previous one (see who_delta) and appends its
+    added/changed/removed entities to icd11_sync_changes.jsonl; with delta=True
+    pages are requested conditionally and unchanged ones are not reprocessed.
+    """
+    # terms are fetched concurrently (see who_sync); results come back in term/page order, deduped by id or label
+    meta, previous = load_state(ICD_SYNC_META, ICD_SYNC_RESULTS)
+    headers = {"Api-Key": API_KEY} if API_KEY else {}
+    entities, meta, changes, _ = delta_sync(term_list, _extract_entities_from_search, meta, previous,
+                                            conditional=delta, headers=headers)
     # write outputs (CSV/JSON) for later steps
     if save_csv:
-        out_json = (DATA_DIR / "icd11_sync_results.json")
-        out_json.write_text(json.dumps(entities, ensure_ascii=False, indent=2))
-        meta = {"last_sync": __import__("datetime").datetime.utcnow().isoformat(), "count": len(entities)}
+        ICD_SYNC_RESULTS.write_text(json.dumps(entities, ensure_ascii=False, indent=2))
         ICD_SYNC_META.write_text(json.dumps(meta, ensure_ascii=False, indent=2))
+        append_changes(ICD_SYNC_CHANGES, changes)
     return entities
-def save_icd_entities_to_db(conn, entities):
-    cur = conn.cursor()
+
+def save_icd_entities_to_db(conn, entities, batch_size=500):
+    """Upsert entities, deduped by URI, with one multi-row INSERT ... ON CONFLICT and commit per batch."""
+    now = datetime.utcnow()
+    rows = {}
     for ent in entities:
-        cur.execute("""
+        uri = ent.get("uri") or ent.get("id")
+        if uri:
+            rows[uri] = (uri, ent.get("code") or ent.get("mms"), ent.get("label"), ent.get("definition"),
+                         ent.get("source_query"), json.dumps(ent), now)
+    rows = list(rows.values())
+    cur = conn.cursor()
+    for start in range(0, len(rows), batch_size):
+        execute_values(cur, """
             INSERT INTO icd_entities (icd_uri, icd_code, label, definition, source_query, raw_json, updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            VALUES %s
             ON CONFLICT (icd_uri)
             DO UPDATE SET icd_code = EXCLUDED.icd_code,
                           label = EXCLUDED.label,
@@ -118,14 +98,7 @@ def save_icd_entities_to_db(conn, entities):
                           source_query = EXCLUDED.source_query,
                           raw_json = EXCLUDED.raw_json,
                           updated_at = EXCLUDED.updated_at
-        """, (
-            ent["uri"],
-            ent.get("code"),
-            ent.get("label"),
-            ent.get("definition"),
-            ent.get("source_query"),
-            json.dumps(ent),
-            datetime.utcnow()
-        ))
-    conn.commit()
+        """, rows[start:start + batch_size], page_size=batch_size)
+        conn.commit()
     cur.close()
+    return len(rows)
@@ -0,0 +1,228 @@
+"""
+Pre-encoded, revalidating copies of the FHIR resources written by generate_fhir.py.
+
+The CodeSystem and ConceptMap are several MB of JSON and EMR clients poll
+them constantly. CachedResource keeps each one in memory as compact UTF-8
+bytes plus gzip (and brotli, when the `brotli` package is installed) copies,
+and only re-reads the file when its mtime/size change, and only re-encodes
+it when its content hash changes too.
+
+fhir_response() serves one of them with a strong ETag and Last-Modified,
+answers If-None-Match / If-Modified-Since with 304, picks the encoding from
+Accept-Encoding and supports the FHIR _summary and _elements parameters.
+Partial responses are encoded once per parameter combination and kept
+until the file changes.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from search_cache import SOURCE_CHECK_INTERVAL, data_version
+
+try:
+    import brotli  # optional: only adds a br-encoded copy
+except ImportError:
+    brotli = None
+
+FHIR_CODESYSTEM_PATH = os.getenv("FHIR_CODESYSTEM_PATH", "./data/namaste-combined-codesystem.json")
+FHIR_CONCEPTMAP_PATH = os.getenv("FHIR_CONCEPTMAP_PATH", "./data/namaste-combined-conceptmap.json")
+FHIR_MEDIA_TYPE = "application/fhir+json"
+GZIP_LEVEL = 6
+# partial (_summary/_elements) responses kept per resource
+VARIANT_CACHE_SIZE = 32
+
+# elements left out of _summary=true: the bulk of each resource and its narrative
+NON_SUMMARY = {"CodeSystem": {"concept", "text"}, "ConceptMap": {"group", "text"}}
+# always returned with _elements (FHIR mandatory elements of these resources)
+MANDATORY = {"resourceType", "id", "meta", "status", "content"}
+SUBSETTED = {"system": "http://terminology.hl7.org/CodeSystem/v3-ObservationValue", "code": "SUBSETTED"}
+
+
+class Encoded:
+    """One representation, as identity/gzip/br bytes with their ETags."""
+
+    def __init__(self, body: bytes):
+        self.tag = hashlib.sha1(body).hexdigest()
+        self.bodies = {"identity": body, "gzip": gzip.compress(body, GZIP_LEVEL, mtime=0)}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(body)
+
+    def etag(self, encoding):
+        # a strong validator differs per content-coding
+        return f'"{self.tag}"' if encoding == "identity" else f'"{self.tag}-{encoding}"'
+
+
+def encode_json(resource) -> bytes:
+    return json.dumps(resource, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class CachedResource:
+    def __init__(self, path):
+        self.path = path
+        self.version = None
+        self.resource = None
+        self.full = None
+        self.last_modified = None
+        self.mtime = 0
+        self.loads = 0
+        self._digest = None
+        self._variants = OrderedDict()
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self.version is not None and now - self._last_check < SOURCE_CHECK_INTERVAL:
+            return
+        with self._lock:
+            self._last_check = now
+            version = data_version(self.path)
+            if version == self.version:
+                return
+            if version == "missing":
+                self.version = version
+                self.resource = self.full = None
+                self._variants.clear()
+                return
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            digest = hashlib.sha1(raw).hexdigest()
+            if self.full is not None and digest == self._digest:
+                self.version = version
+                return  # touched or rewritten with the same content: keep the ETag
+            try:
+                resource = json.loads(raw)
+            except ValueError:
+                # half-written: keep serving the previous copy and parse again on the next check;
+                # the version is only recorded once the file has been read successfully
+                if self.full is None:
+                    raise
+                return
+            self.version = version
+            self.mtime = int(os.stat(self.path).st_mtime)
+            self.resource = resource
+            self.full = Encoded(encode_json(self.resource))
+            self.last_modified = formatdate(self.mtime, usegmt=True)
+            self._digest = digest
+            self._variants.clear()
+            self.loads += 1
+
+    def get(self):
+        """The parsed resource, or None when the file does not exist."""
+        self._refresh()
+        return self.resource
+
+    def encoded(self, summary=None, elements=None):
+        """The Encoded representation for these _summary/_elements values (None when missing)."""
+        self._refresh()
+        with self._lock:
+            resource, full = self.resource, self.full
+            if full is None or (summary in (None, "false") and not elements):
+                return full
+            key = (summary, elements)
+            variant = self._variants.get(key)
+            if variant is None:
+                variant = self._variants[key] = Encoded(encode_json(subset(resource, summary, elements)))
+                while len(self._variants) > VARIANT_CACHE_SIZE:
+                    self._variants.popitem(last=False)
+            else:
+                self._variants.move_to_end(key)
+            return variant
+
+
+def subset(resource, summary=None, elements=None) -> dict:
+    """Copy of resource reduced the way FHIR _summary (true/text/data) or _elements asks."""
+    kind = resource.get("resourceType")
+    if summary == "true":
+        dropped = NON_SUMMARY.get(kind, set())
+        out = {k: v for k, v in resource.items() if k not in dropped}
+    elif summary == "text":
+        out = {k: v for k, v in resource.items() if k in MANDATORY or k == "text"}
+    elif summary == "data":
+        out = {k: v for k, v in resource.items() if k != "text"}
+    else:
+        out = dict(resource)
+    if elements:
+        out = {k: v for k, v in out.items() if k in MANDATORY or k in elements}
+    meta = dict(out.get("meta") or {})
+    meta["tag"] = [*meta.get("tag", []), SUBSETTED]
+    out["meta"] = meta
+    return out
+
+
+def parse_elements(value):
+    """_elements=a,b as a sorted tuple (so the variant cache is order-independent)."""
+    if not value:
+        return None
+    return tuple(sorted({name.strip() for name in value.split(",") if name.strip()})) or None
+
+
+def choose_encoding(accept_encoding, available) -> str:
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    for encoding in ("br", "gzip"):
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return "identity"
+
+
+def _not_modified(request, cached, encoded) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        for tag in if_none_match.split(","):
+            tag = tag.strip().removeprefix("W/").strip('"')
+            if tag.split("-")[0] == encoded.tag:
+                return True
+        return False
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return cached.mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def fhir_response(request, cached: CachedResource, missing="Resource not found; run generator"):
+    summary = request.query_params.get("_summary")
+    if summary not in (None, "true", "false", "text", "data"):
+        # _summary=count only applies to searches
+        raise HTTPException(400, f"Unsupported _summary value: {summary}")
+    encoded = cached.encoded(summary, parse_elements(request.query_params.get("_elements")))
+    if encoded is None:
+        raise HTTPException(404, missing)
+    encoding = choose_encoding(request.headers.get("accept-encoding"), encoded.bodies)
+    headers = {
+        "ETag": encoded.etag(encoding),
+        "Last-Modified": cached.last_modified,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if _not_modified(request, cached, encoded):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(encoded.bodies[encoding], headers=headers, media_type=FHIR_MEDIA_TYPE)
+
+
+codesystem = CachedResource(FHIR_CODESYSTEM_PATH)
+conceptmap = CachedResource(FHIR_CONCEPTMAP_PATH)
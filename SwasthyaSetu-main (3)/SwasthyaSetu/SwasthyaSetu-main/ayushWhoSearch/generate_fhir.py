@@ -1,4 +1,6 @@
+import argparse
 import csv
+import hashlib
 import json
 import os   # for WHO release version from env
 import uuid
@@ -40,39 +42,155 @@ AI_MAPPINGS_CSV = "candidate_mappings_semantic_v2.csv"
 
 CODESYSTEM_OUTPUT_PATH = 'namaste-combined-codesystem.json'
 CONCEPTMAP_OUTPUT_PATH = 'namaste-combined-conceptmap.json'
+# content hashes of the inputs and outputs of the last build (see create_fhir_resources)
+BUILD_MANIFEST_PATH = 'fhir_build_manifest.json'
+BUILD_FORMAT = 2
+
+MAPPING_COLUMNS = ["AYUSH_Code", "AYUSH_Term", "WHO_Code_Candidate", "WHO_Term_Candidate", "Suggested_Relationship"]
+# generator labels -> FHIR R4 ConceptMapEquivalence ("narrower-than": the AYUSH
+# concept is narrower, i.e. the ICD-11 target is wider); other values pass through
+EQUIVALENCE = {"equivalent": "equivalent", "narrower-than": "wider", "related-to": "relatedto"}
 
 NAMASTE_CODESYSTEM_URL = "http://your-domain.org/fhir/CodeSystem/namaste-combined"
 ICD11_URL = "http://id.who.int/icd/entity"
 
 
-def create_fhir_resources():
+def _sha1(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _row_hash(*fields):
+    return hashlib.blake2b("\x1f".join(fields).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _load_previous_build(who_release, full):
+    """Manifest and resources of the last build, or an empty manifest if they cannot be trusted."""
+    empty = {"format": BUILD_FORMAT, "sources": {}, "outputs": {}}
+    if full:
+        return empty, {}
+    try:
+        with open(BUILD_MANIFEST_PATH, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != BUILD_FORMAT or manifest.get("who_release") != who_release:
+            return empty, {}
+        resources = {}
+        for path, sha1 in manifest["outputs"].items():
+            # an output edited since the build (e.g. by icd_sync_utils) is rebuilt from scratch
+            if os.path.exists(path) and _sha1(path) == sha1:
+                with open(path, encoding="utf-8") as f:
+                    resources[path] = json.load(f)
+        return manifest, resources
+    except (OSError, ValueError, KeyError):
+        return empty, {}
+
+
+def _incremental(path, previous_state, previous_items, read_rows, build):
+    """Items built from one source file, reusing the previous build's items for unchanged rows.
+
+    read_rows yields (row_hash, row) for every row that produces an item; an
+    unchanged file is not read at all. Returns (items, state, stats).
+    """
+    sha1 = _sha1(path)
+    if previous_state and previous_state["sha1"] == sha1 and len(previous_items) == len(previous_state["rows"]):
+        return previous_items, previous_state, {"reused": len(previous_items), "built": 0, "removed": 0}
+    reusable = {}
+    if previous_state and len(previous_items) == len(previous_state["rows"]):
+        reusable = dict(zip(previous_state["rows"], previous_items))
+    items, hashes, built = [], [], 0
+    for row_hash, row in read_rows():
+        item = reusable.get(row_hash)
+        if item is None:
+            item = build(row)
+            built += 1
+        items.append(item)
+        hashes.append(row_hash)
+    removed = len(set(previous_state["rows"]) - set(hashes)) if previous_state else 0
+    return items, {"sha1": sha1, "rows": hashes}, {"reused": len(items) - built, "built": built, "removed": removed}
+
+
+def _write_json(path, resource, pretty):
+    """Compact JSON written atomically, plus an indented <name>.pretty.json copy if asked for."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(resource, f, separators=(",", ":"))
+    os.replace(tmp, path)
+    if pretty:
+        root, ext = os.path.splitext(path)
+        with open(f"{root}.pretty{ext}", "w", encoding="utf-8") as f:
+            json.dump(resource, f, indent=4)
+    return _sha1(path)
+
+
+def _read_concept_rows(file_path, cols):
+    def rows():
+        with open(file_path, mode='r', encoding='utf-8') as csv_file:
+            csv_reader = csv.DictReader(csv_file)
+            print(f"DEBUG: Found headers: {csv_reader.fieldnames}")
+            for row in csv_reader:
+                term_id = (row.get(cols["id"]) or "").strip()
+                term_name = (row.get(cols["display"]) or "").strip()
+                term_def = (row.get(cols["definition"]) or "").strip()
+                if not term_id or not term_name:
+                    continue
+                yield _row_hash(term_id, term_name, term_def), (term_id, term_name, term_def)
+    return rows
+
+
+def _read_mapping_groups():
+    """(hash, element) per AYUSH code, in order of first appearance, built with one groupby.
+
+    Each element carries every ICD-11 target of its source code; the hash
+    covers all of the code's rows, so one changed candidate rebuilds only
+    that code's element.
+    """
+    df = pd.read_csv(AI_MAPPINGS_CSV, dtype=str, keep_default_na=False)
+    df = df.reindex(columns=MAPPING_COLUMNS, fill_value="").apply(lambda col: col.str.strip())
+    df = df[(df["AYUSH_Code"] != "") & (df["WHO_Code_Candidate"] != "")]
+    relationship = df["Suggested_Relationship"].replace("", "related-to")
+    equivalence = relationship.map(EQUIVALENCE).fillna(relationship)
+    # the JSON objects themselves have to be Python dicts; everything else is column-wise
+    targets = [{"code": code, "display": display, "equivalence": eq} for code, display, eq in
+               zip(df["WHO_Code_Candidate"].tolist(), df["WHO_Term_Candidate"].tolist(), equivalence.tolist())]
+    row_keys = df["WHO_Code_Candidate"].str.cat([df["WHO_Term_Candidate"], relationship, df["AYUSH_Term"]],
+                                                sep="\x1f").to_numpy(dtype=object)
+
+    grouped = df.groupby("AYUSH_Code", sort=False)
+    positions = grouped.indices
+    displays = grouped["AYUSH_Term"].first()
+    for code, display in zip(displays.index, displays.to_numpy()):
+        rows = positions[code]
+        element = {"code": code}
+        if display:
+            element["display"] = display
+        element["target"] = [targets[i] for i in rows]
+        key = "\x1e".join(row_keys[rows])
+        yield _row_hash(code, key), element
+
+
+def create_fhir_resources(full=False, pretty=False):
+    """Build the combined CodeSystem and ConceptMap, redoing only what changed since the last build.
+
+    Sources are compared with fhir_build_manifest.json by content hash: an
+    unchanged CSV is not read, and in a changed one only rows whose content
+    changed produce new concepts/elements. A resource whose sources are all
+    unchanged is not rewritten. full=True ignores the previous build.
+    """
     print("🚀 Starting FHIR resource generation from NAMASTE files + AI mappings...")
 
     who_release = os.getenv("WHO_ICD_RELEASE", "11")
     timestamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    manifest, previous = _load_previous_build(who_release, full)
+    new_manifest = {"format": BUILD_FORMAT, "who_release": who_release, "sources": {}, "outputs": {}}
 
     # --- CodeSystem (combined AYUSH terms) ---
-    code_system = {
-        "resourceType": "CodeSystem",
-        "id": f"namaste-combined-{uuid.uuid4()}",
-        "url": NAMASTE_CODESYSTEM_URL,
-        "version": f"who-{who_release}-{timestamp}",
-        "meta": {
-            "lastSync": datetime.utcnow().isoformat() + "Z",
-            "whoRelease": who_release
-        },
-        "name": "NAMASTE_Combined_AYUSH_Terminology",
-        "title": "NAMASTE Combined (Ayurveda, Siddha, Unani) Terminology",
-        "status": "active",
-        "experimental": False,
-        "date": datetime.now().isoformat(),
-        "publisher": "Your Organization Name",
-        "description": "A combined FHIR CodeSystem representing standardized terms from the NAMASTE portal for Ayurveda, Siddha, and Unani.",
-        "caseSensitive": True,
-        "content": "complete",
-        "concept": []
-    }
-
+    previous_cs = previous.get(CODESYSTEM_OUTPUT_PATH)
+    previous_concepts = previous_cs["concept"] if previous_cs else []
+    concepts = []
+    codesystem_changed = previous_cs is None
     total_concepts = 0
 
     # Load each AYUSH system file
@@ -80,107 +198,119 @@ def create_fhir_resources():
         file_path = config["path"]
         system_name = config["system"]
         cols = config["columns"]
+        state = manifest["sources"].get(file_path) if previous_cs else None
+        # the previous build's concepts of this file, by position in the CodeSystem
+        start = state["offset"] if state else 0
+        previous_items = previous_concepts[start:start + len(state["rows"])] if state else []
 
         print(f"\nProcessing {system_name} file: {file_path}...")
 
         try:
-            with open(file_path, mode='r', encoding='utf-8') as csv_file:
-                csv_reader = csv.DictReader(csv_file)
-                print(f"DEBUG: Found headers: {csv_reader.fieldnames}")
-
-                file_concepts_count = 0
-                for row in csv_reader:
-                    term_id = row.get(cols["id"], "").strip()
-                    term_name = row.get(cols["display"], "").strip()
-                    term_def = row.get(cols["definition"], "").strip()
-
-                    if not term_id or not term_name:
-                        continue
-
-                    concept_entry = {
-                        "code": f"{system_name.upper()}-{term_id}",
-                        "display": term_name,
-                        "definition": term_def
-                    }
-                    code_system['concept'].append(concept_entry)
-                    file_concepts_count += 1
-
-                print(f"✅ Successfully processed {file_concepts_count} terms from {system_name}.")
-                total_concepts += file_concepts_count
-
+            items, new_state, stats = _incremental(
+                file_path, state, previous_items, _read_concept_rows(file_path, cols),
+                lambda row, prefix=system_name.upper(): {
+                    "code": f"{prefix}-{row[0]}",
+                    "display": row[1],
+                    "definition": row[2]
+                })
         except FileNotFoundError:
             print(f"❌ ERROR: The file {file_path} was not found.")
+            codesystem_changed = codesystem_changed or state is not None
+            continue
         except Exception as e:
             print(f"An error occurred while processing {file_path}: {e}")
+            codesystem_changed = True
+            continue
 
-    # Save CodeSystem
-    with open(CODESYSTEM_OUTPUT_PATH, 'w', encoding='utf-8') as f:
-        json.dump(code_system, f, indent=4)
-    print(f"\n✅ Combined FHIR CodeSystem with {total_concepts} total terms saved to: {CODESYSTEM_OUTPUT_PATH}")
+        new_state["offset"] = len(concepts)
+        new_manifest["sources"][file_path] = new_state
+        concepts.extend(items)
+        # any added, changed, dropped or reordered row (or a shift from an earlier file) changes the output
+        codesystem_changed = (codesystem_changed or state is None or new_state["rows"] != state["rows"]
+                              or new_state["offset"] != start)
+        print(f"✅ {len(items)} terms from {system_name} "
+              f"({stats['reused']} unchanged, {stats['built']} added or changed, {stats['removed']} dropped).")
+        total_concepts += len(items)
 
-    # --- ConceptMap with AI mappings ---
-    concept_map = {
-        "resourceType": "ConceptMap",
-        "id": f"namaste-combined-to-icd11-{uuid.uuid4()}",
-        "url": "http://your-domain.org/fhir/ConceptMap/namaste-combined-to-icd11",
-        "version": f"who-{who_release}-{timestamp}",
-        "meta": {
-            "lastSync": datetime.utcnow().isoformat(),
-            "whoRelease": who_release
-        },
-        "name": "NAMASTE_Combined_to_ICD11_Mapping",
-        "title": "Mapping from Combined AYUSH to ICD-11",
-        "status": "draft",
-        "experimental": True,
-        "date": datetime.now().isoformat(),
-        "publisher": "Your Organization Name",
-        "description": "Maps concepts from the combined NAMASTE AYUSH CodeSystem to WHO ICD-11, enriched by AI semantic similarity.",
-        "sourceUri": NAMASTE_CODESYSTEM_URL,
-        "targetUri": ICD11_URL,
-        "group": [
-            {
-                "source": NAMASTE_CODESYSTEM_URL,
-                "target": ICD11_URL,
-                "element": []
-            }
-        ]
-    }
+    if codesystem_changed:
+        code_system = {
+            "resourceType": "CodeSystem",
+            "id": f"namaste-combined-{uuid.uuid4()}",
+            "url": NAMASTE_CODESYSTEM_URL,
+            "version": f"who-{who_release}-{timestamp}",
+            "meta": {
+                "lastSync": datetime.utcnow().isoformat() + "Z",
+                "whoRelease": who_release
+            },
+            "name": "NAMASTE_Combined_AYUSH_Terminology",
+            "title": "NAMASTE Combined (Ayurveda, Siddha, Unani) Terminology",
+            "status": "active",
+            "experimental": False,
+            "date": datetime.now().isoformat(),
+            "publisher": "Your Organization Name",
+            "description": "A combined FHIR CodeSystem representing standardized terms from the NAMASTE portal for Ayurveda, Siddha, and Unani.",
+            "caseSensitive": True,
+            "content": "complete",
+            "concept": concepts
+        }
+        new_manifest["outputs"][CODESYSTEM_OUTPUT_PATH] = _write_json(CODESYSTEM_OUTPUT_PATH, code_system, pretty)
+        print(f"\n✅ Combined FHIR CodeSystem with {total_concepts} total terms saved to: {CODESYSTEM_OUTPUT_PATH}")
+    else:
+        new_manifest["outputs"][CODESYSTEM_OUTPUT_PATH] = manifest["outputs"][CODESYSTEM_OUTPUT_PATH]
+        print(f"\n✅ CodeSystem unchanged ({total_concepts} terms), kept {CODESYSTEM_OUTPUT_PATH}")
 
-    # Load AI mappings CSV
+    # --- ConceptMap with AI mappings ---
+    previous_cm = previous.get(CONCEPTMAP_OUTPUT_PATH)
+    state = manifest["sources"].get(AI_MAPPINGS_CSV) if previous_cm else None
+    previous_elements = previous_cm["group"][0]["element"] if previous_cm else []
     try:
-        df = pd.read_csv(AI_MAPPINGS_CSV, dtype=str).fillna("")
-        print(f"📖 Loaded {len(df)} AI-suggested mappings from {AI_MAPPINGS_CSV}.")
-
-        for _, row in df.iterrows():
-            ayush_code = row.get("AYUSH_Code", "").strip()
-            who_code = row.get("WHO_Code_Candidate", "").strip()
-            who_term = row.get("WHO_Term_Candidate", "").strip()
-            relationship = row.get("Suggested_Relationship", "related-to").strip()
-
-            if not ayush_code or not who_code:
-                continue
-
-            element_entry = {
-                "code": ayush_code,
-                "target": [
-                    {
-                        "code": who_code,
-                        "display": who_term,
-                        "equivalence": relationship
-                    }
-                ]
-            }
-            concept_map["group"][0]["element"].append(element_entry)
-
-        print(f"✅ Added {len(concept_map['group'][0]['element'])} mappings into ConceptMap.")
-
+        # one element per AYUSH code with all of its targets
+        elements, new_state, stats = _incremental(
+            AI_MAPPINGS_CSV, state, previous_elements, _read_mapping_groups, lambda element: element)
+        new_manifest["sources"][AI_MAPPINGS_CSV] = new_state
+        conceptmap_changed = previous_cm is None or state is None or new_state["rows"] != state["rows"]
+        total_targets = sum(len(el["target"]) for el in elements)
+        print(f"📖 {total_targets} AI-suggested mappings for {len(elements)} AYUSH codes from {AI_MAPPINGS_CSV} "
+              f"({stats['reused']} unchanged, {stats['built']} added or changed, {stats['removed']} dropped).")
     except FileNotFoundError:
         print(f"⚠️ AI mappings file {AI_MAPPINGS_CSV} not found. ConceptMap will only be a stub.")
+        elements, conceptmap_changed = [], previous_cm is None or state is not None
+
+    if conceptmap_changed:
+        concept_map = {
+            "resourceType": "ConceptMap",
+            "id": f"namaste-combined-to-icd11-{uuid.uuid4()}",
+            "url": "http://your-domain.org/fhir/ConceptMap/namaste-combined-to-icd11",
+            "version": f"who-{who_release}-{timestamp}",
+            "meta": {
+                "lastSync": datetime.utcnow().isoformat(),
+                "whoRelease": who_release
+            },
+            "name": "NAMASTE_Combined_to_ICD11_Mapping",
+            "title": "Mapping from Combined AYUSH to ICD-11",
+            "status": "draft",
+            "experimental": True,
+            "date": datetime.now().isoformat(),
+            "publisher": "Your Organization Name",
+            "description": "Maps concepts from the combined NAMASTE AYUSH CodeSystem to WHO ICD-11, enriched by AI semantic similarity.",
+            "sourceUri": NAMASTE_CODESYSTEM_URL,
+            "targetUri": ICD11_URL,
+            "group": [
+                {
+                    "source": NAMASTE_CODESYSTEM_URL,
+                    "target": ICD11_URL,
+                    "element": elements
+                }
+            ]
+        }
+        new_manifest["outputs"][CONCEPTMAP_OUTPUT_PATH] = _write_json(CONCEPTMAP_OUTPUT_PATH, concept_map, pretty)
+        print(f"✅ FHIR ConceptMap with {len(elements)} grouped elements saved to: {CONCEPTMAP_OUTPUT_PATH}")
+    else:
+        new_manifest["outputs"][CONCEPTMAP_OUTPUT_PATH] = manifest["outputs"][CONCEPTMAP_OUTPUT_PATH]
+        print(f"✅ ConceptMap unchanged ({len(elements)} grouped elements), kept {CONCEPTMAP_OUTPUT_PATH}")
 
-    # Save ConceptMap
-    with open(CONCEPTMAP_OUTPUT_PATH, 'w', encoding='utf-8') as f:
-        json.dump(concept_map, f, indent=4)
-    print(f"✅ FHIR ConceptMap saved to: {CONCEPTMAP_OUTPUT_PATH}")
+    with open(BUILD_MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(new_manifest, f, separators=(",", ":"))
 
     if total_concepts > 0:
         print("\n🎉 Phase 1 + AI integration completed successfully!")
@@ -189,4 +319,8 @@ def create_fhir_resources():
 
 
 if __name__ == "__main__":
-    create_fhir_resources()
+    parser = argparse.ArgumentParser(description="Build the NAMASTE FHIR CodeSystem and ConceptMap.")
+    parser.add_argument("--full", action="store_true", help="ignore the previous build and regenerate everything")
+    parser.add_argument("--pretty", action="store_true", help="also write indented *.pretty.json copies")
+    args = parser.parse_args()
+    create_fhir_resources(full=args.full, pretty=args.pretty)
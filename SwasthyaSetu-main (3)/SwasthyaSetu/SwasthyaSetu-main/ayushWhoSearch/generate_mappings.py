@@ -1,43 +1,58 @@
 import os
 import csv
-import psycopg2
-import psycopg2.extras
-import pandas as pd
+import hashlib
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
 import numpy as np
+import pandas as pd
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from code_reader import CODE_TABLES, CodeTable, connection, read_code_table
+from embedding_cache import CachedEncoder, EmbeddingCache, text_hash
+from embedding_index import EMBEDDINGS_DIR, build_ann, normalize, save_embeddings, top_k_blocks
+from encoding_pool import ENCODE_BATCH_SIZE, ENCODE_THREADS, ENCODE_WORKERS, EncodingPool
 
 # --- Configuration ---
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 OUTPUT_CSV_PATH = "candidate_mappings_semantic_v2.csv"
+# text hashes of the last completed run, used to reuse the candidates of unchanged AYUSH codes
+STATE_PATH = OUTPUT_CSV_PATH + ".state.json"
 
 # Suggested models:
 # "pritamdeka/BioBERT-mnli-snli-scinli-scitail-mednli-stsb" (biomedical focus)
 # "ai4bharat/indic-bert" (multilingual, useful for Sanskrit/Hindi/Tamil terms)
-MODEL_NAME = "pritamdeka/BioBERT-mnli-snli-scinli-scitail-mednli-stsb"
+# "hashing" selects the small offline HashingEncoder (tests / demos without a model download)
+MODEL_NAME = os.getenv("SEMANTIC_MODEL", "pritamdeka/BioBERT-mnli-snli-scinli-scitail-mednli-stsb")
 
 SIMILARITY_THRESHOLD = 0.5
 TOP_N_MATCHES = 3
+# Similarities are computed in ROW_CHUNK x TARGET_CHUNK float32 tiles; peak working
+# memory is a few tiles (~40 MB at the defaults) whatever the number of codes
+ROW_CHUNK = int(os.getenv("MAPPING_ROW_CHUNK", "128"))
+TARGET_CHUNK = int(os.getenv("MAPPING_TARGET_CHUNK", "16384"))
+# texts are handed to the encoder this many at a time, so only one chunk is ever a list of str
+ENCODE_CHUNK = 8192
+# save_embeddings rewrites the shared manifest
+_manifest_lock = threading.Lock()
 
 
-def fetch_codes_from_db(query, table_name):
-    """Fetches records from the database as a list of dictionaries."""
+def fetch_codes_from_db(conn, system):
+    """Streams one code table into a compact CodeTable (empty if the read fails)."""
+    table_name = CODE_TABLES[system][1]
     print(f"📖 Fetching records from '{table_name}'...")
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cursor.execute(query)
-        records = [dict(row) for row in cursor.fetchall()]
-        cursor.close()
-        conn.close()
+        records = read_code_table(conn, system)
         print(f"✅ Found {len(records)} records in {table_name}.")
         return records
     except Exception as e:
         print(f"❌ Failed to fetch from '{table_name}': {e}")
-        return []
+        # the tables share one connection: clear the failed transaction so the next read can run
+        conn.rollback()
+        return CodeTable.from_rows(system, [])
 
 
 def classify_relationship(score: float) -> str:
@@ -50,104 +65,151 @@ def classify_relationship(score: float) -> str:
         return "related-to"
 
 
+def _records_digest(records: CodeTable):
+    """Digest of a target system: any added, removed or edited code changes everyone's top matches."""
+    digest = hashlib.sha1()
+    for code, title, text in zip(records.codes, records.titles, records.texts):
+        digest.update(f"{code}\x1f{title}\x1f{text_hash(text)}\x1e".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _load_previous_run(settings):
+    """(state, candidate rows by (AYUSH_Code, Target_System)) of the last run made with the same settings."""
+    try:
+        with open(STATE_PATH, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("settings") != settings:
+            return None, {}
+        rows = defaultdict(list)
+        with open(OUTPUT_CSV_PATH, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                rows[(row["AYUSH_Code"], row["Target_System"])].append(row)
+        return state, rows
+    except (OSError, ValueError, KeyError):
+        return None, {}
+
+
+class StageTimer:
+    """Texts and wall time per (stage, system), reported as throughput at the end of the run."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows = []
+
+    def record(self, stage, system, texts, started):
+        with self.lock:
+            self.rows.append((stage, system, texts, time.perf_counter() - started))
+
+    def report(self):
+        print("\n⏱️  Stage throughput:")
+        for stage, system, texts, seconds in self.rows:
+            print(f"   {stage:10s} {system:12s} {texts:8d} texts  {seconds:7.2f} s  "
+                  f"{texts / seconds if seconds else 0:10.0f} texts/s")
+
+
+def _fetch_stage(fetched, timer):
+    """Reads the tables one after another over one pooled connection, handing each over as it completes."""
+    try:
+        with connection(DATABASE_URL) as conn:
+            for system, future in fetched.items():
+                started = time.perf_counter()
+                future.set_result(fetch_codes_from_db(conn, system))
+                timer.record("fetch", system, len(future.result()), started)
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+    for system, future in fetched.items():
+        if not future.done():
+            future.set_result(CodeTable.from_rows(system, []))
+
+
+def _encode_stage(model, system, fetched, timer):
+    """Embeddings (unit-length float32, so cosine similarity is a dot product) of one system.
+
+    Texts encoded by an earlier run come from the embedding cache; the rest are
+    spread over the encoding pool, concurrently with the other systems.
+    """
+    records = fetched.result()
+    if not len(records):
+        return records, None
+    print(f"⏳ Generating embeddings for {system} codes...")
+    started = time.perf_counter()
+    chunks, hits, misses = [], 0, 0
+    for start in range(0, len(records), ENCODE_CHUNK):
+        vectors, stats = model.encode_counted(records.texts[start:start + ENCODE_CHUNK])
+        chunks.append(normalize(vectors))
+        hits, misses = hits + stats["hits"], misses + stats["misses"]
+    embeddings = np.concatenate(chunks)
+    timer.record("encode", system, misses, started)
+    print(f"💾 Embedding cache for {system}: {hits}/{len(records)} hits ({hits / len(records):.1%}), "
+          f"{misses} encoded")
+    with _manifest_lock:
+        save_embeddings(EMBEDDINGS_DIR, system, records.codes.tolist(), records.titles.tolist(),
+                        embeddings, model.name)
+    return records, embeddings
+
+
+def _match_stage(system, ayush_embeddings, unchanged, previous, encoded, timer):
+    """Top matches of every AYUSH code in one target system.
+
+    AYUSH codes whose text is unchanged keep the candidates of the previous run
+    as long as the target system did not change either; the rest go through
+    top_k_blocks. Only the compact (rows x TOP_N) results are kept.
+    """
+    records, embeddings = encoded.result()
+    if not len(records):
+        return None
+    digest = _records_digest(records)
+    target_unchanged = previous is not None and previous["targets"].get(system) == digest
+    reuse = [target_unchanged and u for u in unchanged]
+    compute = [i for i, r in enumerate(reuse) if not r]
+    print(f"♻️  {system}: reusing candidates of {len(reuse) - len(compute)}/{len(reuse)} "
+          f"AYUSH codes, computing {len(compute)}")
+    started = time.perf_counter()
+    blocks = list(top_k_blocks(ayush_embeddings[compute], embeddings, TOP_N_MATCHES, ROW_CHUNK, TARGET_CHUNK))
+    indices = [row for _, idx, _ in blocks for row in idx.tolist()]
+    scores = [row for _, _, sc in blocks for row in sc.tolist()]
+    timer.record("similarity", system, len(compute), started)
+    return records, digest, reuse, iter(zip(indices, scores))
+
+
 def generate_semantic_mappings():
-    """Generates mappings using Sentence Transformers with enriched data."""
-    print(f"🧠 Loading the Sentence Transformer model: '{MODEL_NAME}'...")
-    model = SentenceTransformer(MODEL_NAME)
-
-    # 1. Fetch data from all three tables
-    ayush_codes = fetch_codes_from_db(
-        "SELECT code, display, definition FROM codes", "codes"
-    )
-    tm2_codes = fetch_codes_from_db(
-        "SELECT code, title, index_terms FROM who_tm2_codes", "who_tm2_codes"
-    )
-    biomed_codes = fetch_codes_from_db(
-        "SELECT code, title, definition FROM biomedicine_codes",
-        "biomedicine_codes",
-    )
-
-    if not ayush_codes:
-        print("❌ Critical Error: Could not fetch AYUSH codes. Aborting.")
-        return
-
-    # 2. Prepare text for embedding
-    ayush_texts = [
-        f"{rec['display']}. {rec.get('definition') or ''}" for rec in ayush_codes
-    ]
-    tm2_texts = [
-        f"{rec['title']}. {rec.get('index_terms') or ''}" for rec in tm2_codes
-    ]
-    biomed_texts = [
-        f"{rec['title']}. {rec.get('definition') or ''}" for rec in biomed_codes
-    ]
+    """Generates mappings using Sentence Transformers with enriched data.
+
+    The stages run as a pipeline: the tables are streamed one after another over
+    one connection, each system is encoded as soon as its rows arrive, and a
+    target system is matched as soon as it and the AYUSH codes are encoded.
+    """
+    print(f"🧠 Loading the Sentence Transformer model: '{MODEL_NAME}' "
+          f"({ENCODE_WORKERS} encoding workers x {ENCODE_THREADS} threads, batches of {ENCODE_BATCH_SIZE})...")
+    timer = StageTimer()
+    with EncodingPool(MODEL_NAME) as pool, ThreadPoolExecutor(max_workers=2 * len(CODE_TABLES)) as stages:
+        model = CachedEncoder(pool, EmbeddingCache())
+        settings = {"model": model.name, "top_n": TOP_N_MATCHES, "threshold": SIMILARITY_THRESHOLD}
+        previous, previous_rows = _load_previous_run(settings)
+
+        # 1-2. Stream all three tables and encode each one as it arrives
+        fetched = {system: Future() for system in CODE_TABLES}
+        stages.submit(_fetch_stage, fetched, timer)
+        encoded = {system: stages.submit(_encode_stage, model, system, fetched[system], timer)
+                   for system in CODE_TABLES}
 
-    # 3. Generate embeddings
-    print("⏳ Generating embeddings for AYUSH codes...")
-    ayush_embeddings = model.encode(ayush_texts, show_progress_bar=True)
-
-    similarity_matrix_tm2 = None
-    similarity_matrix_biomed = None
-
-    if tm2_codes:
-        print("⏳ Generating embeddings for TM2 codes (with index terms)...")
-        tm2_embeddings = model.encode(tm2_texts, show_progress_bar=True)
-        similarity_matrix_tm2 = cosine_similarity(ayush_embeddings, tm2_embeddings)
-
-    if biomed_codes:
-        print("⏳ Generating embeddings for Biomedicine codes...")
-        biomed_embeddings = model.encode(biomed_texts, show_progress_bar=True)
-        similarity_matrix_biomed = cosine_similarity(
-            ayush_embeddings, biomed_embeddings
-        )
-
-    # 4. Calculate similarities and find top matches
-    print("🤖 Calculating similarities and selecting top candidates...")
-    all_candidates = []
-
-    for i, ayush in enumerate(ayush_codes):
-        # Process TM2 matches
-        if similarity_matrix_tm2 is not None:
-            tm2_scores = similarity_matrix_tm2[i]
-            top_tm2_indices = np.argsort(tm2_scores)[-TOP_N_MATCHES:][::-1]
-            for index in top_tm2_indices:
-                score = float(tm2_scores[index])
-                if score >= SIMILARITY_THRESHOLD:
-                    all_candidates.append(
-                        {
-                            "AYUSH_Code": ayush["code"],
-                            "AYUSH_Term": ayush["display"],
-                            "Target_System": "TM2",
-                            "WHO_Code_Candidate": tm2_codes[index]["code"],
-                            "WHO_Term_Candidate": tm2_codes[index]["title"],
-                            "Similarity_Score": round(score, 4),
-                            "Suggested_Relationship": classify_relationship(score),
-                        }
-                    )
-
-        # Process Biomedicine matches
-        if similarity_matrix_biomed is not None:
-            biomed_scores = similarity_matrix_biomed[i]
-            top_biomed_indices = np.argsort(biomed_scores)[-TOP_N_MATCHES:][::-1]
-            for index in top_biomed_indices:
-                score = float(biomed_scores[index])
-                if score >= SIMILARITY_THRESHOLD:
-                    all_candidates.append(
-                        {
-                            "AYUSH_Code": ayush["code"],
-                            "AYUSH_Term": ayush["display"],
-                            "Target_System": "Biomedicine",
-                            "WHO_Code_Candidate": biomed_codes[index]["code"],
-                            "WHO_Term_Candidate": biomed_codes[index]["title"],
-                            "Similarity_Score": round(score, 4),
-                            "Suggested_Relationship": classify_relationship(
-                                score
-                            ),
-                        }
-                    )
-
-    # 5. Write results to a new CSV
-    print(f"\n✍️  Writing {len(all_candidates)} mappings to '{OUTPUT_CSV_PATH}'...")
+        ayush_codes, ayush_embeddings = encoded["AYUSH"].result()
+        if not len(ayush_codes):
+            print("❌ Critical Error: Could not fetch AYUSH codes. Aborting.")
+            return
+
+        # 3. Similarity per target system, as soon as its embeddings are ready
+        ayush_hashes = [text_hash(t) for t in ayush_codes.texts]
+        code_counts = Counter(ayush_codes.codes)
+        unchanged = [previous is not None and code_counts[code] == 1 and previous["ayush"].get(code) == h
+                     for code, h in zip(ayush_codes.codes, ayush_hashes)]
+        matched = [(system, stages.submit(_match_stage, system, ayush_embeddings, unchanged, previous,
+                                          encoded[system], timer))
+                   for system in CODE_TABLES if system != "AYUSH"]
+        targets = [(system, *future.result()) for system, future in matched if future.result() is not None]
+
+    # 4. Write results, streaming one AYUSH code at a time
+    print(f"🤖 Writing top candidates to '{OUTPUT_CSV_PATH}'...")
     headers = [
         "AYUSH_Code",
         "AYUSH_Term",
@@ -157,12 +219,52 @@ def generate_semantic_mappings():
         "Similarity_Score",
         "Suggested_Relationship",
     ]
-    with open(OUTPUT_CSV_PATH, "w", newline="", encoding="utf-8") as f:
+    written = 0
+    started = time.perf_counter()
+    tmp_path = OUTPUT_CSV_PATH + ".tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
         writer = csv.DictWriter(f, fieldnames=headers)
         writer.writeheader()
-        writer.writerows(all_candidates)
+        for i, (ayush_code, ayush_term) in enumerate(zip(ayush_codes.codes, ayush_codes.titles)):
+            for system, records, _, reuse, matches in targets:
+                if reuse[i]:
+                    rows = previous_rows.get((ayush_code, system), [])
+                    writer.writerows(rows)
+                    written += len(rows)
+                    continue
+                indices, scores = next(matches)
+                for index, score in zip(indices, scores):
+                    if score >= SIMILARITY_THRESHOLD:
+                        writer.writerow(
+                            {
+                                "AYUSH_Code": ayush_code,
+                                "AYUSH_Term": ayush_term,
+                                "Target_System": system,
+                                "WHO_Code_Candidate": records.codes[index],
+                                "WHO_Term_Candidate": records.titles[index],
+                                "Similarity_Score": round(score, 4),
+                                "Suggested_Relationship": classify_relationship(score),
+                            }
+                        )
+                        written += 1
+    # no state file while the CSV is swapped: an interrupted run falls back to a full recompute
+    if os.path.exists(STATE_PATH):
+        os.remove(STATE_PATH)
+    os.replace(tmp_path, OUTPUT_CSV_PATH)
+    with open(STATE_PATH, "w", encoding="utf-8") as f:
+        json.dump({"settings": settings,
+                   "ayush": dict(zip(ayush_codes.codes, ayush_hashes)),
+                   "targets": {system: digest for system, _, digest, _, _ in targets}}, f)
+    timer.record("write", "AYUSH", len(ayush_codes), started)
 
+    print(f"\n✍️  Wrote {written} mappings.")
     print(f"✅ Successfully created '{OUTPUT_CSV_PATH}'.")
+    print(f"💾 Embeddings saved to '{EMBEDDINGS_DIR}/' for /search/semantic.")
+    timer.report()
+
+    # ANN indexes, updated incrementally when only some codes changed
+    for system in ["AYUSH"] + [system for system, *_ in targets]:
+        print(f"🗂️  ANN index for {system}: {build_ann(EMBEDDINGS_DIR, system)}")
 
 
 if __name__ == "__main__":
@@ -1,34 +1,47 @@
 from pathlib import Path
-import shutil, json
+import shutil, json, time
+from who_delta import read_changes
 CONCEPTMAP_PATH = Path("namaste-combined-conceptmap.json")
 BACKUP_DIR = Path("./backups"); BACKUP_DIR.mkdir(exist_ok=True)
+# marks the targets a WHO sync added, so a later sync can remove them without touching curated mappings
+SYNC_EXTENSION_URL = "http://your-domain.org/fhir/StructureDefinition/who-sync-target"
+SYNC_EXTENSION = {'url': SYNC_EXTENSION_URL, 'valueBoolean': True}
 
-def merge_entities_into_conceptmap(entities):
-    cm = json.loads(CONCEPTMAP_PATH.read_text())
-    # assume one group, source = namaste codesystem
-    group = cm['group'][0]
+def _is_synced(target):
+    # 'relatedTo' (not an R4 equivalence) is what older syncs wrote, before the extension
+    return (target.get('equivalence') == 'relatedTo'
+            or any(x.get('url') == SYNC_EXTENSION_URL for x in target.get('extension', [])))
+
+def _upgrade_synced(group):
+    # rewrite targets of older syncs to the R4 'relatedto' code plus the sync extension
+    for el in group.get('element', []):
+        for t in el.get('target', []):
+            if t.get('equivalence') == 'relatedTo':
+                t['equivalence'] = 'relatedto'
+                t['extension'] = [SYNC_EXTENSION]
+
+def _icd_uri(ent):
+    # ent['id'] might be an absolute URI or short id, normalise
+    icd_code = str(ent.get('id') or ent.get('mms') or ent.get('label'))
+    return icd_code if icd_code.startswith("http") else f"http://id.who.int/icd/entity/{icd_code}"
+
+def _add_targets(group, entities, refresh=False):
     element_map = {el['code']: el for el in group.get('element', [])}
+    # search in CodeSystem (once per merge, by lowercased display)
+    codesystem = json.loads(Path('namaste-combined-codesystem.json').read_text())
+    by_display = {}
+    for c in codesystem.get('concept', []):
+        if c.get('display'):
+            by_display.setdefault(c['display'].lower(), c.get('code'))
     added = 0
     for ent in entities:
-        # ent['id'] might be an absolute URI or short id, normalise
-        icd_code = str(ent.get('id') or ent.get('mms') or ent.get('label'))
-        icd_uri = icd_code
-        if icd_code.startswith("http"):
-            # keep
-            pass
-        else:
-            icd_uri = f"http://id.who.int/icd/entity/{icd_code}"
+        icd_uri = _icd_uri(ent)
         # naive mapping strategy: find best namaste source using ent['source_query'] or fallback: use candidate_mappings_semantic_v2
         # for demo: map every entity to a 'source' equal to ent.get('source_query')
         # In your implementation, resolve source to NAMASTE code (NOT display)
         src_display = ent.get('source_query')
         # find src code by display
-        src_code = None
-        # search in CodeSystem
-        codesystem = json.loads(Path('namaste-combined-codesystem.json').read_text())
-        for c in codesystem.get('concept', []):
-            if c.get('display') and src_display and c.get('display').lower() == src_display.lower():
-                src_code = c.get('code'); break
+        src_code = by_display.get(src_display.lower()) if src_display else None
         if not src_code:
             continue
         # append mapping
@@ -38,10 +51,48 @@ def merge_entities_into_conceptmap(entities):
             group.setdefault('element', []).append(el)
             element_map[src_code] = el
         # check duplicate target
-        if not any(t.get('code') == icd_uri for t in el.get('target', [])):
-            el.setdefault('target', []).append({'code': icd_uri, 'display': ent.get('label',''), 'equivalence': 'relatedTo'})
+        target = next((t for t in el.get('target', []) if t.get('code') == icd_uri), None)
+        if target is None:
+            el.setdefault('target', []).append({'code': icd_uri, 'display': ent.get('label',''), 'equivalence': 'relatedto',
+                                                'extension': [dict(SYNC_EXTENSION)]})
             added += 1
+        elif refresh:
+            # a changed entity keeps its target, with the current label
+            target['display'] = ent.get('label', target.get('display', ''))
+    return added
+
+def _remove_targets(group, uris):
+    # only the targets a sync added, never curated mappings
+    removed = 0
+    for el in group.get('element', []):
+        targets = [t for t in el.get('target', []) if t.get('code') not in uris or not _is_synced(t)]
+        removed += len(el.get('target', [])) - len(targets)
+        el['target'] = targets
+    return removed
+
+def _save(cm):
     # backup
     shutil.copy(CONCEPTMAP_PATH, BACKUP_DIR / f"conceptmap_backup_{int(time.time())}.json")
     Path(CONCEPTMAP_PATH).write_text(json.dumps(cm, ensure_ascii=False, indent=2))
+
+def merge_entities_into_conceptmap(entities):
+    cm = json.loads(CONCEPTMAP_PATH.read_text())
+    # assume one group, source = namaste codesystem
+    _upgrade_synced(cm['group'][0])
+    added = _add_targets(cm['group'][0], entities)
+    _save(cm)
     return added
+
+def merge_sync_changes(changes_path, since=0):
+    """Apply the delta-sync change records after seq `since` (see who_delta); returns counts and the last seq."""
+    cm = json.loads(CONCEPTMAP_PATH.read_text())
+    group = cm['group'][0]
+    result = {"added": 0, "removed": 0, "seq": since}
+    _upgrade_synced(group)
+    for record in read_changes(changes_path, since):
+        result["removed"] += _remove_targets(group, {_icd_uri({'id': k}) for k in record["removed"]})
+        result["added"] += _add_targets(group, record["added"] + record["changed"], refresh=True)
+        result["seq"] = record["seq"]
+    if result["seq"] != since:
+        _save(cm)
+    return result
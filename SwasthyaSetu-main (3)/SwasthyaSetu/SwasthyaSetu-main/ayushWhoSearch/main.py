@@ -1,13 +1,12 @@
 
 
 # sih/ayush/app.py  (full file)
-import os, json, uuid, logging
+import os, sys, json, uuid, logging
 from fastapi import FastAPI, Body, Depends, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
-import pandas as pd
-from rapidfuzz import fuzz
+import numpy as np
 from typing import List, Dict, Optional, Any
 from datetime import datetime, timedelta
 import jwt
@@ -21,6 +20,10 @@ import requests
 # from app_ import who_client
 # from search_utils import fuzzy_search_with_explain
 # from app_.translate_utils import translate_ayush_code
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from mapping_store import get_store
+from query_planner import fuzzy_mask, tokenize
+from search_cache import search_cache
 API_PREFIX = os.getenv("API_PREFIX", "")
 
 # configure logging
@@ -67,18 +70,51 @@ BASE_DIR = os.path.dirname(__file__)
 CSV_PATH = os.path.join(BASE_DIR, "candidate_mappings_semantic_v2.csv")
 
 try:
-    df = pd.read_csv(CSV_PATH)
-    # Preprocess lowercase columns for fuzzy matching
-    df["AYUSH_Term_lower"] = df["AYUSH_Term"].str.lower()
-    df["WHO_Term_lower"] = df["WHO_Term_Candidate"].str.lower()
-    print(f"✅ Loaded {len(df)} mappings from CSV")
+    # shared columnar store: categorical strings, float32 scores and the n-gram term indexes
+    store = get_store(CSV_PATH)
+    print(f"✅ Loaded {len(store)} mappings from CSV")
 except Exception as e:
     print(f"❌ Error loading CSV: {e}")
-    df = pd.DataFrame()
+    store = None
 
-def fuzzy_match(term: str, candidates: pd.Series, threshold: int = 80) -> pd.Series:
-    """Return boolean mask where term matches candidate fuzzily above threshold."""
-    return candidates.apply(lambda x: fuzz.partial_ratio(str(x).lower(), term.lower()) >= threshold)
+REPORT_COLUMNS = [
+    "AYUSH_Code", "AYUSH_Term", "Target_System",
+    "WHO_Code_Candidate", "WHO_Term_Candidate",
+    "Similarity_Score", "Suggested_Relationship"
+]
+PASSPORT_COLUMNS = [
+    "AYUSH_Code", "AYUSH_Term", "WHO_Code_Candidate",
+    "WHO_Term_Candidate", "Similarity_Score"
+]
+
+def fuzzy_match(store, term: str, threshold: int = 80) -> np.ndarray:
+    """Return boolean mask of rows where any word of term matches the AYUSH or WHO term above threshold."""
+    return fuzzy_mask(term, (store.ayush, store.who), threshold)
+
+def _cache_key(endpoint: str, term: str, store, threshold: int) -> str:
+    # masks only depend on the set of words, so "Fever cough" and "cough fever" share an entry
+    return search_cache.make_key(endpoint, " ".join(sorted(tokenize(term))), store.version, threshold=threshold)
+
+def find_mappings(term: str, threshold: int = 80) -> list:
+    """Ranked mapping records for a search term (cached)."""
+    # the current store (reloaded by get_store once the CSV is regenerated) names the cache key
+    store = get_store(CSV_PATH)
+    def compute():
+        mask = fuzzy_match(store, term, threshold)
+        # Include semantic matches (Similarity_Score >= 0.5)
+        semantic_mask = (store.similarity >= 0.5) & mask
+        # Rank by similarity score
+        rows = store.rank_by_similarity(np.flatnonzero(mask | semantic_mask))
+        return store.records(rows, REPORT_COLUMNS)
+    return search_cache.get_or_compute(_cache_key("search", term, store, threshold), compute)
+
+def related_mappings(condition: str, threshold: int = 70) -> list:
+    """Top 3 mappings related to a health-passport condition (cached)."""
+    store = get_store(CSV_PATH)
+    def compute():
+        rows = np.flatnonzero(fuzzy_match(store, condition, threshold))[:3]
+        return store.records(rows, PASSPORT_COLUMNS)
+    return search_cache.get_or_compute(_cache_key("passport", condition, store, threshold), compute)
 
 class ABHAAuthManager:
     """Handles ABHA OAuth authentication and token management"""
@@ -298,22 +334,13 @@ def root():
 @app.get("/search/{term}")
 def search_mappings(term: str, threshold: int = Query(default=80, ge=50, le=100)):
     """Search for AYUSH-WHO mappings using fuzzy matching"""
-    if df.empty:
+    if store is None:
         raise HTTPException(status_code=503, detail="Mapping database not available")
     
-    term_words = term.lower().split()
-    mask = pd.Series(False, index=df.index)
-    
-    # Check each word against AYUSH and WHO terms
-    for word in term_words:
-        mask |= fuzzy_match(word, df["AYUSH_Term_lower"], threshold)
-        mask |= fuzzy_match(word, df["WHO_Term_lower"], threshold)
+    # Check every word against AYUSH and WHO terms in one batched pass
+    mappings = find_mappings(term, threshold)
     
-    # Include semantic matches (Similarity_Score >= 0.5)
-    semantic_mask = (df["Similarity_Score"] >= 0.5) & mask
-    results = df[mask | semantic_mask].copy()
-    
-    if results.empty:
+    if not mappings:
         return {
             "query": term,
             "threshold": threshold,
@@ -321,19 +348,11 @@ def search_mappings(term: str, threshold: int = Query(default=80, ge=50, le=100)
             "suggestion": "Try lowering the threshold or using different search terms"
         }
     
-    # Rank by similarity score
-    results["rank_score"] = results["Similarity_Score"].fillna(0)
-    results = results.sort_values(by="rank_score", ascending=False)
-    
     return {
         "query": term,
         "threshold": threshold,
-        "total_results": len(results),
-        "mappings": results[[
-            "AYUSH_Code", "AYUSH_Term", "Target_System",
-            "WHO_Code_Candidate", "WHO_Term_Candidate",
-            "Similarity_Score", "Suggested_Relationship"
-        ]].to_dict(orient="records")
+        "total_results": len(mappings),
+        "mappings": mappings
     }
 
 # Endpoint to get a demo health passport (no authentication)
@@ -358,25 +377,11 @@ def get_demo_health_passport():
         enhanced_conditions = []
         for condition in health_passport["medical_history"]:
             # Search for related terms in mapping database
-            related_mappings = []
-            if not df.empty:
-                term_words = condition["condition"].lower().split()
-                mask = pd.Series(False, index=df.index)
-                
-                for word in term_words:
-                    mask |= fuzzy_match(word, df["AYUSH_Term_lower"], 70)
-                    mask |= fuzzy_match(word, df["WHO_Term_lower"], 70)
-                
-                results = df[mask].copy()
-                if not results.empty:
-                    related_mappings = results[[
-                        "AYUSH_Code", "AYUSH_Term", "WHO_Code_Candidate",
-                        "WHO_Term_Candidate", "Similarity_Score"
-                    ]].head(3).to_dict(orient="records")
+            semantic_mappings = related_mappings(condition["condition"]) if store is not None else []
             
             enhanced_conditions.append({
                 **condition,
-                "semantic_mappings": related_mappings
+                "semantic_mappings": semantic_mappings
             })
         
         return {
@@ -388,7 +393,7 @@ def get_demo_health_passport():
                 "medical_history": enhanced_conditions
             },
             "integration_info": {
-                "mapping_database": "loaded" if not df.empty else "unavailable",
+                "mapping_database": "loaded" if store is not None else "unavailable",
                 "semantic_search": "enabled",
                 "data_source": "dummy_generated",
                 "last_updated": datetime.now().isoformat(),
@@ -415,25 +420,11 @@ async def get_health_passport(current_user: dict = Depends(get_current_user)):
         enhanced_conditions = []
         for condition in health_passport["medical_history"]:
             # Search for related terms in mapping database
-            related_mappings = []
-            if not df.empty:
-                term_words = condition["condition"].lower().split()
-                mask = pd.Series(False, index=df.index)
-                
-                for word in term_words:
-                    mask |= fuzzy_match(word, df["AYUSH_Term_lower"], 70)
-                    mask |= fuzzy_match(word, df["WHO_Term_lower"], 70)
-                
-                results = df[mask].copy()
-                if not results.empty:
-                    related_mappings = results[[
-                        "AYUSH_Code", "AYUSH_Term", "WHO_Code_Candidate",
-                        "WHO_Term_Candidate", "Similarity_Score"
-                    ]].head(3).to_dict(orient="records")
+            semantic_mappings = related_mappings(condition["condition"]) if store is not None else []
             
             enhanced_conditions.append({
                 **condition,
-                "semantic_mappings": related_mappings
+                "semantic_mappings": semantic_mappings
             })
         
         return {
@@ -444,7 +435,7 @@ async def get_health_passport(current_user: dict = Depends(get_current_user)):
                 "medical_history": enhanced_conditions
             },
             "integration_info": {
-                "mapping_database": "loaded" if not df.empty else "unavailable",
+                "mapping_database": "loaded" if store is not None else "unavailable",
                 "semantic_search": "enabled",
                 "data_source": "dummy_generated",
                 "last_updated": datetime.now().isoformat()
@@ -469,9 +460,9 @@ def get_abha_status():
             "ready_for_production": credentials_configured
         },
         "mapping_database": {
-            "loaded": not df.empty,
-            "total_mappings": len(df) if not df.empty else 0,
-            "status": "operational" if not df.empty else "unavailable"
+            "loaded": store is not None,
+            "total_mappings": len(store) if store is not None else 0,
+            "status": "operational" if store is not None else "unavailable"
         },
         "api_endpoints": {
             "semantic_search": "/search/{term}",
@@ -508,9 +499,11 @@ def health_check():
         "timestamp": datetime.now().isoformat(),
         "services": {
             "api": "operational",
-            "semantic_search": "operational" if not df.empty else "degraded", 
+            "semantic_search": "operational" if store is not None else "degraded", 
             "abha_integration": "demo_mode" if not (ABHA_CONFIG["client_id"] and ABHA_CONFIG["client_secret"]) else "configured",
-            "database": "loaded" if not df.empty else "error"
+            "database": "loaded" if store is not None else "error"
         },
+        "search_cache": search_cache.stats(),
+        "mapping_store": store.stats() if store is not None else None,
         "environment": "sandbox" if "sbx" in ABHA_CONFIG["base_url"] else "production"
     }
\ No newline at end of file
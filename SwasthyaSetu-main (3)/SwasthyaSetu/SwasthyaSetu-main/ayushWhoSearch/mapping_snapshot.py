@@ -0,0 +1,190 @@
+"""
+Binary snapshot of a MappingStore, loaded with memory-mapped .npy files.
+
+`python -m mapping_snapshot [csv ...]` compiles a mapping CSV into a folder
+next to it (candidate_mappings_semantic_v2.csv -> candidate_mappings_semantic_v2.snapshot/)
+holding the categorical codes, the float32 scores, the pre-lowered interned
+terms and the n-gram postings of both term columns. get_store() picks the
+snapshot up automatically when its recorded source hash matches the CSV, so
+workers skip read_csv and the index build, and the numeric arrays are mapped
+read-only: every uvicorn worker on a host shares them through the page cache.
+
+Layout: manifest.json plus one .npy per array. Variable-length strings are
+stored as a single UTF-8 blob joined by \\x1f; postings as CSR (keys blob,
+int64 offsets, int32 ids).
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from ngram_index import IndexedColumn, NGramIndex
+from term_dictionary import TermDictionary
+
+SNAPSHOT_FORMAT = 1
+_SEP = "\x1f"
+
+
+def snapshot_path(csv_path) -> str:
+    return os.path.splitext(os.path.abspath(csv_path))[0] + ".snapshot"
+
+
+def _save(folder, name, array):
+    np.save(os.path.join(folder, name + ".npy"), np.ascontiguousarray(array))
+
+
+def _load(folder, name) -> np.ndarray:
+    path = os.path.join(folder, name + ".npy")
+    try:
+        return np.asarray(np.load(path, mmap_mode="r"))
+    except ValueError:
+        # numpy cannot map zero-length arrays
+        return np.load(path)
+
+
+def _save_strings(folder, name, strings):
+    blob = _SEP.join(strings)
+    if blob.count(_SEP) != max(len(strings) - 1, 0):
+        raise ValueError(f"{name}: strings may not contain the \\x1f separator")
+    _save(folder, name, np.frombuffer(blob.encode("utf-8"), dtype=np.uint8))
+
+
+def _load_strings(folder, name, count) -> list:
+    if count == 0:
+        return []
+    return _load(folder, name).tobytes().decode("utf-8").split(_SEP)
+
+
+def _save_postings(folder, name, postings, counts=False):
+    keys = list(postings)
+    arrays = [postings[k][0] if counts else postings[k] for k in keys]
+    lengths = np.fromiter((len(a) for a in arrays), dtype=np.int64, count=len(arrays))
+    _save_strings(folder, name + ".keys", keys)
+    _save(folder, name + ".offsets", np.concatenate(([0], np.cumsum(lengths))).astype(np.int64))
+    _save(folder, name + ".ids", np.concatenate(arrays).astype(np.int32) if arrays else np.zeros(0, np.int32))
+    if counts:
+        _save(folder, name + ".counts", np.concatenate([postings[k][1] for k in keys]).astype(np.int32)
+              if keys else np.zeros(0, np.int32))
+    return len(keys)
+
+
+def _load_postings(folder, name, count, counts=False) -> dict:
+    keys = _load_strings(folder, name + ".keys", count)
+    offsets = _load(folder, name + ".offsets")
+    # views into the mapped ids array, one per key
+    ids = np.split(_load(folder, name + ".ids"), offsets[1:-1])
+    if not counts:
+        return dict(zip(keys, ids))
+    return dict(zip(keys, zip(ids, np.split(_load(folder, name + ".counts"), offsets[1:-1]))))
+
+
+def _save_column(folder, prefix, column) -> dict:
+    dictionary, index = column.dictionary, column.index
+    _save_strings(folder, prefix + ".terms", dictionary.terms)
+    _save(folder, prefix + ".row_term_ids", dictionary.row_term_ids)
+    _save(folder, prefix + ".row_order", dictionary.row_order)
+    _save(folder, prefix + ".row_offsets", dictionary.row_offsets)
+    _save(folder, prefix + ".lengths", index.lengths)
+    meta = {"terms": len(dictionary.terms), "chars": _save_postings(folder, prefix + ".chars", index.char_postings, counts=True)}
+    for n in index.sizes:
+        meta[f"g{n}"] = _save_postings(folder, f"{prefix}.g{n}", index.postings[n])
+        _save(folder, f"{prefix}.g{n}.dups", index.duplicates[n])
+    return meta
+
+
+def _load_column(folder, prefix, meta, sizes, workers):
+    dictionary = TermDictionary.from_arrays(
+        _load_strings(folder, prefix + ".terms", meta["terms"]),
+        _load(folder, prefix + ".row_term_ids"),
+        _load(folder, prefix + ".row_order"),
+        _load(folder, prefix + ".row_offsets"),
+    )
+    index = NGramIndex.from_arrays(
+        sizes,
+        _load(folder, prefix + ".lengths"),
+        {n: _load_postings(folder, f"{prefix}.g{n}", meta[f"g{n}"]) for n in sizes},
+        {n: _load(folder, f"{prefix}.g{n}.dups") for n in sizes},
+        _load_postings(folder, prefix + ".chars", meta["chars"], counts=True),
+    )
+    return IndexedColumn.from_parts(dictionary, index, workers)
+
+
+def write_snapshot(store, source_sha1, folder=None) -> str:
+    """Write a MappingStore to a snapshot folder (atomically replaces an older one)."""
+    folder = folder or snapshot_path(store.path)
+    tmp = f"{folder}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "source": os.path.basename(store.path),
+        "source_sha1": source_sha1,
+        "rows": len(store),
+        "gram_sizes": list(store.ayush.index.sizes),
+        "columns": {},
+        "term_columns": {},
+    }
+    for name, cat in store.columns.items():
+        categories = [str(c) for c in cat.categories]
+        _save_strings(tmp, name + ".categories", categories)
+        _save(tmp, name + ".codes", cat.codes.astype(np.int32))
+        manifest["columns"][name] = len(categories)
+    _save(tmp, "scores", store.scores.astype(np.float32))
+    for prefix, column in (("ayush", store.ayush), ("who", store.who)):
+        manifest["term_columns"][prefix] = _save_column(tmp, prefix, column)
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(tmp, folder)
+    return folder
+
+
+def read_manifest(folder):
+    try:
+        with open(os.path.join(folder, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_snapshot(folder, source_sha1, workers=1):
+    """Arrays of a snapshot built from the CSV with this sha1, or None if missing/outdated."""
+    manifest = read_manifest(folder)
+    if manifest is None or manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("source_sha1") != source_sha1:
+        return None
+    sizes = tuple(manifest["gram_sizes"])
+    columns = {name: (_load(folder, name + ".codes"), _load_strings(folder, name + ".categories", count))
+               for name, count in manifest["columns"].items()}
+    return {
+        "rows": manifest["rows"],
+        "columns": columns,
+        "scores": _load(folder, "scores"),
+        "ayush": _load_column(folder, "ayush", manifest["term_columns"]["ayush"], sizes, workers),
+        "who": _load_column(folder, "who", manifest["term_columns"]["who"], sizes, workers),
+    }
+
+
+def main():
+    from mapping_store import MappingStore, file_digest
+
+    parser = argparse.ArgumentParser(description="Compile mapping CSVs into memory-mappable snapshots")
+    parser.add_argument("csv", nargs="*", default=["candidate_mappings_semantic_v2.csv",
+                                                   "data/candidate_mappings_semantic_v2.csv"])
+    args = parser.parse_args()
+    for csv_path in args.csv:
+        if not os.path.exists(csv_path):
+            print(f"⚠️ Skipping {csv_path}: not found")
+            continue
+        started = time.perf_counter()
+        store = MappingStore(csv_path)
+        folder = write_snapshot(store, file_digest(csv_path))
+        size = sum(os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder))
+        print(f"✅ {csv_path} -> {folder} ({len(store)} rows, {size / 2**20:.2f} MB, "
+              f"{time.perf_counter() - started:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+One shared, columnar copy of a candidate-mapping CSV per process.
+
+Every search/translate service used to read the same CSV into its own
+DataFrame and add its own lowercase columns. MappingStore loads it once per
+path (see get_store) and keeps:
+
+- string columns as pandas Categoricals (interned values + small int codes),
+- Similarity_Score as a float32 array,
+- IndexedColumns (term dictionary + n-gram index) for AYUSH_Term and
+  WHO_Term_Candidate, used by the fuzzy matchers.
+
+When a matching binary snapshot exists next to the CSV (see mapping_snapshot)
+the store is memory-mapped from it instead of parsing the CSV. Set
+MAPPING_SNAPSHOT=0 to always load from CSV.
+"""
+import hashlib
+import os
+import threading
+import time
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from mapping_snapshot import load_snapshot, snapshot_path
+from ngram_index import IndexedColumn
+from search_cache import data_version, search_cache
+
+STRING_COLUMNS = ["AYUSH_Code", "AYUSH_Term", "Target_System", "WHO_Code_Candidate",
+                  "WHO_Term_Candidate", "Suggested_Relationship"]
+MAPPING_COLUMNS = ["AYUSH_Code", "AYUSH_Term", "Target_System", "WHO_Code_Candidate",
+                   "WHO_Term_Candidate", "Similarity_Score", "Suggested_Relationship"]
+# the generator writes scores rounded to 4 decimals, so float32 storage round-trips exactly
+SCORE_DECIMALS = 4
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "1"))
+USE_SNAPSHOT = os.getenv("MAPPING_SNAPSHOT", "1") != "0"
+
+
+class MappingStore:
+    def __init__(self, path, digest=None):
+        """Load from the snapshot built for a CSV with this sha1 digest if there is one, else from the CSV."""
+        started = time.perf_counter()
+        self.path = os.path.abspath(path)
+        self.version = data_version(self.path)
+        self._ranges = {}
+        snapshot = None
+        if digest is not None and USE_SNAPSHOT:
+            snapshot = load_snapshot(snapshot_path(self.path), digest, SEARCH_WORKERS)
+        self.source = "csv" if snapshot is None else "snapshot"
+        if snapshot is None:
+            self._init_columns(pd.read_csv(self.path, dtype=str).fillna(""))
+        else:
+            self._init_snapshot(snapshot)
+        self.load_seconds = time.perf_counter() - started
+
+    def _init_columns(self, frame):
+        self.size = len(frame)
+        self.columns = {name: pd.Categorical(frame[name]) for name in STRING_COLUMNS if name in frame}
+        self.scores = pd.to_numeric(frame.get("Similarity_Score", 0), errors="coerce").fillna(0).to_numpy(np.float32)
+        self.ayush = IndexedColumn(frame["AYUSH_Term"], workers=SEARCH_WORKERS)
+        self.who = IndexedColumn(frame["WHO_Term_Candidate"], workers=SEARCH_WORKERS)
+
+    def _init_snapshot(self, snapshot):
+        self.size = snapshot["rows"]
+        self.columns = {name: pd.Categorical.from_codes(codes, categories=categories)
+                        for name, (codes, categories) in snapshot["columns"].items()}
+        self.scores = snapshot["scores"]
+        self.ayush = snapshot["ayush"]
+        self.who = snapshot["who"]
+
+    def __len__(self):
+        return self.size
+
+    @cached_property
+    def similarity(self) -> np.ndarray:
+        """Similarity_Score as float64, identical to what read_csv produces."""
+        return np.round(self.scores.astype(np.float64), SCORE_DECIMALS)
+
+    @cached_property
+    def _categories(self):
+        return {name: np.asarray(cat.categories, dtype=object) for name, cat in self.columns.items()}
+
+    def column(self, name, rows=None) -> np.ndarray:
+        """Values of one column (object array of str, or float64 scores), optionally for some rows."""
+        if name == "Similarity_Score":
+            values = self.similarity
+            return values if rows is None else values[rows]
+        codes = self.columns[name].codes
+        return self._categories[name][codes if rows is None else codes[rows]]
+
+    def value(self, name, row: int):
+        if name == "Similarity_Score":
+            return float(self.similarity[row])
+        return self._categories[name][self.columns[name].codes[row]]
+
+    def _row_ranges(self, name):
+        """(order, starts): rows of category c are order[starts[c]:starts[c + 1]], ascending."""
+        ranges = self._ranges.get(name)
+        if ranges is None:
+            codes = self.columns[name].codes
+            order = np.argsort(codes, kind="stable")
+            starts = np.searchsorted(codes[order], np.arange(len(self.columns[name].categories) + 1))
+            ranges = self._ranges[name] = (order.astype(np.int64), starts)
+        return ranges
+
+    def rows_equal(self, name, value) -> np.ndarray:
+        """Rows whose column equals value, as one slice of the code -> row-range index."""
+        return self.rows_equal_many(name, [value])[0]
+
+    def rows_equal_many(self, name, values) -> list:
+        """rows_equal for every value, resolved with one vectorized category lookup."""
+        order, starts = self._row_ranges(name)
+        positions = self.columns[name].categories.get_indexer(list(values))
+        empty = np.zeros(0, dtype=np.int64)
+        return [order[starts[i]:starts[i + 1]] if i >= 0 else empty for i in positions.tolist()]
+
+    def records(self, rows, columns=MAPPING_COLUMNS) -> list:
+        """Rows as a list of dicts, like DataFrame.to_dict(orient="records")."""
+        rows = np.asarray(rows, dtype=np.int64)
+        values = [self.column(name, rows).tolist() for name in columns]
+        return [dict(zip(columns, row)) for row in zip(*values)]
+
+    def rank_by_similarity(self, rows) -> np.ndarray:
+        """rows ordered by Similarity_Score descending, in the same order DataFrame.sort_values gives."""
+        rows = np.asarray(rows, dtype=np.int64)
+        order = pd.Series(self.similarity[rows]).sort_values(ascending=False).index.to_numpy()
+        return rows[order]
+
+    def memory_bytes(self) -> int:
+        total = self.scores.nbytes
+        for cat in self.columns.values():
+            total += cat.codes.nbytes + int(cat.categories.memory_usage(deep=True))
+        return total + self.ayush.memory_bytes() + self.who.memory_bytes()
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "rows": self.size,
+            "version": self.version,
+            "source": self.source,
+            "load_seconds": round(self.load_seconds, 4),
+            "memory_mb": round(self.memory_bytes() / 2**20, 2),
+        }
+
+
+_stores = {}
+_stores_by_digest = {}
+_stores_lock = threading.Lock()
+
+
+def file_digest(path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def get_store(path) -> MappingStore:
+    """The process-wide MappingStore for a CSV path, loading it on first use.
+
+    Services ship their own copies of the same CSV (ayushWhoSearch, the
+    passport service, predictive_analytics_sih/data), so byte-identical files
+    share one store as well. A regenerated CSV (new data_version) is loaded
+    again on the next call; callers that cache results should get the store
+    per request and key on its version.
+    """
+    key = os.path.abspath(path)
+    version = data_version(key)
+    with _stores_lock:
+        store, loaded_version = _stores.get(key, (None, None))
+        if store is None or loaded_version != version:
+            digest = file_digest(key)
+            fresh = _stores_by_digest.get(digest)
+            if fresh is None:
+                fresh = _stores_by_digest[digest] = MappingStore(key, digest)
+            _stores[key] = (fresh, version)
+            if store is not None and store is not fresh and all(s is not store for s, _ in _stores.values()):
+                _stores_by_digest.pop(next(d for d, s in _stores_by_digest.items() if s is store), None)
+            store = fresh
+            # cached search results are dropped when this file is regenerated
+            search_cache.watch(key)
+    return store
+
+
+def loaded_stores() -> list:
+    return [store.stats() for store in _stores_by_digest.values()]
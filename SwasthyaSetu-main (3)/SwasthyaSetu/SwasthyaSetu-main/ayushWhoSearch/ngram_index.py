@@ -0,0 +1,226 @@
+"""
+In-memory n-gram inverted index used to shortlist terms before rapidfuzz scoring.
+
+The shortlist is exact for fuzz.partial_ratio: a term is only dropped when the
+q-gram lemma proves it cannot reach the threshold. partial_ratio >= T allows
+at most (1-T) edits per aligned character, and every edit destroys a bounded
+number of the needle's n-grams, so any term scoring >= T must share at least
+`required` distinct n-grams with the query. When that bound is not positive
+for any gram size (short queries, low thresholds) only the character-bag bound
+below is applied, so recall always matches full scoring.
+
+The character bag gives a second, independent bound: an alignment cannot match
+more characters than the two strings have in common (as multisets), so with
+m common characters and a needle of length n, partial_ratio <= 2m / (n + m).
+"""
+from collections import Counter, defaultdict
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from term_dictionary import TermDictionary
+
+GRAM_SIZES = (3, 2)
+_EPS = 1e-9
+
+
+def _grams(text: str, n: int):
+    return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+
+def _max_destroyed(length, n, threshold):
+    """Upper bound on needle n-grams broken by an alignment scoring >= threshold (0..1).
+
+    Works on scalars and NumPy arrays. The bound is linear in the window length,
+    so it is the larger of the full-window case and the shortest edge window.
+    """
+    t = threshold - _EPS
+    full_window = (2 * n - 1) * (1 - t) * length
+    short_window = n * length * 2 * (1 - t) / (2 - t)
+    return np.floor(np.maximum(full_window, short_window) + _EPS)
+
+
+class NGramIndex:
+    """Inverted index of distinct n-grams -> term positions, for each size in GRAM_SIZES."""
+
+    def __init__(self, terms, sizes=GRAM_SIZES):
+        self.sizes = tuple(sorted(sizes, reverse=True))
+        self.size = len(terms)
+        self.lengths = np.fromiter((len(t) for t in terms), dtype=np.int32, count=self.size)
+        self.postings = {}
+        self.duplicates = {}
+        chars = defaultdict(lambda: ([], []))
+        for pos, term in enumerate(terms):
+            for ch, k in Counter(term).items():
+                chars[ch][0].append(pos)
+                chars[ch][1].append(k)
+        self.char_postings = {ch: (np.asarray(ids, dtype=np.int32), np.asarray(counts, dtype=np.int32))
+                              for ch, (ids, counts) in chars.items()}
+        for n in self.sizes:
+            postings = defaultdict(list)
+            dups = np.zeros(self.size, dtype=np.int32)
+            for pos, term in enumerate(terms):
+                grams = _grams(term, n)
+                distinct = set(grams)
+                dups[pos] = len(grams) - len(distinct)
+                for g in distinct:
+                    postings[g].append(pos)
+            self.postings[n] = {g: np.asarray(p, dtype=np.int32) for g, p in postings.items()}
+            self.duplicates[n] = dups
+
+    @classmethod
+    def from_arrays(cls, sizes, lengths, postings, duplicates, char_postings):
+        """Rebuild from previously computed postings (e.g. memory-mapped from a snapshot)."""
+        self = cls.__new__(cls)
+        self.sizes = tuple(sizes)
+        self.size = len(lengths)
+        self.lengths = lengths
+        self.postings = postings
+        self.duplicates = duplicates
+        self.char_postings = char_postings
+        return self
+
+    def memory_bytes(self) -> int:
+        """Approximate size of the index arrays (posting dict overhead not included)."""
+        total = self.lengths.nbytes + sum(ids.nbytes + counts.nbytes for ids, counts in self.char_postings.values())
+        for n in self.sizes:
+            total += self.duplicates[n].nbytes + sum(p.nbytes for p in self.postings[n].values())
+        return total
+
+    def _required(self, length, dups, n, threshold):
+        return (length - n + 1) - _max_destroyed(length, n, threshold) - dups
+
+    def _bag_mask(self, query, threshold):
+        common = np.zeros(self.size, dtype=np.float64)
+        for ch, k in Counter(query).items():
+            if ch in self.char_postings:
+                ids, counts = self.char_postings[ch]
+                common += np.bincount(ids, weights=np.minimum(counts, k), minlength=self.size)
+        needle = np.minimum(self.lengths, len(query))
+        matched = np.minimum(common, needle)
+        upper = 2 * matched / np.maximum(needle + matched, 1)
+        return upper >= threshold - _EPS
+
+    def _gram_mask(self, query, threshold):
+        qlen = len(query)
+        for n in self.sizes:
+            grams = _grams(query, n)
+            distinct = set(grams)
+            req_query = self._required(qlen, len(grams) - len(distinct), n, threshold)
+            if req_query < 1:
+                continue
+            hits = [self.postings[n][g] for g in distinct if g in self.postings[n]]
+            counts = np.bincount(np.concatenate(hits), minlength=self.size) if hits else np.zeros(self.size, dtype=np.int64)
+            # partial_ratio slides the shorter string over the longer one, so terms
+            # shorter than the query are the needle and need their own bound
+            req_term = self._required(self.lengths, self.duplicates[n], n, threshold)
+            required = np.where(self.lengths > qlen, req_query,
+                                np.where(self.lengths < qlen, req_term, np.minimum(req_term, req_query)))
+            return counts >= required
+        return None
+
+    def candidates(self, query: str, threshold: float):
+        """Sorted positions of terms that may reach partial_ratio >= threshold (0..100), or None."""
+        t = threshold / 100
+        if not query or t <= 0:
+            return None
+        mask = self._bag_mask(query, t)
+        grams = self._gram_mask(query, t)
+        if grams is not None:
+            mask &= grams
+        return np.flatnonzero(mask)
+
+
+class IndexedColumn:
+    """A lower-cased term column: interned unique terms plus their n-gram index.
+
+    Scoring runs once per distinct term and is fanned out to rows afterwards.
+    """
+
+    def __init__(self, values, workers=1):
+        self.dictionary = TermDictionary(values)
+        self.index = NGramIndex(self.dictionary.terms)
+        self.workers = workers
+
+    @classmethod
+    def from_parts(cls, dictionary, index, workers=1):
+        self = cls.__new__(cls)
+        self.dictionary = dictionary
+        self.index = index
+        self.workers = workers
+        return self
+
+    def __len__(self):
+        return self.dictionary.num_rows
+
+    def term(self, row: int) -> str:
+        return self.dictionary.term_of_row(row)
+
+    def memory_bytes(self) -> int:
+        return self.dictionary.memory_bytes() + self.index.memory_bytes()
+
+    def term_scores(self, query: str, min_score: float = 0) -> np.ndarray:
+        """partial_ratio (0..100) per unique term; NaN where the index proved score < min_score."""
+        terms = self.dictionary.terms
+        cand = self.index.candidates(query, min_score)
+        if cand is None:
+            return self._cdist(query, terms)
+        out = np.full(len(terms), np.nan)
+        out[cand] = self._cdist(query, [terms[i] for i in cand])
+        return out
+
+    def scores(self, query: str, min_score: float = 0) -> np.ndarray:
+        """Row-level partial_ratio scores, see term_scores."""
+        return self.dictionary.fan_out(self.term_scores(query, min_score))
+
+    def match(self, query: str, threshold: float) -> np.ndarray:
+        """Boolean row mask of terms with partial_ratio >= threshold."""
+        return self.scores(query, threshold) >= threshold
+
+    def shortlists(self, queries, threshold: float) -> list:
+        """Per query, the positions of the unique terms it may reach partial_ratio >= threshold with."""
+        n = len(self.dictionary.terms)
+        out = []
+        for q in queries:
+            cand = self.index.candidates(q, threshold)
+            out.append(np.arange(n) if cand is None else cand)
+        return out
+
+    def match_any(self, queries, threshold: float) -> np.ndarray:
+        """Row mask of terms where any of the queries reaches partial_ratio >= threshold.
+
+        Each query is paired only with its own shortlist and all (query, term)
+        pairs are scored in a single cpdist call.
+        """
+        return match_any_columns(queries, [self], threshold)[0]
+
+    def _cdist(self, query, terms):
+        if not terms:
+            return np.zeros(0, dtype=np.float64)
+        return process.cdist([query], terms, scorer=fuzz.partial_ratio, dtype=np.float64, workers=self.workers)[0]
+
+
+def match_any_columns(queries, columns, threshold: float) -> list:
+    """match_any over several IndexedColumns, with every (query, term) pair of all of them in one cpdist call.
+
+    A term present in more than one column is scored once per query.
+    """
+    term_masks = [np.zeros(len(c.dictionary.terms), dtype=bool) for c in columns]
+    if queries:
+        pairs = {}
+        slots = []
+        for column in columns:
+            terms = column.dictionary.terms
+            positions, pair_ids = [], []
+            for q, cand in zip(queries, column.shortlists(queries, threshold)):
+                positions.append(cand)
+                pair_ids.extend(pairs.setdefault((q, terms[i]), len(pairs)) for i in cand)
+            slots.append((np.concatenate(positions), np.array(pair_ids, dtype=np.intp)))
+        if pairs:
+            scores = process.cpdist([q for q, _ in pairs], [t for _, t in pairs], scorer=fuzz.partial_ratio,
+                                    dtype=np.float64, score_cutoff=threshold,
+                                    workers=max(c.workers for c in columns))
+            hit = scores >= threshold
+            for term_mask, (positions, pair_ids) in zip(term_masks, slots):
+                term_mask[positions[hit[pair_ids]]] = True
+    return [c.dictionary.fan_out(m) for c, m in zip(columns, term_masks)]
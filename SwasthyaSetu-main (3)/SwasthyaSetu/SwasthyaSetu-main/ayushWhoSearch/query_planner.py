@@ -0,0 +1,27 @@
+"""
+Query planning for the word-by-word fuzzy searches (/search/{term}, semantic
+search, health-passport condition lookups).
+
+The term is tokenized once and repeated words are dropped. The n-gram index
+of each column shortlists, per token, the unique terms it may match; the
+(token, term) pairs of all columns are de-duplicated (a term present in both
+columns is scored once) and scored in a single batched cpdist call, and the
+per-column masks are OR-ed together.
+"""
+import numpy as np
+
+from ngram_index import match_any_columns
+
+
+def tokenize(term: str):
+    """Lower-cased, de-duplicated words of a query, in first-seen order."""
+    return list(dict.fromkeys(term.lower().split()))
+
+
+def fuzzy_mask(term: str, columns, threshold: float = 80) -> np.ndarray:
+    """Row mask where any word of `term` fuzzily matches any of the IndexedColumns."""
+    tokens = tokenize(term)
+    mask = np.zeros(len(columns[0]), dtype=bool)
+    for column_mask in match_any_columns(tokens, columns, threshold):
+        mask |= column_mask
+    return mask
@@ -0,0 +1,213 @@
+"""
+Search-result cache shared by every search endpoint in the process.
+
+Keys are built from the endpoint name, the normalized query, its parameters
+and the version of the mapping CSV the results were computed from, so results
+from an older CSV are never served. Entries are evicted by size (LRU) and age
+(TTL). The cache also watches the CSV files it was told about and drops its
+local entries as soon as one of them is regenerated.
+
+Backends (SEARCH_CACHE_URL):
+    unset              in-process LRU (default)
+    sqlite:///path.db  file shared by all workers on one host
+    redis://host:6379  Redis, shared across hosts (needs the `redis` package)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "4096"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))
+SEARCH_CACHE_URL = os.getenv("SEARCH_CACHE_URL", "")
+SOURCE_CHECK_INTERVAL = 1.0
+
+
+def data_version(path) -> str:
+    """Cheap version stamp of a data file (mtime + size); 'missing' if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "missing"
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+class MemoryBackend:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteBackend:
+    """Cross-worker cache in a local SQLite file (a stand-in for Redis on a single host)."""
+
+    def __init__(self, path, maxsize, ttl):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS search_cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute("SELECT value, expires FROM search_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?)",
+                         (key, json.dumps(value), time.time() + self.ttl))
+            conn.execute("DELETE FROM search_cache WHERE expires < ?", (time.time(),))
+            cur = conn.execute("DELETE FROM search_cache WHERE key NOT IN "
+                               "(SELECT key FROM search_cache ORDER BY expires DESC LIMIT ?)", (self.maxsize,))
+            self.evictions += cur.rowcount
+
+    def clear(self):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM search_cache")
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+
+
+class RedisBackend:
+    def __init__(self, url, ttl, prefix="ayush-search:"):
+        import redis  # optional dependency, only needed for this backend
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.evictions = 0
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value):
+        self.client.setex(self.prefix + key, int(self.ttl), json.dumps(value))
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(self.prefix + "*"))
+
+
+def make_backend(url=SEARCH_CACHE_URL, maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL):
+    if url.startswith("sqlite:///"):
+        return SqliteBackend(url[len("sqlite:///"):], maxsize, ttl)
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBackend(url, ttl)
+    return MemoryBackend(maxsize, ttl)
+
+
+class SearchCache:
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else MemoryBackend(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._sources = {}
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def watch(self, path) -> str:
+        """Track a data file; local entries are dropped when it changes. Returns its current version."""
+        version = data_version(path)
+        # _check_sources iterates the dict under the same lock
+        with self._lock:
+            self._sources[os.path.abspath(path)] = version
+        return version
+
+    def _check_sources(self):
+        now = time.monotonic()
+        if now - self._last_check < SOURCE_CHECK_INTERVAL:
+            return
+        with self._lock:
+            self._last_check = now
+            changed = False
+            for path, version in self._sources.items():
+                current = data_version(path)
+                if current != version:
+                    self._sources[path] = current
+                    changed = True
+            if changed:
+                self.backend.clear()
+                self.invalidations += 1
+
+    @staticmethod
+    def make_key(endpoint, query, version, **params) -> str:
+        parts = [endpoint, query, version] + [f"{k}={params[k]}" for k in sorted(params)]
+        return "|".join(str(p) for p in parts)
+
+    def get_or_compute(self, key, compute):
+        self._check_sources()
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = compute()
+        self.backend.set(key, value)
+        return value
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.backend.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+search_cache = SearchCache(make_backend())
@@ -1,45 +1,71 @@
-import pandas as pd
+import numpy as np
 from rapidfuzz import fuzz
-from functools import lru_cache
+from mapping_store import get_store
+from search_cache import search_cache
 
 CSV = "./data/candidate_mappings_semantic_v2.csv"
-df = pd.read_csv(CSV, dtype=str).fillna("")
-df["AYUSH_Term_lower"] = df["AYUSH_Term"].str.lower()
-df["WHO_Term_lower"] = df["WHO_Term_Candidate"].str.lower()
-df["Similarity_Score"] = pd.to_numeric(df.get("Similarity_Score", 0), errors="coerce").fillna(0)
+
+
+def current_store():
+    """Shared with app_/translate_utils (same CSV); reloaded by get_store once the CSV is regenerated."""
+    return get_store(CSV)
+
+current_store()  # load at import, as before
 
 def get_confidence_label(score: float) -> str:
     if score >= 0.8: return "High Match"
     elif score >= 0.6: return "Medium Match"
     return "Low Match"
 
-@lru_cache(maxsize=1024)
 def cached_search(query: str, top_k: int = 20, min_similarity: float = 0.5):
-    return fuzzy_search_with_explain(query, top_k, min_similarity)
+    # key and results come from the same store, so they always name the same CSV version
+    store = current_store()
+    key = search_cache.make_key("explain", query.lower(), store.version, top_k=top_k, min_similarity=min_similarity)
+    return search_cache.get_or_compute(key, lambda: fuzzy_search_with_explain(query, top_k, min_similarity, store))
+
+def rank_top_k(combined: np.ndarray, min_similarity: float, top_k: int) -> np.ndarray:
+    """Row indices passing min_similarity, best first; ties keep CSV order (same as a stable sort)."""
+    idx = np.flatnonzero(combined >= min_similarity)
+    if 0 < top_k < len(idx):
+        scores = combined[idx]
+        kth = scores[np.argpartition(-scores, top_k - 1)[top_k - 1]]
+        idx = idx[scores >= kth]
+    order = idx[np.argsort(-combined[idx], kind="stable")]
+    return order[:top_k]
+
+def _explain_score(scores, i, q, column):
+    # rows the index pruned in one column still need their exact score for the explain payload
+    if np.isnan(scores[i]):
+        return fuzz.partial_ratio(q, column.term(i))/100
+    return float(scores[i])
 
-def fuzzy_search_with_explain(query, top_k=20, min_similarity=0.5):
+def fuzzy_search_with_explain(query, top_k=20, min_similarity=0.5, store=None):
+    store = store if store is not None else current_store()
     q = query.lower()
+    similarity = store.similarity
+    max_similarity = float(similarity.max()) if len(similarity) else 0.0
+    # rows can only pass min_similarity if their best fuzzy score reaches this cutoff
+    min_fuzzy = max(0.0, (min_similarity - max_similarity * 0.4) / 0.6 * 100 - 1e-6)
+    fuzzy_ayush = store.ayush.scores(q, min_fuzzy) / 100
+    fuzzy_who = store.who.scores(q, min_fuzzy) / 100
+    combined = np.fmax(fuzzy_ayush, fuzzy_who) * 0.6 + similarity * 0.4
     results = []
-    for i, row in df.iterrows():
-        ayush = row["AYUSH_Term_lower"]
-        who = row["WHO_Term_lower"]
-        score_fuzzy_ayush = fuzz.partial_ratio(q, ayush)/100
-        score_fuzzy_who = fuzz.partial_ratio(q, who)/100
-        sim = float(row.get("Similarity_Score", 0))
-        combined = max(score_fuzzy_ayush, score_fuzzy_who) * 0.6 + sim * 0.4
-        if combined >= min_similarity:
-            results.append({
-                "AYUSH_Code": row.get("AYUSH_Code"),
-                "AYUSH_Term": row.get("AYUSH_Term"),
-                "WHO_Code": row.get("WHO_Code_Candidate"),
-                "WHO_Term": row.get("WHO_Term_Candidate"),
-                "similarity": sim,
-                "fuzzy_ayush": score_fuzzy_ayush,
-                "fuzzy_who": score_fuzzy_who,
-                "combined": combined,
-                "confidence": get_confidence_label(combined),
-                "relationship": row.get("Suggested_Relationship"),
-                "explain": {"fuzzy_ayush": score_fuzzy_ayush, "fuzzy_who": score_fuzzy_who, "semantic": sim}
-            })
-    results = sorted(results, key=lambda x: x["combined"], reverse=True)[:top_k]
+    for i in rank_top_k(combined, min_similarity, top_k):
+        score_fuzzy_ayush = _explain_score(fuzzy_ayush, i, q, store.ayush)
+        score_fuzzy_who = _explain_score(fuzzy_who, i, q, store.who)
+        sim = float(similarity[i])
+        score = float(combined[i])
+        results.append({
+            "AYUSH_Code": store.value("AYUSH_Code", i),
+            "AYUSH_Term": store.value("AYUSH_Term", i),
+            "WHO_Code": store.value("WHO_Code_Candidate", i),
+            "WHO_Term": store.value("WHO_Term_Candidate", i),
+            "similarity": sim,
+            "fuzzy_ayush": score_fuzzy_ayush,
+            "fuzzy_who": score_fuzzy_who,
+            "combined": score,
+            "confidence": get_confidence_label(score),
+            "relationship": store.value("Suggested_Relationship", i),
+            "explain": {"fuzzy_ayush": score_fuzzy_ayush, "fuzzy_who": score_fuzzy_who, "semantic": sim}
+        })
     return results
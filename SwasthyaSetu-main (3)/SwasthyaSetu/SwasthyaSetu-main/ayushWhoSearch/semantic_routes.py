@@ -1,38 +1,34 @@
 # sih/ayush/semantic_routes.py
-import pandas as pd
-from rapidfuzz import fuzz
+import numpy as np
 from fastapi import APIRouter
+from mapping_store import MAPPING_COLUMNS, get_store
+from query_planner import fuzzy_mask, tokenize
+from search_cache import search_cache
 
 router = APIRouter(prefix="/semantic", tags=["Semantic Search"])
 
-# Load CSV once at startup
-df = pd.read_csv("candidate_mappings_semantic_v2.csv")
-df["AYUSH_Term_lower"] = df["AYUSH_Term"].str.lower()
-df["WHO_Term_lower"] = df["WHO_Term_Candidate"].str.lower()
+# Load CSV once at startup (and again when it is regenerated, see get_store)
+CSV_PATH = "candidate_mappings_semantic_v2.csv"
+# shared with main.py when both run in one process (same CSV -> same store)
+get_store(CSV_PATH)
 
-def fuzzy_match(term: str, candidates: pd.Series, threshold: int = 80) -> pd.Series:
-    return candidates.apply(lambda x: fuzz.partial_ratio(str(x).lower(), term.lower()) >= threshold)
+def fuzzy_match(store, term: str, threshold: int = 80) -> np.ndarray:
+    # all words of the term are scored against both columns in one batched pass
+    return fuzzy_mask(term, (store.ayush, store.who), threshold)
 
-@router.get("/search/{term}")
-def search(term: str):
-    term_words = term.lower().split()
-    mask = pd.Series(False, index=df.index)
+def _search(store, term: str) -> list:
+    mask = fuzzy_match(store, term)
     
-    for word in term_words:
-        mask |= fuzzy_match(word, df["AYUSH_Term_lower"])
-        mask |= fuzzy_match(word, df["WHO_Term_lower"])
+    semantic_mask = (store.similarity >= 0.5) & mask
+    rows = store.rank_by_similarity(np.flatnonzero(mask | semantic_mask))
     
-    semantic_mask = (df["Similarity_Score"] >= 0.5) & mask
-    results = df[mask | semantic_mask].copy()
-    
-    if results.empty:
+    return store.records(rows, MAPPING_COLUMNS)
+
+@router.get("/search/{term}")
+def search(term: str):
+    store = get_store(CSV_PATH)
+    key = search_cache.make_key("semantic", " ".join(sorted(tokenize(term))), store.version, threshold=80)
+    records = search_cache.get_or_compute(key, lambda: _search(store, term))
+    if not records:
         return {"message": f"No matches found for '{term}'"}
-    
-    results["rank_score"] = results["Similarity_Score"].fillna(0)
-    results = results.sort_values(by="rank_score", ascending=False)
-    
-    return results[[
-        "AYUSH_Code", "AYUSH_Term", "Target_System",
-        "WHO_Code_Candidate", "WHO_Term_Candidate",
-        "Similarity_Score", "Suggested_Relationship"
-    ]].to_dict(orient="records")
+    return records
@@ -0,0 +1,70 @@
+"""
+Interned term dictionary for a mapping-table column.
+
+candidate_mappings_semantic_v2.csv repeats every AYUSH term once per candidate
+and WHO terms across thousands of rows. TermDictionary stores each distinct
+string once, keeps the row -> term id array, and a CSR-style posting list of
+rows per term so scores computed per unique term can be fanned back out to rows.
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+class TermDictionary:
+    def __init__(self, values):
+        lowered = [str(x).lower() for x in values]
+        codes, uniques = pd.factorize(pd.Series(lowered, dtype=object), sort=False)
+        self.terms = [str(t) for t in uniques]
+        self.row_term_ids = codes.astype(np.int32)
+        # rows grouped by term id: rows of term t are row_order[row_offsets[t]:row_offsets[t + 1]]
+        self.row_order = np.argsort(self.row_term_ids, kind="stable").astype(np.int32)
+        counts = np.bincount(self.row_term_ids, minlength=len(self.terms))
+        self.row_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    @classmethod
+    def from_arrays(cls, terms, row_term_ids, row_order, row_offsets):
+        """Rebuild from previously computed arrays (e.g. memory-mapped from a snapshot)."""
+        self = cls.__new__(cls)
+        self.terms = terms
+        self.row_term_ids = row_term_ids
+        self.row_order = row_order
+        self.row_offsets = row_offsets
+        return self
+
+    def __len__(self):
+        return len(self.terms)
+
+    @property
+    def num_rows(self):
+        return len(self.row_term_ids)
+
+    def id_of(self, term: str) -> int:
+        """Term id of an already lower-cased term, or -1 if it does not occur."""
+        if not hasattr(self, "_ids"):
+            self._ids = {t: i for i, t in enumerate(self.terms)}
+        return self._ids.get(term, -1)
+
+    def memory_bytes(self) -> int:
+        strings = sum(sys.getsizeof(t) for t in self.terms)
+        return strings + self.row_term_ids.nbytes + self.row_order.nbytes + self.row_offsets.nbytes
+
+    def term_of_row(self, row: int) -> str:
+        return self.terms[self.row_term_ids[row]]
+
+    def rows_for(self, term_ids) -> np.ndarray:
+        """Sorted row positions for the given term ids."""
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        if term_ids.size == 0:
+            return np.zeros(0, dtype=np.int32)
+        starts = self.row_offsets[term_ids]
+        lengths = self.row_offsets[term_ids + 1] - starts
+        # expand each [start, start + length) range without a Python loop
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        rows = self.row_order[np.arange(lengths.sum()) + offsets]
+        return np.sort(rows)
+
+    def fan_out(self, term_values: np.ndarray) -> np.ndarray:
+        """Broadcast a per-term array to one value per row."""
+        return term_values[self.row_term_ids]
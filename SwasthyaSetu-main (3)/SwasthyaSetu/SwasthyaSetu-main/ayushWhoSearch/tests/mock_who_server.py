@@ -0,0 +1,58 @@
+"""
+Local stand-in for the WHO ICD-11 search API, for tests and benchmarks.
+
+Every term has `entities_per_term` results, served pageSize at a time. The
+server can add latency and fail every n-th request with a 503 or a 429, and
+it records what it was asked. Pages carry an ETag and honour If-None-Match
+(etags=False turns that off); tests change app.state.release,
+app.state.sizes (term -> result count) and app.state.titles
+(entity id -> title) to simulate a new WHO release. Use it in-process through
+httpx.ASGITransport(make_app(...)), or run it for real:
+
+    uvicorn tests.mock_who_server:app --port 8081
+"""
+import asyncio
+import hashlib
+import json
+import time
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+
+def make_app(entities_per_term=120, latency=0.0, fail_every=0, throttle_every=0, release="2025-01", etags=True):
+    app = FastAPI()
+    app.state.requests = []
+    app.state.release = release
+    app.state.sizes = {}
+    app.state.titles = {}
+
+    @app.get("/icd/release/11/mms/search")
+    async def search(request: Request, q: str, page: int = 1, pageSize: int = 50):
+        app.state.requests.append((time.monotonic(), q, page))
+        n = len(app.state.requests)
+        if latency:
+            await asyncio.sleep(latency)
+        if throttle_every and n % throttle_every == 0:
+            return JSONResponse({"error": "quota"}, status_code=429, headers={"Retry-After": "0"})
+        if fail_every and n % fail_every == 0:
+            return JSONResponse({"error": "unavailable"}, status_code=503)
+        start = (page - 1) * pageSize
+        stop = min(app.state.sizes.get(q, entities_per_term), start + pageSize)
+        entities = []
+        for i in range(start, stop):
+            uri = f"http://id.who.int/icd/entity/{q}-{i}"
+            entities.append({"id": uri, "title": app.state.titles.get(uri, f"{q} entity {i}"),
+                             "theCode": f"{q[:2].upper()}{i}"})
+        body = {"destinationEntities": entities, "releaseId": app.state.release}
+        if not etags:
+            return body
+        etag = '"%s"' % hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest()[:16]
+        if request.headers.get("If-None-Match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return JSONResponse(body, headers={"ETag": etag})
+
+    return app
+
+
+app = make_app()
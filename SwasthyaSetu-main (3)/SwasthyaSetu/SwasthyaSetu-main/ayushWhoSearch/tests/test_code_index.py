@@ -0,0 +1,51 @@
+import json
+
+import code_index
+import fhir_cache
+from code_index import CodeIndex, expansion, lookup_parameters
+
+CODESYSTEM = {
+    "resourceType": "CodeSystem", "url": "http://example.org/cs", "version": "1", "name": "NAMASTE",
+    "status": "active", "content": "complete",
+    "concept": [
+        {"code": "AYU-1", "display": "Jvara", "definition": "fever"},
+        {"code": "AYU-2", "display": "Vata jvara"},
+        {"code": "SID-1", "display": "Kasam"},
+        {"code": "UNA-1", "display": "Humma-e-jvara"},
+    ],
+}
+
+
+def test_lookup_and_filtered_pages():
+    index = CodeIndex(CODESYSTEM)
+    params = {p["name"]: p for p in lookup_parameters(index, index.lookup("AYU-1"))["parameter"]}
+    assert params["display"]["valueString"] == "Jvara"
+    assert params["property"]["part"][1]["valueString"] == "fever"
+    assert index.lookup("missing") is None
+
+    # word-prefix matches in CodeSystem order, then substring-only matches
+    assert [c["code"] for c in index.page("JVA", 0, 10)[1]] == ["AYU-1", "AYU-2", "UNA-1"]
+    assert [c["code"] for c in index.page("vara", 0, 10)[1]] == ["AYU-1", "AYU-2", "UNA-1"]
+    assert [c["code"] for c in index.page("sid", 0, 10)[1]] == ["SID-1"]
+    assert index.page("ja", 0, 10) == (0, [])
+
+    total, page = index.page("jvara", 1, 1)
+    assert total == 3 and page[0]["code"] == "AYU-2"
+    full = expansion(index, offset=2, count=5)["expansion"]
+    assert full["total"] == 4 and [c["code"] for c in full["contains"]] == ["SID-1", "UNA-1"]
+
+
+def test_index_follows_the_codesystem_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(fhir_cache, "SOURCE_CHECK_INTERVAL", 0)
+    path = tmp_path / "codesystem.json"
+    path.write_text(json.dumps(CODESYSTEM), encoding="utf-8")
+    monkeypatch.setattr(code_index, "codesystem", fhir_cache.CachedResource(str(path)))
+    monkeypatch.setattr(code_index, "_index", None)
+    index = code_index.get_index()
+    assert code_index.get_index() is index
+
+    edited = {**CODESYSTEM, "concept": CODESYSTEM["concept"] + [{"code": "NEW-1", "display": "Kasa"}]}
+    path.write_text(json.dumps(edited), encoding="utf-8")
+    assert code_index.get_index().lookup("NEW-1")["display"] == "Kasa"
+    path.unlink()
+    assert code_index.get_index() is None
@@ -0,0 +1,86 @@
+import csv
+import sqlite3
+
+import pytest
+
+import generate_mappings
+from code_reader import connection, read_code_table
+from encoding_pool import EncodingPool
+
+AYUSH = [("AAA-1", "Jvara", "fever"), ("AAA-2", "Kasa", None), ("AAA-3", "Atisara", "diarrhoea")]
+TM2 = [("SM21", "Fever disorder (TM2)", "jvara"), ("SM22", "Cough disorder (TM2)", "kasa")]
+BIOMED = [("MG26", "Fever of other or unknown origin", None), ("MD12", "Cough", None), ("ME05", "Diarrhoea", None)]
+
+
+class _AbortingCursor(sqlite3.Cursor):
+    def execute(self, *args):
+        if self.connection.aborted:
+            raise sqlite3.OperationalError("current transaction is aborted")
+        try:
+            return super().execute(*args)
+        except sqlite3.Error:
+            self.connection.aborted = True
+            raise
+
+
+class _AbortingConnection(sqlite3.Connection):
+    """Fails every statement after an error until rollback(), like a PostgreSQL transaction."""
+    aborted = False
+
+    def cursor(self, factory=_AbortingCursor):
+        return super().cursor(factory)
+
+    def rollback(self):
+        self.aborted = False
+        super().rollback()
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "codes.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE codes (code TEXT, display TEXT, definition TEXT)")
+    conn.execute("CREATE TABLE who_tm2_codes (code TEXT, title TEXT, index_terms TEXT)")
+    conn.execute("CREATE TABLE biomedicine_codes (code TEXT, title TEXT, definition TEXT)")
+    conn.executemany("INSERT INTO codes VALUES (?, ?, ?)", AYUSH)
+    conn.executemany("INSERT INTO who_tm2_codes VALUES (?, ?, ?)", TM2)
+    conn.executemany("INSERT INTO biomedicine_codes VALUES (?, ?, ?)", BIOMED)
+    conn.commit()
+    conn.close()
+    return f"sqlite:///{path}"
+
+
+def test_read_code_table_streams_into_columns(database):
+    with connection(database) as conn:
+        table = read_code_table(conn, "AYUSH", itersize=2)
+    assert len(table) == 3
+    assert table.codes.tolist() == ["AAA-1", "AAA-2", "AAA-3"]
+    assert table.titles[1] == "Kasa"
+    assert table.texts[0:2] == ["Jvara. fever", "Kasa. "]
+
+
+def test_generate_mappings_from_sqlite(database, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(generate_mappings, "DATABASE_URL", database)
+    monkeypatch.setattr(generate_mappings, "MODEL_NAME", "hashing-64")
+    monkeypatch.setattr(generate_mappings, "SIMILARITY_THRESHOLD", -1.0)
+    monkeypatch.setattr(generate_mappings, "EncodingPool", lambda name: EncodingPool(name, workers=1))
+    generate_mappings.generate_semantic_mappings()
+
+    with open(generate_mappings.OUTPUT_CSV_PATH, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    # every AYUSH code gets all TM2 (2) and the top 3 Biomedicine candidates, in AYUSH order
+    assert [r["AYUSH_Code"] for r in rows] == [code for code, _, _ in AYUSH for _ in range(5)]
+    assert [r["Target_System"] for r in rows[:5]] == ["TM2"] * 2 + ["Biomedicine"] * 3
+    assert rows[0]["AYUSH_Term"] == "Jvara"
+    assert {r["WHO_Code_Candidate"] for r in rows[2:5]} == {"MG26", "MD12", "ME05"}
+
+
+def test_failed_table_does_not_block_the_others(database):
+    path = database[len("sqlite:///"):]
+    with sqlite3.connect(path) as conn:
+        conn.execute("DROP TABLE codes")
+    conn = sqlite3.connect(path, factory=_AbortingConnection)
+    tables = {system: generate_mappings.fetch_codes_from_db(conn, system) for system in ("AYUSH", "TM2", "Biomedicine")}
+    conn.close()
+    assert [len(tables[s]) for s in ("AYUSH", "TM2", "Biomedicine")] == [0, 2, 3]
@@ -0,0 +1,47 @@
+import numpy as np
+
+from embedding_cache import CachedEncoder, EmbeddingCache
+from embedding_index import HashingEncoder
+from encoding_pool import EncodingPool
+
+
+class CountingEncoder(HashingEncoder):
+    def __init__(self):
+        super().__init__(32)
+        self.encoded = []
+
+    def encode(self, texts, show_progress_bar=False):
+        self.encoded.extend(texts)
+        return super().encode(texts)
+
+
+def test_only_misses_are_encoded(tmp_path):
+    model = CountingEncoder()
+    encoder = CachedEncoder(model, EmbeddingCache(tmp_path / "cache.sqlite"))
+    first = encoder.encode(["jvara", "kasa", "jvara"])
+    assert model.encoded == ["jvara", "kasa"]
+    assert encoder.last_stats == {"texts": 3, "hits": 0, "misses": 3}
+
+    # a new process reads the same file: vectors come back bit-identical
+    encoder = CachedEncoder(model, EmbeddingCache(tmp_path / "cache.sqlite"))
+    second = encoder.encode(["kasa", "jvara", "atisara"])
+    assert model.encoded == ["jvara", "kasa", "atisara"]
+    assert encoder.last_stats == {"texts": 3, "hits": 2, "misses": 1}
+    assert np.array_equal(second[:2], first[[1, 0]])
+
+
+def test_cache_is_keyed_by_model(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite")
+    CachedEncoder(HashingEncoder(32), cache).encode(["jvara"])
+    other = CachedEncoder(HashingEncoder(64), cache)
+    assert other.encode(["jvara"]).shape == (1, 64)
+    assert other.last_stats["misses"] == 1 and len(cache) == 2
+
+
+def test_encoding_pool_matches_single_encoder(tmp_path):
+    texts = [f"term {i} jvara" for i in range(250)]
+    with EncodingPool("hashing-32", workers=2, batch_size=40) as pool:
+        assert pool.name == "hashing-32"
+        encoder = CachedEncoder(pool, EmbeddingCache(tmp_path / "cache.sqlite"))
+        assert np.array_equal(encoder.encode(texts), HashingEncoder(32).encode(texts))
+        assert pool.encode([]).shape == (0, 32)
@@ -0,0 +1,87 @@
+import gzip
+import json
+import os
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import fhir_cache
+from fhir_cache import CachedResource, fhir_response
+
+CODESYSTEM = {
+    "resourceType": "CodeSystem", "id": "namaste", "status": "active", "content": "complete",
+    "name": "NAMASTE", "text": {"status": "generated", "div": "<div/>"},
+    "concept": [{"code": "A-1", "display": "Jvara"}, {"code": "B-2", "display": "Kasa"}],
+}
+
+
+def _client(tmp_path, monkeypatch):
+    monkeypatch.setattr(fhir_cache, "SOURCE_CHECK_INTERVAL", 0)
+    path = tmp_path / "codesystem.json"
+    path.write_text(json.dumps(CODESYSTEM, indent=4), encoding="utf-8")
+    cached = CachedResource(str(path))
+    app = FastAPI()
+
+    @app.get("/fhir/CodeSystem/namaste")
+    def get_codesystem(request: Request):
+        return fhir_response(request, cached)
+
+    return TestClient(app), path, cached
+
+
+def test_serves_compact_bytes_and_revalidates(tmp_path, monkeypatch):
+    client, path, cached = _client(tmp_path, monkeypatch)
+    r = client.get("/fhir/CodeSystem/namaste", headers={"Accept-Encoding": "identity"})
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/fhir+json"
+    assert r.json() == CODESYSTEM
+    assert b"\n" not in r.content
+    etag = r.headers["etag"]
+
+    r = client.get("/fhir/CodeSystem/namaste", headers={"If-None-Match": etag})
+    assert r.status_code == 304 and r.content == b""
+    r = client.get("/fhir/CodeSystem/namaste", headers={"If-Modified-Since": r.headers["last-modified"]})
+    assert r.status_code == 304
+
+    # a touch keeps the ETag, an edit changes it
+    os.utime(path, (1, 1))
+    assert client.get("/fhir/CodeSystem/namaste", headers={"If-None-Match": etag}).status_code == 304
+    assert cached.loads == 1
+    path.write_text(json.dumps({**CODESYSTEM, "status": "retired"}), encoding="utf-8")
+    r = client.get("/fhir/CodeSystem/namaste", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.json()["status"] == "retired"
+    assert r.headers["etag"] != etag and cached.loads == 2
+
+    path.unlink()
+    assert client.get("/fhir/CodeSystem/namaste").status_code == 404
+
+
+def test_half_written_file_is_read_again(tmp_path, monkeypatch):
+    client, path, cached = _client(tmp_path, monkeypatch)
+    assert client.get("/fhir/CodeSystem/namaste").json() == CODESYSTEM
+    complete = json.dumps({**CODESYSTEM, "status": "retired"})
+    path.write_text(complete[:-10] + " " * 10, encoding="utf-8")
+    os.utime(path, (100, 100))
+    assert cached.get() == CODESYSTEM
+    # finished with the same size and mtime: only a retry of the parse can notice
+    path.write_text(complete, encoding="utf-8")
+    os.utime(path, (100, 100))
+    assert client.get("/fhir/CodeSystem/namaste").json()["status"] == "retired"
+
+
+def test_gzip_and_partial_responses(tmp_path, monkeypatch):
+    client, _, cached = _client(tmp_path, monkeypatch)
+    r = client.get("/fhir/CodeSystem/namaste", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["etag"].endswith('-gzip"')
+    assert json.loads(r.content) == CODESYSTEM  # the client decodes gzip
+    raw = client.get("/fhir/CodeSystem/namaste", headers={"Accept-Encoding": "gzip;q=0"})
+    assert "content-encoding" not in raw.headers
+    assert gzip.decompress(cached.encoded().bodies["gzip"]) == raw.content
+
+    summary = client.get("/fhir/CodeSystem/namaste?_summary=true").json()
+    assert "concept" not in summary and "text" not in summary and summary["name"] == "NAMASTE"
+    assert summary["meta"]["tag"][0]["code"] == "SUBSETTED"
+    elements = client.get("/fhir/CodeSystem/namaste?_elements=name").json()
+    assert set(elements) == {"resourceType", "id", "status", "content", "name", "meta"}
+    assert client.get("/fhir/CodeSystem/namaste?_summary=count").status_code == 400
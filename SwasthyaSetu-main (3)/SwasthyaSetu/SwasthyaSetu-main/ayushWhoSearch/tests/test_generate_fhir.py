@@ -0,0 +1,82 @@
+import csv
+import json
+
+import pytest
+
+import generate_fhir
+
+HEADERS = {
+    "ayurveda_processed.csv": ["NAMC_CODE", "NAMC_term", "Long_definition"],
+    "siddha_processed.csv": ["NAMC_CODE", "NAMC_TERM", "Long_definition"],
+    "unani_processed.csv": ["NUMC_CODE", "NUMC_TERM", "Long_definition"],
+}
+MAPPINGS = ["AYUSH_Code", "WHO_Code_Candidate", "WHO_Term_Candidate", "Suggested_Relationship"]
+
+
+def write_csv(path, header, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows([header, *rows])
+
+
+def resources():
+    out = []
+    for path in (generate_fhir.CODESYSTEM_OUTPUT_PATH, generate_fhir.CONCEPTMAP_OUTPUT_PATH):
+        with open(path, encoding="utf-8") as f:
+            resource = json.load(f)
+        out.append({k: v for k, v in resource.items() if k not in ("id", "version", "meta", "date")})
+    return out
+
+
+@pytest.fixture
+def inputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for path, header in HEADERS.items():
+        write_csv(path, header, [[f"{path[:2].upper()}-{i}", f"term {i}", f"definition {i}"] for i in range(5)])
+    write_csv(generate_fhir.AI_MAPPINGS_CSV, MAPPINGS, [[f"AY-{i}", f"MG{i}", f"fever {i}", "related-to"] for i in range(6)])
+    return tmp_path
+
+
+def test_rebuild_only_touches_changed_sources(inputs, capsys):
+    generate_fhir.create_fhir_resources()
+    conceptmap_mtime = (inputs / generate_fhir.CONCEPTMAP_OUTPUT_PATH).stat().st_mtime_ns
+
+    write_csv("siddha_processed.csv", HEADERS["siddha_processed.csv"],
+              [["SI-0", "term 0", "edited"], ["SI-1", "term 1", "definition 1"], ["SI-9", "new", ""]])
+    capsys.readouterr()
+    generate_fhir.create_fhir_resources(pretty=True)
+    out = capsys.readouterr().out
+    assert "5 terms from Ayurveda (5 unchanged, 0 added or changed, 0 dropped)" in out
+    assert "3 terms from Siddha (1 unchanged, 2 added or changed, 4 dropped)" in out
+    assert (inputs / generate_fhir.CONCEPTMAP_OUTPUT_PATH).stat().st_mtime_ns == conceptmap_mtime
+    assert (inputs / "namaste-combined-codesystem.pretty.json").exists()
+
+    incremental = resources()
+    generate_fhir.create_fhir_resources(full=True)
+    assert resources() == incremental
+    assert [c["code"] for c in incremental[0]["concept"]][5:8] == ["SIDDHA-SI-0", "SIDDHA-SI-1", "SIDDHA-SI-9"]
+
+
+def test_edited_output_is_rebuilt(inputs):
+    generate_fhir.create_fhir_resources()
+    with open(generate_fhir.CONCEPTMAP_OUTPUT_PATH, "w", encoding="utf-8") as f:
+        json.dump({"resourceType": "ConceptMap", "group": [{"element": []}]}, f)
+    generate_fhir.create_fhir_resources()
+    assert len(resources()[1]["group"][0]["element"]) == 6
+
+
+def test_conceptmap_groups_targets_per_source_code(inputs):
+    write_csv(generate_fhir.AI_MAPPINGS_CSV, ["AYUSH_Term", *MAPPINGS], [
+        ["Jvara", "AY-1", "SM21", "Fever disorder (TM2)", "equivalent"],
+        ["Kasa", "AY-2", "MD12", "Cough", "related-to"],
+        ["Jvara", "AY-1", "MG26", "Fever of unknown origin", "narrower-than"],
+        ["Jvara", "AY-1", "", "no candidate", "related-to"],
+    ])
+    generate_fhir.create_fhir_resources()
+    elements = resources()[1]["group"][0]["element"]
+    assert elements == [
+        {"code": "AY-1", "display": "Jvara", "target": [
+            {"code": "SM21", "display": "Fever disorder (TM2)", "equivalence": "equivalent"},
+            {"code": "MG26", "display": "Fever of unknown origin", "equivalence": "wider"}]},
+        {"code": "AY-2", "display": "Kasa", "target": [
+            {"code": "MD12", "display": "Cough", "equivalence": "relatedto"}]},
+    ]
@@ -0,0 +1,27 @@
+from sqlalchemy import create_engine, select
+
+from app_.database import Base
+from app_.icd_ingest import IcdEntityWriter, entity_row
+from app_.models import IcdEntity
+
+
+def test_batched_upsert_dedupes_and_updates(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'icd.db'}")
+    Base.metadata.create_all(engine)
+    entities = [{"id": f"http://id.who.int/icd/entity/{i}", "title": {"@value": f"Entity {i}"}, "code": f"C{i}"}
+                for i in range(7)]
+    with IcdEntityWriter(engine, batch_size=3) as writer:
+        writer.add_many(entity_row(e, "fever") for e in entities + entities[:2])
+    assert (writer.inserted, writer.updated) == (7, 2)
+
+    with IcdEntityWriter(engine, batch_size=3) as writer:
+        writer.add(entity_row({**entities[0], "title": "Renamed"}, "cough"))
+        writer.add(entity_row({"title": "no uri"}, "cough"))
+    assert (writer.inserted, writer.updated) == (0, 1)
+
+    with engine.connect() as conn:
+        rows = conn.execute(select(IcdEntity.icd_uri, IcdEntity.label, IcdEntity.source_query, IcdEntity.raw_json)
+                            .order_by(IcdEntity.id)).all()
+    assert len(rows) == 7
+    assert rows[0][1:3] == ("Renamed", "cough") and rows[1][1] == "Entity 1"
+    assert rows[2].raw_json["code"] == "C2"
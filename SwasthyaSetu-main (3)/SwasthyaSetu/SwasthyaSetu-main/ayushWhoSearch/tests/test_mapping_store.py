@@ -0,0 +1,73 @@
+import pandas as pd
+
+from mapping_snapshot import write_snapshot
+from mapping_store import MAPPING_COLUMNS, MappingStore, file_digest, get_store
+
+
+def _write_csv(path):
+    pd.DataFrame({
+        "AYUSH_Code": ["A-1", "A-1", "B-2", "C-3"],
+        "AYUSH_Term": ["Jvara", "Jvara", "kasa", "vAtaprakopaH"],
+        "Target_System": ["TM2"] * 4,
+        "WHO_Code_Candidate": ["SS50", "", "MD12", "SS53"],
+        "WHO_Term_Candidate": ["Fever (TM2)", "Fever", "Cough", "Vata pattern (TM2)"],
+        "Similarity_Score": ["0.7983", "0.5", "0.7983", "0.6123"],
+        "Suggested_Relationship": ["related-to"] * 4,
+    }).to_csv(path, index=False)
+
+
+def test_store_matches_dataframe(tmp_path):
+    path = tmp_path / "mappings.csv"
+    _write_csv(path)
+    store = MappingStore(path)
+    df = pd.read_csv(path, dtype=str).fillna("")
+    df["Similarity_Score"] = pd.to_numeric(df["Similarity_Score"])
+
+    assert store.records(range(len(df))) == df[MAPPING_COLUMNS].to_dict(orient="records")
+    assert store.rows_equal("AYUSH_Code", "A-1").tolist() == [0, 1]
+    assert store.rows_equal("AYUSH_Code", "missing").tolist() == []
+    ranked = df.sort_values(by="Similarity_Score", ascending=False).index.tolist()
+    assert store.rank_by_similarity(range(len(df))).tolist() == ranked
+    assert store.ayush.dictionary.id_of("jvara") == 0
+    assert store.stats()["rows"] == 4
+
+
+def test_get_store_is_shared(tmp_path):
+    path = tmp_path / "mappings.csv"
+    _write_csv(path)
+    assert get_store(path) is get_store(str(path))
+
+
+def test_identical_copies_share_a_store(tmp_path):
+    first, second = tmp_path / "a.csv", tmp_path / "b.csv"
+    _write_csv(first)
+    _write_csv(second)
+    assert get_store(first) is get_store(second)
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = tmp_path / "mappings.csv"
+    _write_csv(path)
+    store = MappingStore(path)
+    write_snapshot(store, file_digest(path))
+
+    mapped = MappingStore(path, file_digest(path))
+    assert mapped.source == "snapshot"
+    assert mapped.records(range(len(mapped))) == store.records(range(len(store)))
+    assert mapped.ayush.dictionary.terms == store.ayush.dictionary.terms
+    for query in ("jvara", "fever", "vata"):
+        assert (mapped.who.match(query, 60) == store.who.match(query, 60)).all()
+
+    # a regenerated CSV no longer matches the snapshot and is parsed again
+    path.write_text(path.read_text().replace("0.6123", "0.6124"))
+    assert MappingStore(path, file_digest(path)).source == "csv"
+
+
+def test_rows_equal_many_uses_row_ranges(tmp_path):
+    path = tmp_path / "mappings.csv"
+    _write_csv(path)
+    store = MappingStore(path)
+    codes = store.column("AYUSH_Code")
+    wanted = ["C-3", "missing", "A-1", "C-3"]
+    assert [rows.tolist() for rows in store.rows_equal_many("AYUSH_Code", wanted)] == \
+        [[i for i, c in enumerate(codes) if c == value] for value in wanted]
@@ -0,0 +1,90 @@
+import json
+
+import fhir_cache
+from app_ import reverse_map
+from app_.reverse_map import ConceptMapIndex, translate_parameters
+
+CONCEPTMAP = {
+    "resourceType": "ConceptMap", "sourceUri": "http://example.org/namaste", "targetUri": "http://id.who.int/icd/release/11/mms",
+    "group": [{"source": "http://example.org/namaste", "target": "http://id.who.int/icd/release/11/mms", "element": [
+        {"code": "A-1", "display": "Jvara", "target": [{"code": "SS50", "display": "Fever (TM2)", "equivalence": "relatedto"},
+                                                      {"code": "MG26", "display": "Fever", "equivalence": "wider"}]},
+        {"code": "B-2", "display": "Vata jvara", "target": [{"code": "SS50", "display": "Fever (TM2)", "equivalence": "relatedto"}]},
+    ]}],
+}
+
+
+def test_reverse_and_forward_translate():
+    index = ConceptMapIndex(CONCEPTMAP, {("A-1", "SS50"): 0.81})
+    assert [(m["AYUSH_Code"], m["Similarity_Score"]) for m in index.sources("SS50")] == [("A-1", 0.81), ("B-2", None)]
+    assert index.sources("XX99") == []
+
+    forward = translate_parameters(index, "A-1")["parameter"]
+    assert forward[0] == {"name": "result", "valueBoolean": True}
+    assert [p["part"][1]["valueCoding"]["code"] for p in forward[1:]] == ["SS50", "MG26"]
+    reverse = translate_parameters(index, "MG26", reverse=True)["parameter"]
+    assert reverse[1]["part"] == [{"name": "equivalence", "valueCode": "wider"},
+                                  {"name": "concept", "valueCoding": {"system": "http://example.org/namaste",
+                                                                      "code": "A-1", "display": "Jvara"}}]
+    assert translate_parameters(index, "nope")["parameter"][0]["valueBoolean"] is False
+
+
+def test_repeated_elements_and_groups_are_merged():
+    resource = {"group": [
+        {"source": "urn:namaste", "target": "urn:mms", "element": [
+            {"code": "A-1", "target": [{"code": "SS50", "equivalence": "relatedto"}]},
+            {"code": "A-1", "target": [{"code": "MG26", "equivalence": "wider"}]}]},
+        {"source": "urn:namaste", "target": "urn:tm2", "element": [
+            {"code": "A-1", "target": [{"code": "SM21", "equivalence": "equivalent"}]}]},
+    ]}
+    index = ConceptMapIndex(resource)
+    assert [t["code"] for t in index.targets("A-1")] == ["SS50", "MG26", "SM21"]
+    forward = translate_parameters(index, "A-1")["parameter"][1:]
+    assert [p["part"][1]["valueCoding"]["system"] for p in forward] == ["urn:mms", "urn:mms", "urn:tm2"]
+    index.targets("A-1")[0]["code"] = "changed"
+    index.sources("SM21")[0]["AYUSH_Code"] = "changed"
+    assert index.targets("A-1")[0]["code"] == "SS50" and index.sources("SM21")[0]["AYUSH_Code"] == "A-1"
+
+
+def test_batch_follows_the_conceptmap_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(fhir_cache, "SOURCE_CHECK_INTERVAL", 0)
+    path = tmp_path / "conceptmap.json"
+    path.write_text(json.dumps(CONCEPTMAP), encoding="utf-8")
+    monkeypatch.setattr(reverse_map, "conceptmap", fhir_cache.CachedResource(str(path)))
+    monkeypatch.setattr(reverse_map, "MAPPINGS_CSV", str(tmp_path / "missing.csv"))
+    monkeypatch.setattr(reverse_map, "_index", None)
+
+    results = reverse_map.icd_to_ayush_batch(["MG26", "XX99", "SS50"])
+    assert [r["ICD_Code"] for r in results] == ["MG26", "XX99", "SS50"]
+    assert [len(r["matches"]) for r in results] == [1, 0, 2]
+
+    CONCEPTMAP["group"][0]["element"][1]["target"].append({"code": "MG26", "equivalence": "relatedto"})
+    path.write_text(json.dumps(CONCEPTMAP), encoding="utf-8")
+    CONCEPTMAP["group"][0]["element"][1]["target"].pop()
+    assert [m["AYUSH_Code"] for m in reverse_map.icd_to_ayush("MG26")] == ["A-1", "B-2"]
+
+
+def test_scores_follow_the_mapping_csv(tmp_path, monkeypatch):
+    import os
+    import time
+
+    import pandas as pd
+
+    monkeypatch.setattr(fhir_cache, "SOURCE_CHECK_INTERVAL", 0)
+    path = tmp_path / "conceptmap.json"
+    path.write_text(json.dumps(CONCEPTMAP), encoding="utf-8")
+    monkeypatch.setattr(reverse_map, "conceptmap", fhir_cache.CachedResource(str(path)))
+    csv = tmp_path / "mappings.csv"
+    monkeypatch.setattr(reverse_map, "MAPPINGS_CSV", str(csv))
+    monkeypatch.setattr(reverse_map, "_index", None)
+
+    def write(score):
+        pd.DataFrame({"AYUSH_Code": ["A-1"], "AYUSH_Term": ["Jvara"], "Target_System": ["TM2"],
+                      "WHO_Code_Candidate": ["MG26"], "WHO_Term_Candidate": ["Fever"],
+                      "Similarity_Score": [score], "Suggested_Relationship": ["related-to"]}).to_csv(csv, index=False)
+
+    write("0.7")
+    assert reverse_map.icd_to_ayush("MG26")[0]["Similarity_Score"] == 0.7
+    write("0.9")
+    os.utime(csv, ns=(time.time_ns(), time.time_ns() + 10**9))
+    assert reverse_map.icd_to_ayush("MG26")[0]["Similarity_Score"] == 0.9
@@ -0,0 +1,50 @@
+import os
+import time
+
+import search_cache as sc
+from search_cache import MemoryBackend, SearchCache, SqliteBackend
+
+
+def test_hits_misses_and_lru_eviction():
+    cache = SearchCache(MemoryBackend(maxsize=2, ttl=60))
+    calls = []
+    compute = lambda v: (lambda: calls.append(v) or v)
+    assert cache.get_or_compute("a", compute(1)) == 1
+    assert cache.get_or_compute("a", compute(99)) == 1
+    cache.get_or_compute("b", compute(2))
+    cache.get_or_compute("c", compute(3))  # evicts "a"
+    assert cache.get_or_compute("a", compute(4)) == 4
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 4, 2)
+    assert calls == [1, 2, 3, 4]
+
+
+def test_entries_expire_after_ttl():
+    cache = SearchCache(MemoryBackend(maxsize=10, ttl=0.01))
+    cache.get_or_compute("k", lambda: [1])
+    time.sleep(0.02)
+    assert cache.get_or_compute("k", lambda: [2]) == [2]
+
+
+def test_regenerated_csv_invalidates_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(sc, "SOURCE_CHECK_INTERVAL", 0)
+    csv = tmp_path / "mappings.csv"
+    csv.write_text("AYUSH_Code\n")
+    cache = SearchCache(MemoryBackend(maxsize=10, ttl=60))
+    version = cache.watch(csv)
+    cache.get_or_compute(SearchCache.make_key("search", "fever", version), lambda: ["old"])
+    csv.write_text("AYUSH_Code,AYUSH_Term\n")
+    os.utime(csv, ns=(time.time_ns(), time.time_ns() + 10**9))
+    assert len(cache.backend) == 1
+    assert cache.get_or_compute("other", lambda: []) == []
+    assert cache.stats()["invalidations"] == 1
+    assert len(cache.backend) == 1
+
+
+def test_sqlite_backend_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = SearchCache(SqliteBackend(path, maxsize=10, ttl=60))
+    second = SearchCache(SqliteBackend(path, maxsize=10, ttl=60))
+    first.get_or_compute("q", lambda: [{"AYUSH_Code": "X"}])
+    assert second.get_or_compute("q", lambda: []) == [{"AYUSH_Code": "X"}]
+    assert second.stats()["hits"] == 1
@@ -0,0 +1,82 @@
+import numpy as np
+from rapidfuzz import fuzz
+
+import search_utils
+from search_utils import rank_top_k
+from ngram_index import IndexedColumn
+from term_dictionary import TermDictionary
+
+
+def test_column_scores_match_scalar_calls():
+    terms = ["jvara", "fever disorder (tm2)", "", "vAtaprakopaH"]
+    scores = IndexedColumn(terms).scores("fever")
+    assert scores.tolist() == [fuzz.partial_ratio("fever", t.lower()) for t in terms]
+
+
+def test_index_shortlist_keeps_every_match():
+    store = search_utils.current_store()
+    column = store.who
+    terms = [t.lower() for t in store.column("WHO_Term_Candidate")]
+    for query in ("diabetes", "haemorrhagic fever", "cogh"):
+        for threshold in (60, 80, 90):
+            full = np.array([fuzz.partial_ratio(query, t) for t in terms])
+            assert (column.match(query, threshold) == (full >= threshold)).all()
+
+
+def test_rank_top_k_matches_stable_sort():
+    combined = np.array([0.7, 0.9, 0.7, 0.4, 0.9, 0.7])
+    expected = sorted(range(len(combined)), key=lambda i: combined[i], reverse=True)
+    expected = [i for i in expected if combined[i] >= 0.5]
+    for k in (1, 2, 3, 4, 20):
+        assert rank_top_k(combined, 0.5, k).tolist() == expected[:k]
+
+
+def test_search_results_are_ranked():
+    results = search_utils.fuzzy_search_with_explain("fever", top_k=5)
+    assert len(results) == 5
+    combined = [r["combined"] for r in results]
+    assert combined == sorted(combined, reverse=True)
+    assert results[0]["explain"]["semantic"] == results[0]["similarity"]
+
+
+def test_term_dictionary_round_trips_rows():
+    values = ["Jvara", "kasa", "jvara", "", "Kasa", "vata"]
+    d = TermDictionary(values)
+    assert d.terms == ["jvara", "kasa", "", "vata"]
+    assert [d.term_of_row(r) for r in range(len(values))] == [v.lower() for v in values]
+    assert d.rows_for([1, 0]).tolist() == [0, 1, 2, 4]
+    assert d.fan_out(np.arange(len(d))).tolist() == [0, 1, 0, 2, 1, 3]
+
+
+def test_fuzzy_mask_matches_word_by_word_loop():
+    from query_planner import fuzzy_mask, tokenize
+    assert tokenize("Fever  fever Cough") == ["fever", "cough"]
+    ayush = ["jvara", "kasa", "Jvara", "fever pattern"]
+    who = ["Fever (TM2)", "cough", "haemorrhagic fever", "nan"]
+    columns = (IndexedColumn(ayush), IndexedColumn(who))
+    for term in ("fever cough", "jvra", "kas fevr", ""):
+        expected = np.zeros(len(ayush), dtype=bool)
+        for word in term.lower().split():
+            expected |= np.array([fuzz.partial_ratio(word, t.lower()) >= 80 for t in ayush])
+            expected |= np.array([fuzz.partial_ratio(word, t.lower()) >= 80 for t in who])
+        assert fuzzy_mask(term, columns, 80).tolist() == expected.tolist()
+
+
+def test_regenerated_csv_is_searched_again(tmp_path, monkeypatch):
+    import os
+    import time
+    import pandas as pd
+
+    csv = tmp_path / "mappings.csv"
+    monkeypatch.setattr(search_utils, "CSV", str(csv))
+
+    def write(who_term):
+        pd.DataFrame({"AYUSH_Code": ["A-1"], "AYUSH_Term": ["Jvara"], "Target_System": ["TM2"],
+                      "WHO_Code_Candidate": ["SS50"], "WHO_Term_Candidate": [who_term],
+                      "Similarity_Score": ["0.9"], "Suggested_Relationship": ["related-to"]}).to_csv(csv, index=False)
+
+    write("Fever (TM2)")
+    assert [r["WHO_Term"] for r in search_utils.cached_search("fever")] == ["Fever (TM2)"]
+    write("Fever disorder (TM2)")
+    os.utime(csv, ns=(time.time_ns(), time.time_ns() + 10**9))
+    assert [r["WHO_Term"] for r in search_utils.cached_search("fever")] == ["Fever disorder (TM2)"]
@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+import embedding_index
+from ann_index import IVFIndex
+from embedding_index import EmbeddingIndex, HashingEncoder, build_ann, save_embeddings, semantic_search, set_encoder
+
+TM2 = {"SS50": "Vata constitution pattern (TM2)", "SM21": "Fever disorder (TM2)", "SM22": "Cough disorder (TM2)"}
+BIOMED = {"MG26": "Fever of other or unknown origin", "MD12": "Cough", "5A11": "Type 2 diabetes mellitus"}
+
+
+@pytest.fixture
+def index(tmp_path):
+    encoder = HashingEncoder(64)
+    for system, codes in (("TM2", TM2), ("Biomedicine", BIOMED)):
+        save_embeddings(tmp_path, system, list(codes), list(codes.values()),
+                        encoder.encode(list(codes.values())), encoder.name)
+    index = EmbeddingIndex(tmp_path)
+    set_encoder(encoder, index)
+    yield index
+    embedding_index._encoder = embedding_index._index = None
+
+
+def test_hashing_encoder_is_deterministic():
+    a, b = HashingEncoder(64), HashingEncoder(64)
+    vectors = a.encode(["jvara", "fever"])
+    assert np.array_equal(vectors, b.encode(["jvara", "fever"]))
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1)
+
+
+def test_search_matches_exact_cosine(index):
+    query = HashingEncoder(64).encode(["fever"])[0]
+    results = index.search(query, top_k=4)
+    exact = sorted(((float(index.scores(s, query)[i]), s, i) for s in index.systems
+                    for i in range(len(index.matrices[s]))), reverse=True)[:4]
+    assert [(r["system"], r["code"]) for r in results] == [(s, index.codes[s][i]) for _, s, i in exact]
+    assert index.matrices["TM2"].dtype == np.float16
+
+
+def test_semantic_search_uses_plugged_encoder(index):
+    results = semantic_search("fever", top_k=2, systems=["TM2"])
+    assert len(results) == 2 and results[0]["code"] == "SM21"
+    assert all(r["system"] == "TM2" for r in results)
+    scores = [r["score"] for r in semantic_search("cough", top_k=6)]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_ivf_full_probe_equals_exact_search():
+    rng = np.random.default_rng(0)
+    matrix = embedding_index.normalize(rng.standard_normal((500, 16))).astype(np.float16)
+    ivf = IVFIndex.build(matrix, np.arange(500, dtype=np.uint64), nlist=10)
+    query = embedding_index.normalize(rng.standard_normal(16))
+    rows, _ = ivf.search(matrix, query, top_k=5, nprobe=ivf.nlist)
+    exact = np.argsort(-(matrix.astype(np.float32) @ query))[:5]
+    assert sorted(rows.tolist()) == sorted(exact.tolist())
+
+
+def test_build_ann_updates_incrementally(tmp_path):
+    encoder = HashingEncoder(32)
+    terms = [f"term {i} {'fever' if i % 2 else 'cough'}" for i in range(200)]
+    codes = [f"C{i}" for i in range(200)]
+    save_embeddings(tmp_path, "TM2", codes, terms, encoder.encode(terms), encoder.name)
+    assert build_ann(tmp_path, "TM2")["retrained"]
+
+    # one changed and one new code: the other lists are kept as they were
+    terms[5], codes[5] = "jvara", "C5b"
+    save_embeddings(tmp_path, "TM2", codes + ["C200"], terms + ["kasa"], encoder.encode(terms + ["kasa"]), encoder.name)
+    stats = build_ann(tmp_path, "TM2")
+    assert (stats["reused"], stats["assigned"], stats["removed"], stats["retrained"]) == (199, 2, 1, False)
+
+    index = EmbeddingIndex(tmp_path)
+    assert index.ann("TM2") is None  # below ANN_MIN_ROWS, searched exactly
+    assert IVFIndex.load(str(tmp_path / "tm2.ivf.npz"), "stale") is None
+
+
+def test_large_systems_are_served_from_ann(tmp_path, monkeypatch):
+    encoder = HashingEncoder(32)
+    terms = [f"disorder {i}" for i in range(300)]
+    save_embeddings(tmp_path, "Biomedicine", terms, terms, encoder.encode(terms), encoder.name)
+    build_ann(tmp_path, "Biomedicine", nlist=4)
+    monkeypatch.setattr(embedding_index, "ANN_MIN_ROWS", 100)
+    index = EmbeddingIndex(tmp_path)
+    assert index.ann("Biomedicine").nlist == 4
+    query = encoder.encode(["disorder 42"])[0]
+    assert index.search(query, top_k=3, nprobe=4) == index.search(query, top_k=3, exact=True)
+
+
+def test_top_k_blocks_matches_full_argsort():
+    rng = np.random.default_rng(1)
+    queries = embedding_index.normalize(rng.standard_normal((37, 8)))
+    targets = embedding_index.normalize(rng.standard_normal((101, 8)))
+    full = queries @ targets.T
+    blocks = list(embedding_index.top_k_blocks(queries, targets, 3, row_chunk=10, col_chunk=16))
+    assert [start for start, _, _ in blocks] == [0, 10, 20, 30]
+    indices = np.concatenate([idx for _, idx, _ in blocks])
+    scores = np.concatenate([sc for _, _, sc in blocks])
+    assert indices.tolist() == [np.argsort(row)[-3:][::-1].tolist() for row in full]
+    assert np.allclose(scores, np.take_along_axis(full, indices, axis=1), atol=1e-6)
+
+
+def test_saving_new_embeddings_reloads_the_index(index, tmp_path):
+    old = embedding_index.get_index()
+    mapped = old.matrices["TM2"]
+    before = np.array(mapped)
+    encoder = HashingEncoder(64)
+    terms = ["Jvara pattern (TM2)"]
+    save_embeddings(tmp_path, "TM2", ["SS99"], terms, encoder.encode(terms), encoder.name)
+    # the file was swapped, not rewritten: the old mapping still reads the old rows
+    assert np.array_equal(mapped, before)
+    assert embedding_index.get_index() is not old
+    assert [r["code"] for r in semantic_search("jvara", top_k=5, systems=["TM2"])] == ["SS99"]
+
+
+def test_query_is_cached_as_encoded(index, monkeypatch):
+    seen = []
+    encoder = embedding_index.get_encoder()
+    monkeypatch.setattr(encoder, "encode", lambda texts: seen.extend(texts) or HashingEncoder(64).encode(texts))
+    semantic_search("Fever", top_k=2)
+    semantic_search("fever", top_k=2)
+    semantic_search("fever", top_k=2)
+    assert seen == ["Fever", "fever"]
+
+
+def test_encoder_mismatch_is_a_lookup_error(index):
+    set_encoder(HashingEncoder(32))
+    with pytest.raises(LookupError):
+        semantic_search("fever")
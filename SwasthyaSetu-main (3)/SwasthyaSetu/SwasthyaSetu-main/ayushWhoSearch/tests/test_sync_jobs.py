@@ -0,0 +1,120 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from sqlalchemy import create_engine, func, select, update
+
+from app_.database import Base
+from app_.models import AuditLog, IcdEntity, SyncCheckpoint, SyncJob
+from app_.sync_jobs import SyncJobRunner
+from mock_who_server import make_app
+
+
+def _runner(tmp_path, server, workers=1, rate=1000, burst=50):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    options = {"base": "http://who.test", "rate": rate, "burst": burst, "backoff": 0.001,
+               "transport": httpx.ASGITransport(server)}
+    return SyncJobRunner(engine, workers=workers, sync_options=options), engine
+
+
+def test_job_runs_in_background_with_progress(tmp_path):
+    runner, engine = _runner(tmp_path, make_app(entities_per_term=120, fail_every=9))
+    job_id = runner.submit(["fever", "cough", "fever"], limit_per_term=3)
+    runner.executor.shutdown(wait=True)
+
+    progress = runner.progress(job_id)
+    assert progress["status"] == "done"
+    assert progress["terms"] == {"total": 2, "done": 2, "failed": 0}
+    assert (progress["pages"], progress["entities"], progress["added"]) == (6, 240, 240)
+    assert progress["throughput"]["pages_per_second"] > 0 and progress["eta_seconds"] is None
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(IcdEntity)).scalar() == 240
+        assert conn.execute(select(AuditLog.details)).scalar()["added"] == 240
+    assert runner.progress("missing") is None
+
+
+def test_resume_continues_from_checkpoints(tmp_path):
+    server = make_app(entities_per_term=120)
+    runner, engine = _runner(tmp_path, server)
+    job_id = runner.create(["fever", "cough", "cold"], limit_per_term=3)
+    # a crashed run: fever finished, cough got as far as page 1
+    with engine.begin() as conn:
+        conn.execute(SyncCheckpoint.__table__.insert(), [
+            {"job_id": job_id, "term": "fever", "page": p, "entities": n, "last": int(p == 3)}
+            for p, n in ((1, 50), (2, 50), (3, 20))] + [
+            {"job_id": job_id, "term": "cough", "page": 1, "entities": 50, "last": 0}])
+
+    assert runner.resume_pending() == [job_id]
+    runner.executor.shutdown(wait=True)
+    assert sorted((q, p) for _, q, p in server.state.requests) == [
+        ("cold", 1), ("cold", 2), ("cold", 3), ("cough", 2), ("cough", 3)]
+    assert runner.progress(job_id)["status"] == "done"
+    assert runner.resume_pending() == []
+
+
+def test_concurrent_jobs_share_one_rate_limit(tmp_path):
+    server = make_app(entities_per_term=120)
+    runner, _ = _runner(tmp_path, server, workers=2, rate=40, burst=1)
+    first, second = runner.submit(["fever", "cough"]), runner.submit(["cold", "flu"])
+    runner.executor.shutdown(wait=True)
+    assert runner.progress(first)["status"] == runner.progress(second)["status"] == "done"
+    times = sorted(t for t, _, _ in server.state.requests)
+    # 8 requests (2 pages per term) through one 40/s bucket take >= 7/40 s; two buckets would need 3/40 s
+    assert len(times) == 8 and times[-1] - times[0] >= 0.16
+
+
+def test_submit_once_returns_the_active_job(tmp_path):
+    runner, _ = _runner(tmp_path, make_app())
+    job_id = runner.create(["fever"])
+    assert runner.submit_once(["fever", "cough"]) == (job_id, False)
+    # submit_once started the queued job on the pool: a second run of it is refused
+    assert not runner.run(job_id)
+    while runner.progress(job_id)["status"] in ("queued", "running"):
+        time.sleep(0.01)
+    new_id, created = runner.submit_once(["fever"])
+    runner.executor.shutdown(wait=True)
+    assert created and new_id != job_id
+
+
+def test_each_pending_job_is_claimed_by_one_worker(tmp_path):
+    server = make_app(entities_per_term=120)
+    first, engine = _runner(tmp_path, server)
+    second = SyncJobRunner(engine, workers=1, sync_options=first.sync_options)
+    jobs = [first.create(["fever"]), first.create(["cough"])]
+
+    # two uvicorn workers starting at once: every job is resumed exactly once
+    resumed = first.resume_pending() + second.resume_pending()
+    first.executor.shutdown(wait=True)
+    second.executor.shutdown(wait=True)
+    assert sorted(resumed) == sorted(jobs)
+    assert len(server.state.requests) == 4
+    assert all(first.progress(j)["status"] == "done" for j in jobs)
+
+
+def test_stale_claim_is_taken_over(tmp_path):
+    runner, engine = _runner(tmp_path, make_app())
+    live, stale = runner.create(["fever"]), runner.create(["cough"])
+    now = datetime.now(timezone.utc)
+    with engine.begin() as conn:
+        for job_id, heartbeat in ((live, now), (stale, now - timedelta(hours=1))):
+            conn.execute(update(SyncJob).where(SyncJob.id == job_id).values(
+                status="running", claimed_by="gone:1:0", heartbeat_at=heartbeat))
+    assert runner.resume_pending() == [stale]
+    runner.executor.shutdown(wait=True)
+    assert runner.progress(stale)["status"] == "done" and runner.progress(live)["status"] == "running"
+
+
+def test_submit_once_race_between_processes(tmp_path, monkeypatch):
+    first, engine = _runner(tmp_path, make_app())
+    second = SyncJobRunner(engine, workers=1, sync_options=first.sync_options)
+    job_id = first.create(["fever"], exclusive=True)
+    # the second process checked before the first inserted: its insert fails and it returns the first's job
+    checks = iter([None])
+    real_active_job = second.active_job
+    monkeypatch.setattr(second, "active_job", lambda: next(checks, real_active_job()))
+    assert second.submit_once(["fever"]) == (job_id, False)
+    second.executor.shutdown(wait=True)
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(SyncJob)).scalar() == 1
+    assert first.progress(job_id)["status"] == "done"
@@ -0,0 +1,85 @@
+import time
+
+from app_ import translate_utils
+from translation_memory import BackgroundFiller, StubTranslator, TranslationMemory, fill, split_who_term
+
+
+def test_fill_only_translates_missing_terms(tmp_path):
+    memory = TranslationMemory(tmp_path / "tm.sqlite")
+    memory.put_many({"Fever": "बुखार"}, "hi")
+    assert fill(memory, StubTranslator(), ["Fever", "Cough", "Cough"], "hi") == 1
+    assert memory.get_many(["Fever", "Cough", "Other"], "hi") == {"Fever": "बुखार", "Cough": "hi:Cough"}
+    assert memory.missing(["Fever"], "ta") == ["Fever"]
+    assert split_who_term("Vata pattern (TM2)") == ("Vata pattern", "(TM2)")
+
+
+def test_requests_read_the_memory_and_fill_misses_in_background(tmp_path, monkeypatch):
+    memory = TranslationMemory(tmp_path / "tm.sqlite")
+    filler = BackgroundFiller(memory, StubTranslator())
+    monkeypatch.setattr(translate_utils, "memory", memory)
+    monkeypatch.setattr(translate_utils, "filler", filler)
+    code = translate_utils.current_store().column("AYUSH_Code")[0]
+
+    # a miss is served untranslated (as a failed translation was) and filled for the next request
+    for prefix in ("", "hi:"):
+        for target in translate_utils.translate_ayush_code(code)["targets"]:
+            base, tag = split_who_term(target["WHO_Term"])
+            assert target["WHO_Term_Translated"] == f"{prefix}{base} {tag}".strip()
+        filler.join()
+    assert filler.filled == len(memory) > 0
+
+
+def test_memory_is_opened_on_first_use(tmp_path, monkeypatch):
+    assert translate_utils.memory is None  # importing translate_utils opens nothing
+    monkeypatch.setenv("TRANSLATION_MEMORY_PATH", str(tmp_path / "tm.sqlite"))
+    monkeypatch.setenv("TRANSLATOR", "stub")
+    monkeypatch.setattr(translate_utils, "memory", None)
+    monkeypatch.setattr(translate_utils, "filler", None)
+    assert translate_utils.translate_term("Fever") == "Fever"
+    translate_utils.filler.join()
+    assert translate_utils.translate_term("Fever") == "hi:Fever"
+    assert translate_utils.memory.path == str(tmp_path / "tm.sqlite")
+    translate_utils.memory.close()
+
+
+class FlakyTranslator(StubTranslator):
+    def __init__(self):
+        self.calls = []
+
+    def translate_many(self, terms, lang) -> dict:
+        self.calls.extend(terms)
+        return {t: v for t, v in super().translate_many(terms, lang).items() if t != "Cough"}
+
+
+def test_failed_terms_back_off_before_retrying(tmp_path):
+    translator = FlakyTranslator()
+    filler = BackgroundFiller(TranslationMemory(tmp_path / "tm.sqlite"), translator, retry_backoff=0.2)
+    filler.request(["Fever", "Cough"], "hi")
+    filler.join()
+    filler.request(["Fever", "Cough"], "hi")
+    filler.join()
+    assert translator.calls == ["Fever", "Cough"]
+    time.sleep(0.25)
+    filler.request(["Cough"], "hi")
+    filler.join()
+    assert translator.calls == ["Fever", "Cough", "Cough"]
+
+
+def test_regenerated_csv_is_translated_again(tmp_path, monkeypatch):
+    import os
+
+    import pandas as pd
+
+    csv = tmp_path / "mappings.csv"
+    monkeypatch.setattr(translate_utils, "CSV", str(csv))
+
+    def write(who_term):
+        pd.DataFrame({"AYUSH_Code": ["A-1"], "AYUSH_Term": ["Jvara"], "Target_System": ["TM2"],
+                      "WHO_Code_Candidate": ["SS50"], "WHO_Term_Candidate": [who_term],
+                      "Similarity_Score": ["0.9"], "Suggested_Relationship": ["related-to"]}).to_csv(csv, index=False)
+
+    write("Fever (TM2)")
+    assert translate_utils.translate_ayush_code("A-1", None)["targets"][0]["WHO_Term"] == "Fever (TM2)"
+    write("Fever disorder (TM2)")
+    os.utime(csv, ns=(time.time_ns(), time.time_ns() + 10**9))
+    assert translate_utils.translate_ayush_code("A-1", None)["targets"][0]["WHO_Term"] == "Fever disorder (TM2)"
@@ -0,0 +1,114 @@
+import importlib
+import json
+
+import httpx
+
+from mock_who_server import make_app
+from who_delta import append_changes, delta_sync, load_state, read_changes
+
+TERMS = ["fever", "cough"]
+
+
+def _sync(tmp_path, server, terms=TERMS, conditional=True):
+    """One fetch_who_data.sync_terms round against the mock server, state kept in tmp_path."""
+    meta_path, results_path = tmp_path / "meta.json", tmp_path / "results.json"
+    meta, previous = load_state(meta_path, results_path)
+    entities, meta, changes, stats = delta_sync(terms, meta=meta, previous=previous, conditional=conditional,
+                                                base="http://who.test", rate=1000, burst=50, backoff=0.001,
+                                                transport=httpx.ASGITransport(server))
+    results_path.write_text(json.dumps(entities))
+    meta_path.write_text(json.dumps(meta))
+    append_changes(tmp_path / "changes.jsonl", changes)
+    return entities, changes, stats
+
+
+def test_unchanged_release_is_served_from_304s(tmp_path):
+    server = make_app(entities_per_term=120)
+    first, changes, _ = _sync(tmp_path, server)
+    assert len(first) == 240 and len(changes["added"]) == 240 and changes["release"] == "2025-01"
+
+    again, changes, stats = _sync(tmp_path, server)
+    assert again == first
+    assert stats["not_modified"] == 6 and stats["pages"] == 0 and stats["reprocessed"] == 0
+    assert (changes["added"], changes["changed"], changes["removed"]) == ([], [], [])
+
+
+def test_new_release_reports_only_what_changed(tmp_path):
+    server = make_app(entities_per_term=120)
+    _sync(tmp_path, server)
+    server.state.release = "2026-01"
+    server.state.titles["http://id.who.int/icd/entity/fever-3"] = "fever, renamed"
+    server.state.sizes = {"fever": 121, "cough": 100}
+
+    entities, changes, stats = _sync(tmp_path, server)
+    assert len(entities) == 221
+    assert (changes["previous_release"], changes["release"]) == ("2025-01", "2026-01")
+    assert [e["id"] for e in changes["added"]] == ["http://id.who.int/icd/entity/fever-120"]
+    assert [e["title"] for e in changes["changed"]] == ["fever, renamed"]
+    assert sorted(changes["removed"]) == sorted(f"http://id.who.int/icd/entity/cough-{i}" for i in range(100, 120))
+    assert stats["reprocessed"] == 221  # the release id is in every page body, so no page is skipped
+    assert [r["seq"] for r in read_changes(tmp_path / "changes.jsonl", since=1)] == [2]
+
+
+def test_page_hashes_stand_in_for_missing_etags(tmp_path):
+    server = make_app(entities_per_term=60, etags=False)
+    _sync(tmp_path, server)
+    server.state.titles["http://id.who.int/icd/entity/cough-55"] = "cough, renamed"
+    _, changes, stats = _sync(tmp_path, server)
+    assert stats["not_modified"] == 0 and stats["unchanged_pages"] == 3 and stats["reprocessed"] == 10
+    assert [e["id"] for e in changes["changed"]] == ["http://id.who.int/icd/entity/cough-55"]
+
+
+def test_failed_term_is_not_a_deletion(tmp_path):
+    server = make_app(entities_per_term=120)
+    _sync(tmp_path, server)
+    entities, changes, _ = _sync(tmp_path, make_app(entities_per_term=120, fail_every=1), conditional=False)
+    assert len(entities) == 240 and changes["removed"] == []
+
+
+def test_subset_of_terms_keeps_the_others(tmp_path):
+    server = make_app(entities_per_term=120)
+    first, _, _ = _sync(tmp_path, server)
+    server.state.sizes = {"fever": 110}
+
+    entities, changes, _ = _sync(tmp_path, server, terms=["fever"])
+    assert len(entities) == 230
+    assert sorted(changes["removed"]) == sorted(f"http://id.who.int/icd/entity/fever-{i}" for i in range(110, 120))
+    meta = json.loads((tmp_path / "meta.json").read_text())
+    assert set(meta["pages"]) == {"fever", "cough"} and len(meta["entities"]) == 230
+
+    # the cough pages are still there for the next full run
+    _, changes, stats = _sync(tmp_path, server)
+    assert changes["removed"] == [] and changes["added"] == [] and stats["not_modified"] >= 3
+
+
+def test_conceptmap_merges_change_records(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "namaste-combined-codesystem.json").write_text(json.dumps(
+        {"concept": [{"code": "N1", "display": "Fever"}, {"code": "N2", "display": "Cough"}]}))
+    (tmp_path / "namaste-combined-conceptmap.json").write_text(json.dumps({"group": [{"element": [
+        {"code": "N1", "target": [{"code": "http://id.who.int/icd/entity/legacy", "equivalence": "relatedTo"}]},
+        {"code": "N2", "target": [{"code": "http://id.who.int/icd/entity/old", "equivalence": "relatedto",
+                                   "extension": [{"url": "http://your-domain.org/fhir/StructureDefinition/who-sync-target",
+                                                  "valueBoolean": True}]},
+                                  {"code": "http://id.who.int/icd/entity/old", "equivalence": "relatedto"},
+                                  {"code": "http://id.who.int/icd/entity/old", "equivalence": "equivalent"}]}]}]}))
+    icd_sync_utils = importlib.import_module("icd_sync_utils")
+    changes = tmp_path / "changes.jsonl"
+    append_changes(changes, {"seq": 1, "added": [{"id": "http://id.who.int/icd/entity/1", "label": "A",
+                                                  "source_query": "fever"}], "changed": [], "removed": []})
+    append_changes(changes, {"seq": 2, "added": [], "changed": [{"id": "http://id.who.int/icd/entity/1",
+                                                                 "label": "B", "source_query": "fever"}],
+                             "removed": ["http://id.who.int/icd/entity/old"]})
+
+    assert icd_sync_utils.merge_sync_changes(changes, since=0) == {"added": 1, "removed": 1, "seq": 2}
+    elements = {el["code"]: el["target"] for el in
+                json.loads((tmp_path / "namaste-combined-conceptmap.json").read_text())["group"][0]["element"]}
+    synced = [icd_sync_utils.SYNC_EXTENSION]
+    assert elements["N1"] == [
+        {"code": "http://id.who.int/icd/entity/legacy", "equivalence": "relatedto", "extension": synced},
+        {"code": "http://id.who.int/icd/entity/1", "display": "B", "equivalence": "relatedto", "extension": synced}]
+    # a curated 'relatedto' target is kept: only the extension marks what a sync added
+    assert elements["N2"] == [{"code": "http://id.who.int/icd/entity/old", "equivalence": "relatedto"},
+                              {"code": "http://id.who.int/icd/entity/old", "equivalence": "equivalent"}]
+    assert icd_sync_utils.merge_sync_changes(changes, since=2)["seq"] == 2
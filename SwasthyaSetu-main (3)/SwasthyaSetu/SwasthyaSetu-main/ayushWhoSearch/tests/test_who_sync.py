@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+import httpx
+
+from mock_who_server import make_app
+from who_sync import TokenBucket, run_sync
+
+
+def test_pages_every_term_concurrently_through_failures():
+    server = make_app(entities_per_term=120, fail_every=7, throttle_every=11)
+    pages = {}
+    stats = run_sync([f"term{i}" for i in range(20)], max_pages=None, page_size=50, concurrency=5,
+                     rate=1000, burst=50, backoff=0.001, base="http://who.test",
+                     transport=httpx.ASGITransport(server),
+                     on_page=lambda term, page, response, entities: pages.__setitem__((term, page), len(entities)))
+    # 120 results per term -> pages of 50, 50, 20
+    assert len(pages) == 60
+    assert all(pages[(f"term{i}", 3)] == 20 for i in range(20))
+    assert stats["entities"] == 20 * 120 and stats["failed_terms"] == 0
+    assert stats["retries"] > 0 and stats["requests"] == len(server.state.requests) == 60 + stats["retries"]
+
+
+def test_max_pages_and_failing_terms():
+    server = make_app(entities_per_term=500, fail_every=1)
+    stats = run_sync(["a", "b"], max_pages=2, retries=2, backoff=0.001, rate=1000, base="http://who.test",
+                     transport=httpx.ASGITransport(server))
+    assert stats["failed_terms"] == 2 and stats["requests"] == 6
+
+    server = make_app(entities_per_term=500)
+    stats = run_sync(["a"], max_pages=2, rate=1000, base="http://who.test", transport=httpx.ASGITransport(server))
+    assert stats["pages"] == 2
+
+
+def test_token_bucket_limits_rate():
+    async def take(n):
+        bucket = TokenBucket(rate=100, burst=5)
+        started = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(n)))
+        return time.monotonic() - started
+
+    # 5 immediately, the other 20 at 100/s
+    assert 0.19 <= asyncio.run(take(25)) < 0.5
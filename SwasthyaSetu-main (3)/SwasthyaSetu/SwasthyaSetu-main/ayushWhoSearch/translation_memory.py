@@ -0,0 +1,235 @@
+"""
+Translation memory for the WHO terms shown by /translate.
+
+Translations are stored in a local SQLite file keyed by (term, target
+language). Requests only read the memory: a miss returns the untranslated
+term and queues it for BackgroundFiller, which translates it off the request
+thread and stores it for the next request.
+
+The memory is meant to be filled ahead of time for every WHO term in the
+mapping CSV:
+
+    python translation_memory.py --langs hi,ta
+
+TRANSLATOR selects the backend: "google" (googletrans, the default),
+"stub" (offline, deterministic; used by the tests) or "none" (read-only
+memory, nothing is ever translated at runtime). TRANSLATION_MEMORY_PATH and
+TRANSLATOR are read when the memory / translator is created, so both can be
+pointed elsewhere (e.g. tests) without reloading the module.
+
+A term the translator fails on is not stored; BackgroundFiller skips it for
+FILL_RETRY_BACKOFF seconds, doubling with every failure up to
+FILL_RETRY_MAX, instead of re-queueing it on every request.
+"""
+import argparse
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+TRANSLATION_MEMORY_PATH = os.getenv("TRANSLATION_MEMORY_PATH", "./data/translation_memory.sqlite")
+TRANSLATOR = os.getenv("TRANSLATOR", "google")
+# languages queued for background fill when translate_utils is imported, e.g. "hi,ta"
+TRANSLATION_PREWARM_LANGS = os.getenv("TRANSLATION_PREWARM_LANGS", "")
+FILL_BATCH_SIZE = 50
+FILL_RETRY_BACKOFF = 60.0
+FILL_RETRY_MAX = 3600.0
+MAPPINGS_CSV = "./data/candidate_mappings_semantic_v2.csv"
+# SQLite's default limit on host parameters per statement is 999
+_LOOKUP_BATCH = 500
+
+logger = logging.getLogger("translation-memory")
+
+
+def clean_term(term: str) -> str:
+    # Remove leading dashes and extra spaces
+    return term.replace("-", "").strip()
+
+
+def split_who_term(who_term: str):
+    """(cleaned base term, "(TM2)"-style tag or "") of a WHO term; only the base is translated."""
+    if "(" in who_term and ")" in who_term:
+        parts = who_term.split("(")
+        return clean_term(parts[0].strip()), "(" + parts[1]
+    return clean_term(who_term), ""
+
+
+class TranslationMemory:
+    def __init__(self, path=None):
+        self.path = str(path or os.getenv("TRANSLATION_MEMORY_PATH", TRANSLATION_MEMORY_PATH))
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS translations "
+                              "(term TEXT, lang TEXT, text TEXT, PRIMARY KEY (term, lang))")
+
+    def get_many(self, terms, lang) -> dict:
+        """term -> translation for every term already in the memory."""
+        found = {}
+        unique = list(dict.fromkeys(terms))
+        for start in range(0, len(unique), _LOOKUP_BATCH):
+            batch = unique[start:start + _LOOKUP_BATCH]
+            with self._lock:
+                rows = self.conn.execute(f"SELECT term, text FROM translations WHERE lang = ? AND term IN "
+                                         f"({','.join('?' * len(batch))})", [lang, *batch]).fetchall()
+            found.update(rows)
+        return found
+
+    def put_many(self, translations: dict, lang):
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?, ?)",
+                                  ((term, lang, text) for term, text in translations.items()))
+
+    def missing(self, terms, lang) -> list:
+        found = self.get_many(terms, lang)
+        return [t for t in dict.fromkeys(terms) if t not in found]
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class GoogleTranslator:
+    name = "google"
+
+    def __init__(self):
+        self.client = None
+
+    def translate_many(self, terms, lang) -> dict:
+        if self.client is None:
+            from googletrans import Translator  # only needed when translations are filled
+            self.client = Translator()
+        out = {}
+        for term in terms:
+            try:
+                out[term] = self.client.translate(term, dest=lang).text
+            except Exception:
+                # left out: BackgroundFiller backs off before retrying it
+                logger.warning("translation of %r to %s failed", term, lang)
+        return out
+
+
+class StubTranslator:
+    """Offline translator: "<lang>:<term>"."""
+    name = "stub"
+
+    def translate_many(self, terms, lang) -> dict:
+        return {term: f"{lang}:{term}" for term in terms}
+
+
+def make_translator(name=None):
+    name = name or os.getenv("TRANSLATOR", TRANSLATOR)
+    if name == "none":
+        return None
+    if name == "stub":
+        return StubTranslator()
+    return GoogleTranslator()
+
+
+class BackgroundFiller:
+    """Daemon thread that translates queued misses in FILL_BATCH_SIZE batches and stores them."""
+
+    def __init__(self, memory: TranslationMemory, translator=None, batch_size=FILL_BATCH_SIZE,
+                 retry_backoff=FILL_RETRY_BACKOFF, retry_max=FILL_RETRY_MAX):
+        self.memory = memory
+        self.translator = translator
+        self.batch_size = batch_size
+        self.retry_backoff = retry_backoff
+        self.retry_max = retry_max
+        self.filled = 0
+        self._queue = queue.Queue()
+        self._pending = set()
+        # (term, lang) -> (failed attempts, monotonic time before which it is not retried)
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def request(self, terms, lang):
+        """Queue terms for translation; terms already queued or backing off after a failure are skipped."""
+        if self.translator is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            new = [t for t in dict.fromkeys(terms)
+                   if (t, lang) not in self._pending and self._failures.get((t, lang), (0, 0))[1] <= now]
+            self._pending.update((t, lang) for t in new)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="translation-fill", daemon=True)
+                self._thread.start()
+        for start in range(0, len(new), self.batch_size):
+            self._queue.put((new[start:start + self.batch_size], lang))
+
+    def _run(self):
+        while True:
+            terms, lang = self._queue.get()
+            todo, stored = list(terms), {}
+            try:
+                todo = self.memory.missing(terms, lang)
+                if todo:
+                    done = self.translator.translate_many(todo, lang)
+                    self.memory.put_many(done, lang)
+                    stored = done
+                    self.filled += len(done)
+            except Exception:
+                logger.exception("background translation fill failed")
+            finally:
+                with self._lock:
+                    self._pending.difference_update((t, lang) for t in terms)
+                    self._back_off([t for t in todo if t not in stored], lang)
+                    for t in stored:
+                        self._failures.pop((t, lang), None)
+                self._queue.task_done()
+
+    def _back_off(self, failed, lang):
+        now = time.monotonic()
+        for t in failed:
+            attempts = self._failures.get((t, lang), (0, 0))[0] + 1
+            delay = min(self.retry_backoff * 2 ** (attempts - 1), self.retry_max)
+            self._failures[(t, lang)] = (attempts, now + delay)
+
+    def join(self):
+        """Wait until everything queued so far has been processed."""
+        self._queue.join()
+
+
+def who_terms(csv_path=MAPPINGS_CSV) -> list:
+    """Distinct translatable base terms of every WHO candidate in the mapping CSV."""
+    df = pd.read_csv(csv_path, dtype=str, usecols=["WHO_Term_Candidate"]).dropna()
+    return list(dict.fromkeys(split_who_term(t)[0] for t in df["WHO_Term_Candidate"].unique()))
+
+
+def fill(memory, translator, terms, lang, batch_size=FILL_BATCH_SIZE) -> int:
+    """Translate and store every term missing for lang, one batch at a time; returns how many were added."""
+    todo = memory.missing(terms, lang)
+    added = 0
+    for start in range(0, len(todo), batch_size):
+        done = translator.translate_many(todo[start:start + batch_size], lang)
+        memory.put_many(done, lang)
+        added += len(done)
+        print(f"   {lang}: {start + len(done)}/{len(todo)}", end="\r")
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill the translation memory for every WHO term in the mapping CSV.")
+    parser.add_argument("--langs", default="hi", help="comma-separated target languages")
+    parser.add_argument("--csv", default=MAPPINGS_CSV)
+    parser.add_argument("--translator", default=TRANSLATOR, choices=["google", "stub"])
+    args = parser.parse_args()
+
+    terms = who_terms(args.csv)
+    memory = TranslationMemory()
+    translator = make_translator(args.translator)
+    print(f"📖 {len(terms)} distinct WHO terms in {args.csv}")
+    for lang in filter(None, (l.strip() for l in args.langs.split(","))):
+        added = fill(memory, translator, terms, lang)
+        print(f"\n✅ {lang}: {added} new translations ({len(memory)} in {memory.path})")
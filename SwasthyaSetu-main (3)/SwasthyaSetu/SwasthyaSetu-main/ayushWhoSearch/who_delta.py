@@ -0,0 +1,214 @@
+"""
+Delta sync of WHO search results against the previous run.
+
+icd_sync_meta.json keeps, besides last_sync/count:
+- "release": the WHO release id the results came from;
+- "pages": {term: {page: {"etag", "hash", "count", "ids"}}}, the ETag and
+  body hash of every search page and the entities it held;
+- "entities": {id: content hash};
+- "seq": number of the last change record.
+
+A delta run sends the stored ETag as If-None-Match; a 304 page is carried
+over from the previous icd11_sync_results.json without being parsed. A 200
+page with an unchanged body hash (servers without ETags) is not rediffed
+either. Entities of changed pages are compared by content hash, so only the
+added and changed ones are reprocessed. A term that failed half-way keeps
+its previous pages: a failed fetch is not a deletion. Terms outside the run's
+term list keep their page records, hashes and entities unchanged, and only
+entities of terms this run synced to the end can be reported removed.
+
+Every run yields one change record ({"seq", "release", "previous_release",
+"added", "changed", "removed"}) that fetch_who_data appends to
+icd11_sync_changes.jsonl; icd_sync_utils.merge_sync_changes applies the
+records after a given seq to the ConceptMap.
+"""
+import hashlib
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from who_sync import PAGE_SIZE, default_extract, run_sync
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(obj) -> str:
+    data = json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def entity_key(e):
+    return e.get('id') or e.get('label')
+
+
+def entity_hash(e) -> str:
+    # source_query says which term found the entity, not what WHO says about it
+    return content_hash({k: v for k, v in e.items() if k != 'source_query'})
+
+
+def load_state(meta_path, results_path):
+    """(meta, {entity key: entity}) of the previous run; empty when there is none."""
+    meta_path, results_path = Path(meta_path), Path(results_path)
+    meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+    previous = json.loads(results_path.read_text()) if results_path.exists() else []
+    return meta, {entity_key(e): e for e in previous if entity_key(e)}
+
+
+def append_changes(path, changes):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(changes, ensure_ascii=False) + "\n")
+
+
+def read_changes(path, since=0):
+    """Change records with seq > since, oldest first."""
+    path = Path(path)
+    if not path.exists():
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record["seq"] > since:
+                    yield record
+
+
+class DeltaSync:
+    """Collects one sync run (on_page / on_not_modified) and diffs it against the previous one."""
+
+    def __init__(self, meta=None, previous=None, conditional=True, page_size=PAGE_SIZE, max_pages=None):
+        meta = meta or {}
+        self.meta = meta
+        self.old_pages = meta.get("pages", {})
+        self.old_hashes = meta.get("entities", {})
+        self.previous = previous or {}
+        self.conditional = conditional
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.etags = {}
+        self.pages = {}
+        self.collected = {}
+        self.hashes = {}
+        self.added, self.changed = [], []
+        self.complete = set()
+        self.release = None
+        self.stats = {"carried_pages": 0, "unchanged_pages": 0, "reprocessed": 0}
+
+    def _old(self, term, page):
+        return self.old_pages.get(term, {}).get(str(page))
+
+    def _carriable(self, record):
+        return all(k in self.previous for k in record["ids"])
+
+    def validators(self, terms):
+        """{(term, page): ETag} for the pages that can be carried over on a 304."""
+        if self.conditional:
+            for term in terms:
+                for page, record in self.old_pages.get(term, {}).items():
+                    if record.get("etag") and self._carriable(record):
+                        self.etags[(term, int(page))] = record["etag"]
+        return self.etags
+
+    def _record(self, term, page, record, entities):
+        self.pages.setdefault(term, {})[str(page)] = record
+        self.collected[(term, page)] = entities
+        if record["count"] < self.page_size or page == self.max_pages:
+            self.complete.add(term)
+
+    def _carry(self, term, page, record, count=True):
+        entities = [self.previous[k] for k in record["ids"]]
+        for e in entities:
+            k = entity_key(e)
+            self.hashes.setdefault(k, self.old_hashes.get(k) or entity_hash(e))
+        if count:
+            self.stats["carried_pages"] += 1
+        self._record(term, page, record, entities)
+
+    def on_not_modified(self, term, page):
+        record = self._old(term, page)
+        self._carry(term, page, record)
+        return record["count"]
+
+    def on_page(self, term, page, body, entities):
+        if isinstance(body, dict):
+            self.release = self.release or body.get("releaseId")
+        page_hash = content_hash(body)
+        old = self._old(term, page)
+        unchanged = self.conditional and old is not None and old.get("hash") == page_hash
+        if unchanged:
+            self.stats["unchanged_pages"] += 1
+        for e in entities:
+            key = entity_key(e)
+            if key and key not in self.hashes:
+                h = self.old_hashes.get(key) if unchanged else None
+                if h is None:
+                    h = entity_hash(e)
+                    self.stats["reprocessed"] += 1
+                    if key not in self.old_hashes:
+                        self.added.append(key)
+                    elif self.old_hashes[key] != h:
+                        self.changed.append(key)
+                self.hashes[key] = h
+            e['source_query'] = term
+        ids = [k for k in dict.fromkeys(entity_key(e) for e in entities) if k]
+        self._record(term, page, {"etag": None, "hash": page_hash, "count": len(entities), "ids": ids}, entities)
+
+    def result(self, terms):
+        """(entities in term/page order, new meta, change record)."""
+        synced = list(dict.fromkeys(terms))
+        for term in synced:
+            if term in self.complete:
+                continue
+            for page, record in self.old_pages.get(term, {}).items():
+                if (term, int(page)) not in self.collected and self._carriable(record):
+                    self._carry(term, int(page), record)
+        # terms this run did not ask for are kept as they were
+        others = [term for term in self.old_pages if term not in set(synced)]
+        for term in others:
+            for page, record in self.old_pages[term].items():
+                if self._carriable(record):
+                    self._carry(term, int(page), record, count=False)
+        order = {term: i for i, term in enumerate(synced + others)}
+        entities = {}
+        for key in sorted(self.collected, key=lambda k: (order[k[0]], k[1])):
+            for e in self.collected[key]:
+                k = entity_key(e)
+                if k and k not in entities:
+                    entities[k] = e
+        for term, pages in self.pages.items():
+            for page, record in pages.items():
+                record["etag"] = self.etags.get((term, int(page)), record["etag"])
+        now = datetime.utcnow().isoformat()
+        release = self.release or self.meta.get("release")
+        seq = self.meta.get("seq", 0) + 1
+        changes = {
+            "seq": seq, "synced_at": now, "release": release, "previous_release": self.meta.get("release"),
+            "added": [entities[k] for k in self.added if k in entities],
+            "changed": [entities[k] for k in self.changed if k in entities],
+            "removed": self._removed(synced, entities),
+        }
+        meta = {"last_sync": now, "count": len(entities), "release": release, "seq": seq,
+                "pages": self.pages, "entities": {k: self.hashes[k] for k in entities}}
+        return list(entities.values()), meta, changes
+
+    def _removed(self, synced, entities):
+        """Previous entities of the terms synced to the end that this run no longer found."""
+        gone = {}
+        for term in synced:
+            if term in self.complete:
+                for record in self.old_pages.get(term, {}).values():
+                    gone.update((k, None) for k in record["ids"] if k not in entities)
+        return list(gone)
+
+
+def delta_sync(term_list, extract=default_extract, meta=None, previous=None, conditional=True, max_pages=None,
+               **options):
+    """Sync term_list against the previous run; returns (entities, meta, changes, stats)."""
+    delta = DeltaSync(meta, previous, conditional, options.get("page_size", PAGE_SIZE), max_pages)
+    stats = run_sync(term_list, extract, max_pages, on_page=delta.on_page, validators=delta.validators(term_list),
+                     on_not_modified=delta.on_not_modified, **options)
+    entities, meta, changes = delta.result(term_list)
+    stats.update(delta.stats)
+    logger.info("WHO delta sync: %s; %d added, %d changed, %d removed", stats, len(changes["added"]),
+                len(changes["changed"]), len(changes["removed"]))
+    return entities, meta, changes, stats
@@ -0,0 +1,238 @@
+"""
+Concurrent, rate-limited WHO ICD-11 search sync.
+
+WhoSync walks the search pages of many terms at once over one pooled
+httpx.AsyncClient:
+
+- WHO_SYNC_CONCURRENCY workers each take the next term and page through it;
+- a token bucket (WHO_SYNC_RATE requests/s, bursts of WHO_SYNC_BURST) is
+  shared by all workers, so the WHO quota holds however many run; pass the
+  same `bucket` to several WhoSync runs (even in other threads, see
+  app_.sync_jobs) to share the quota between them too;
+- 429, 5xx and transport errors are retried up to WHO_SYNC_RETRIES times
+  with full-jitter exponential backoff; a 429 Retry-After pauses the whole
+  bucket, not just the request that got it.
+
+Callers pass an `extract(response) -> entities` function and get every page
+through `on_page(term, page, response, entities)` (a plain function or a
+coroutine), so fetch_who_data and app_.icd_sync share the engine but keep
+their own parsing and storage. run_sync() is the blocking entry point.
+
+Pages can be fetched conditionally: `validators` maps (term, page) to the
+ETag sent as If-None-Match and is updated with the ETags the server returns;
+a 304 goes to `on_not_modified(term, page)`, which returns how many entities
+the unchanged page holds so paging can go on (see who_delta).
+
+Tests run it against an in-process mock WHO server (tests/mock_who_server.py)
+through `transport`.
+"""
+import asyncio
+import inspect
+import logging
+import os
+import random
+import threading
+import time
+
+import httpx
+
+WHO_BASE = os.getenv("WHO_ICD_API_BASE", "https://id.who.int")
+WHO_SEARCH_PATH = "/icd/release/11/mms/search"
+PAGE_SIZE = int(os.getenv("WHO_ICD_PAGE_SIZE", "50"))
+WHO_SYNC_RATE = float(os.getenv("WHO_SYNC_RATE", "5"))
+WHO_SYNC_BURST = int(os.getenv("WHO_SYNC_BURST", "10"))
+WHO_SYNC_CONCURRENCY = int(os.getenv("WHO_SYNC_CONCURRENCY", "8"))
+WHO_SYNC_RETRIES = int(os.getenv("WHO_SYNC_RETRIES", "5"))
+WHO_SYNC_TIMEOUT = float(os.getenv("WHO_SYNC_TIMEOUT", "20"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger("who-sync")
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average and up to `burst` at once.
+
+    Thread-safe and not tied to an event loop, so one bucket can pace syncs
+    running in several threads.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _reserve(self) -> float:
+        """Take a token now, possibly on credit; returns how long to wait before using it."""
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    async def acquire(self):
+        # reservations are handed out in arrival order, each waits out its own debt
+        delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds):
+        """Hold every caller back for about `seconds` (e.g. after a 429 Retry-After)."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+
+async def _call(fn, *args):
+    result = fn(*args)
+    return await result if inspect.isawaitable(result) else result
+
+
+def default_extract(response):
+    return response.get("destinationEntities") or response.get("items") or []
+
+
+class WhoSync:
+    def __init__(self, base=WHO_BASE, headers=None, token_provider=None, rate=WHO_SYNC_RATE, burst=WHO_SYNC_BURST,
+                 concurrency=WHO_SYNC_CONCURRENCY, retries=WHO_SYNC_RETRIES, page_size=PAGE_SIZE,
+                 timeout=WHO_SYNC_TIMEOUT, backoff=BACKOFF_BASE, transport=None, bucket=None):
+        self.base = base
+        self.headers = {"Accept": "application/json", **(headers or {})}
+        # blocking callable returning a bearer token or None (see app_.who_client.fetch_token)
+        self.token_provider = token_provider
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.page_size = page_size
+        self.timeout = timeout
+        self.backoff = backoff
+        self.transport = transport
+        # a TokenBucket shared with other runs; by default each run paces itself
+        self.shared_bucket = bucket
+        self.client = None
+        self.stats = {"requests": 0, "retries": 0, "pages": 0, "entities": 0, "failed_terms": 0,
+                      "not_modified": 0}
+
+    async def __aenter__(self):
+        self.bucket = self.shared_bucket or TokenBucket(self.rate, self.burst)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        self.client = httpx.AsyncClient(base_url=self.base, headers=self.headers, limits=limits,
+                                        timeout=self.timeout, transport=self.transport)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    async def _auth_headers(self):
+        if self.token_provider is None:
+            return {}
+        token = await asyncio.to_thread(self.token_provider)
+        return {"Authorization": f"Bearer {token}"} if token else {}
+
+    async def get(self, path, params=None, headers=None) -> httpx.Response:
+        """GET through the rate limiter, retrying throttling, server and transport errors."""
+        for attempt in range(self.retries + 1):
+            await self.bucket.acquire()
+            self.stats["requests"] += 1
+            try:
+                response = await self.client.get(path, params=params,
+                                                 headers={**await self._auth_headers(), **(headers or {})})
+            except httpx.TransportError as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning("WHO request %s failed (%s), retrying", path, e)
+            else:
+                if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                    if response.status_code != 304:
+                        response.raise_for_status()
+                    return response
+                retry_after = _retry_after(response)
+                if response.status_code == 429 and retry_after is not None:
+                    self.bucket.pause(retry_after)
+            self.stats["retries"] += 1
+            await asyncio.sleep(backoff_delay(attempt, self.backoff))
+
+    async def search(self, term, page=1) -> dict:
+        params = {"q": term, "page": page, "pageSize": self.page_size}
+        return (await self.get(WHO_SEARCH_PATH, params)).json()
+
+    async def _sync_term(self, term, extract, max_pages, on_page, page=1, validators=None, on_not_modified=None):
+        while max_pages is None or page <= max_pages:
+            etag = validators.get((term, page)) if validators is not None and on_not_modified else None
+            params = {"q": term, "page": page, "pageSize": self.page_size}
+            try:
+                response = await self.get(WHO_SEARCH_PATH, params, {"If-None-Match": etag} if etag else None)
+                body = None if response.status_code == 304 else response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                logger.error("WHO search failed for %s page %s: %s", term, page, e)
+                self.stats["failed_terms"] += 1
+                return
+            if body is None:
+                self.stats["not_modified"] += 1
+                count = await _call(on_not_modified, term, page)
+            else:
+                if validators is not None and response.headers.get("ETag"):
+                    validators[(term, page)] = response.headers["ETag"]
+                entities = extract(body)
+                self.stats["pages"] += 1
+                self.stats["entities"] += len(entities)
+                if on_page is not None:
+                    await _call(on_page, term, page, body, entities)
+                count = len(entities)
+            # basic pagination heuristics: stop if fewer than page_size returned
+            if count < self.page_size:
+                return
+            page += 1
+
+    async def sync_terms(self, terms, extract=default_extract, max_pages=None, on_page=None, start_pages=None,
+                         validators=None, on_not_modified=None) -> dict:
+        """Page through every term with `concurrency` workers; returns the run's stats.
+
+        start_pages maps a term to the page it resumes from (default 1).
+        """
+        start_pages = start_pages or {}
+        started = time.perf_counter()
+        queue = asyncio.Queue()
+        for term in terms:
+            queue.put_nowait(term)
+
+        async def worker():
+            while not queue.empty():
+                term = queue.get_nowait()
+                await self._sync_term(term, extract, max_pages, on_page, start_pages.get(term, 1),
+                                      validators, on_not_modified)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, queue.qsize()))))
+        self.stats["terms"] = len(terms)
+        self.stats["seconds"] = round(time.perf_counter() - started, 3)
+        return dict(self.stats)
+
+
+def run_sync(terms, extract=default_extract, max_pages=None, on_page=None, start_pages=None, validators=None,
+             on_not_modified=None, **options) -> dict:
+    """Blocking wrapper around WhoSync.sync_terms; options go to WhoSync."""
+    async def main():
+        async with WhoSync(**options) as sync:
+            return await sync.sync_terms(list(terms), extract, max_pages, on_page, start_pages, validators,
+                                         on_not_modified)
+    return asyncio.run(main())
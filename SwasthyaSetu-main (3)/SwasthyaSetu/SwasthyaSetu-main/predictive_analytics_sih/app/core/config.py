@@ -41,6 +41,9 @@ class Settings(BaseSettings):
     ICD11_API_BASE_URL: str = "https://id.who.int/icd"
     ICD11_CLIENT_ID: Optional[str] = None
     ICD11_CLIENT_SECRET: Optional[str] = None
+    ICD11_RELEASE: str = "2024-01"  # cache key: entries of another release are never served
+    ICD11_CACHE_PATH: str = "data/icd11_entity_cache.sqlite"
+    ICD11_CACHE_TTL_HOURS: int = 168  # older entries are served, then refreshed in the background
 
     # Predictive Analytics
     ENABLE_PREDICTIVE_ANALYTICS: bool = True
@@ -0,0 +1,47 @@
+"""Persistent cache of ICD-11 API responses, keyed by entity URI (or search key) and release"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional, Tuple
+
+
+class ICD11EntityCache:
+    """SQLite store of raw WHO JSON; callers decide what an entry's age means (see RealICD11Service)"""
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entities ("
+            " key TEXT NOT NULL, release TEXT NOT NULL, data TEXT NOT NULL, fetched_at REAL NOT NULL,"
+            " PRIMARY KEY (key, release))"
+        )
+        self._conn.commit()
+
+    def get(self, key: str, release: str) -> Optional[Tuple[Any, float]]:
+        """(data, age in seconds) or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, fetched_at FROM entities WHERE key = ? AND release = ?", (key, release)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), time.time() - row[1]
+
+    def put(self, key: str, release: str, data: Any):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entities (key, release, data, fetched_at) VALUES (?, ?, ?, ?)",
+                (key, release, json.dumps(data, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -9,6 +9,7 @@ import asyncio
 import json
 
 from app.core.config import get_settings
+from app.services.icd11_entity_cache import ICD11EntityCache
 
 logger = structlog.get_logger(__name__)
 
@@ -23,6 +24,29 @@ class RealICD11Service:
         self.access_token = None
         self.token_expires_at = None
         self.api_version = "v2"
+        # raw WHO responses by entity URI (or search key) and release; repeat lookups stay local
+        self.release = self.settings.ICD11_RELEASE
+        self.cache = ICD11EntityCache(self.settings.ICD11_CACHE_PATH)
+        self.cache_ttl = self.settings.ICD11_CACHE_TTL_HOURS * 3600
+        self._client = None
+        self._token_lock = asyncio.Lock()
+        self._refreshing = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """One pooled client for token, search and entity requests"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=30.0)
+        return self._client
+
+    async def close(self):
+        """Wait for background refreshes, then close the shared HTTP client and the entity cache"""
+        if self._refreshing:
+            await asyncio.gather(*self._refreshing.values(), return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.cache.close()
         
     async def initialize(self):
         """Initialize ICD-11 API connection"""
@@ -52,24 +76,23 @@ class RealICD11Service:
                 "scope": "icdapi_access"
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    "https://icdaccessmanagement.who.int/connect/token",
-                    headers=headers,
-                    data=data
-                )
+            response = await self.client.post(
+                "https://icdaccessmanagement.who.int/connect/token",
+                headers=headers,
+                data=data
+            )
+            
+            if response.status_code == 200:
+                token_data = response.json()
+                self.access_token = token_data["access_token"]
                 
-                if response.status_code == 200:
-                    token_data = response.json()
-                    self.access_token = token_data["access_token"]
-                    
-                    # Calculate expiry time
-                    expires_in = token_data.get("expires_in", 3600)
-                    self.token_expires_at = datetime.now() + timedelta(seconds=expires_in - 300)
-                    
-                    logger.info("Successfully obtained ICD-11 access token")
-                else:
-                    raise Exception(f"Token request failed: {response.status_code} - {response.text}")
+                # Calculate expiry time
+                expires_in = token_data.get("expires_in", 3600)
+                self.token_expires_at = datetime.now() + timedelta(seconds=expires_in - 300)
+                
+                logger.info("Successfully obtained ICD-11 access token")
+            else:
+                raise Exception(f"Token request failed: {response.status_code} - {response.text}")
                     
         except Exception as e:
             logger.error("Failed to get ICD-11 access token", error=str(e))
@@ -77,16 +100,54 @@ class RealICD11Service:
     
     async def _ensure_valid_token(self):
         """Ensure we have a valid access token"""
-        if not self.access_token or datetime.now() >= self.token_expires_at:
-            await self._get_access_token()
+        # concurrent requests share one token refresh
+        async with self._token_lock:
+            if not self.access_token or datetime.now() >= self.token_expires_at:
+                await self._get_access_token()
+    
+    async def _fetch_json(self, key: str, url: str, headers: Dict[str, str],
+                          params: Optional[Dict[str, str]] = None) -> Optional[Any]:
+        """GET from the WHO API and store the JSON under key; None on failure"""
+        await self._ensure_valid_token()
+        response = await self.client.get(
+            url,
+            headers={"Authorization": f"Bearer {self.access_token}", **headers},
+            params=params
+        )
+        if response.status_code != 200:
+            logger.error("ICD-11 request failed",
+                       status_code=response.status_code,
+                       url=url,
+                       response=response.text)
+            return None
+        data = response.json()
+        # SQLite I/O off the event loop
+        await asyncio.to_thread(self.cache.put, key, self.release, data)
+        return data
+    
+    async def _refresh(self, key: str, url: str, headers: Dict[str, str], params: Optional[Dict[str, str]]):
+        try:
+            await self._fetch_json(key, url, headers, params)
+        except Exception as e:
+            logger.warning("Background ICD-11 cache refresh failed", error=str(e), key=key)
+        finally:
+            self._refreshing.pop(key, None)
+    
+    async def _cached_json(self, key: str, url: str, headers: Dict[str, str],
+                           params: Optional[Dict[str, str]] = None) -> Optional[Any]:
+        """WHO JSON from the entity cache, stale-while-revalidate; the network only on a miss"""
+        hit = await asyncio.to_thread(self.cache.get, key, self.release)
+        if hit is None:
+            return await self._fetch_json(key, url, headers, params)
+        data, age = hit
+        if age > self.cache_ttl and key not in self._refreshing:
+            self._refreshing[key] = asyncio.create_task(self._refresh(key, url, headers, params))
+        return data
     
     async def search_tm2_codes(self, query: str, language: str = "en") -> List[Dict[str, Any]]:
         """Search TM2 codes using ICD-11 API"""
         try:
-            await self._ensure_valid_token()
-            
             headers = {
-                "Authorization": f"Bearer {self.access_token}",
                 "Accept": "application/json",
                 "Accept-Language": language,
                 "API-Version": self.api_version
@@ -105,21 +166,10 @@ class RealICD11Service:
                 "chapterFilter": "31"  # TM2 chapter
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(
-                    search_url,
-                    headers=headers,
-                    params=params
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    return self._process_search_results(data, query)
-                else:
-                    logger.error("TM2 search failed", 
-                               status_code=response.status_code, 
-                               response=response.text)
-                    return []
+            data = await self._cached_json(f"search:{language}:{query}", search_url, headers, params)
+            if data is None:
+                return []
+            return self._process_search_results(data, query)
                     
         except Exception as e:
             logger.error("Failed to search TM2 codes", error=str(e), query=query)
@@ -218,25 +268,15 @@ class RealICD11Service:
     async def get_tm2_entity_details(self, entity_uri: str) -> Dict[str, Any]:
         """Get detailed information about a TM2 entity"""
         try:
-            await self._ensure_valid_token()
-            
             headers = {
-                "Authorization": f"Bearer {self.access_token}",
                 "Accept": "application/json",
                 "API-Version": self.api_version
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(entity_uri, headers=headers)
-                
-                if response.status_code == 200:
-                    entity_data = response.json()
-                    return self._process_entity_details(entity_data)
-                else:
-                    logger.error("Failed to get entity details", 
-                               status_code=response.status_code,
-                               uri=entity_uri)
-                    return {}
+            entity_data = await self._cached_json(entity_uri, entity_uri, headers)
+            if entity_data is None:
+                return {}
+            return self._process_entity_details(entity_data)
                     
         except Exception as e:
             logger.error("Failed to get TM2 entity details", error=str(e), uri=entity_uri)
@@ -316,22 +356,24 @@ class RealICD11Service:
                         break
             
             if search_results:
-                # Get detailed information for top results
+                # Get detailed information for top results, concurrently
+                top_results = [result for result in search_results[:3] if result.get("uri")]  # Top 3 results
+                all_details = await asyncio.gather(
+                    *(self.get_tm2_entity_details(result["uri"]) for result in top_results)
+                )
                 detailed_mappings = []
-                for result in search_results[:3]:  # Top 3 results
-                    if result.get("uri"):
-                        details = await self.get_tm2_entity_details(result["uri"])
-                        if details:
-                            mapping = {
-                                "tm2_code": details["icd11_code"],
-                                "tm2_title": details["title"],
-                                "tm2_definition": details["definition"],
-                                "match_score": result["match_score"],
-                                "uri": details["uri"],
-                                "synonyms": details["synonyms"],
-                                "browser_url": details["browserUrl"]
-                            }
-                            detailed_mappings.append(mapping)
+                for result, details in zip(top_results, all_details):
+                    if details:
+                        mapping = {
+                            "tm2_code": details["icd11_code"],
+                            "tm2_title": details["title"],
+                            "tm2_definition": details["definition"],
+                            "match_score": result["match_score"],
+                            "uri": details["uri"],
+                            "synonyms": details["synonyms"],
+                            "browser_url": details["browserUrl"]
+                        }
+                        detailed_mappings.append(mapping)
                 
                 return {
                     "condition": condition,
@@ -1,6 +1,9 @@
 """Real NAMASTE API Integration Service"""
 
+import os
+import sys
 import httpx
+import numpy as np
 import pandas as pd
 from typing import Dict, List, Any, Optional
 import structlog
@@ -9,6 +12,10 @@ import asyncio
 
 from app.core.config import get_settings
 
+# the columnar mapping store is shared with the AYUSH search service
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "ayushWhoSearch"))
+from mapping_store import MappingStore, get_store
+
 logger = structlog.get_logger(__name__)
 
 class RealNAMASTEService:
@@ -29,15 +36,21 @@ class RealNAMASTEService:
         # Load local mapping data as fallback
         self.local_mappings = self._load_local_mappings()
     
-    def _load_local_mappings(self) -> pd.DataFrame:
-        """Load local mapping data from CSV"""
+    def _load_local_mappings(self) -> Optional[MappingStore]:
+        """Load local mapping data from CSV (one shared store per process)"""
         try:
-            df = pd.read_csv(self.settings.MAPPING_DATA_PATH)
-            logger.info(f"Loaded {len(df)} mapping entries from local CSV")
-            return df
+            store = get_store(self.settings.MAPPING_DATA_PATH)
+            logger.info(f"Loaded {len(store)} mapping entries from local CSV")
+            return store
         except Exception as e:
             logger.error("Failed to load local mapping data", error=str(e))
-            return pd.DataFrame()
+            return None
+
+    @staticmethod
+    def _rows_containing(column, text: str) -> np.ndarray:
+        """Rows whose lower-cased term contains text (regex, like str.contains), checked once per unique term"""
+        hits = pd.Series(column.dictionary.terms, dtype=object).str.contains(text, na=False).to_numpy()
+        return column.dictionary.rows_for(np.flatnonzero(hits))
     
     async def get_ayush_code_mapping(self, condition: str) -> Dict[str, Any]:
         """Get AYUSH code mapping for a medical condition"""
@@ -156,34 +169,30 @@ class RealNAMASTEService:
     def _search_local_mappings(self, condition: str) -> Optional[Dict[str, Any]]:
         """Search local mapping data as fallback"""
         try:
-            if self.local_mappings.empty:
+            store = self.local_mappings
+            if store is None or len(store) == 0:
                 return None
             
             # Search for condition in AYUSH terms (case-insensitive)
             condition_lower = condition.lower()
             
             # Try exact match first
-            exact_matches = self.local_mappings[
-                self.local_mappings['AYUSH_Term'].str.lower() == condition_lower
-            ]
+            term_id = store.ayush.dictionary.id_of(condition_lower)
+            exact_matches = store.ayush.dictionary.rows_for([term_id]) if term_id >= 0 else []
             
-            if not exact_matches.empty:
+            if len(exact_matches):
                 return self._format_local_mapping_result(exact_matches, condition, "exact")
             
             # Try partial match
-            partial_matches = self.local_mappings[
-                self.local_mappings['AYUSH_Term'].str.lower().str.contains(condition_lower, na=False)
-            ]
+            partial_matches = self._rows_containing(store.ayush, condition_lower)
             
-            if not partial_matches.empty:
+            if len(partial_matches):
                 return self._format_local_mapping_result(partial_matches, condition, "partial")
             
             # Try reverse search in WHO terms
-            who_matches = self.local_mappings[
-                self.local_mappings['WHO_Term_Candidate'].str.lower().str.contains(condition_lower, na=False)
-            ]
+            who_matches = self._rows_containing(store.who, condition_lower)
             
-            if not who_matches.empty:
+            if len(who_matches):
                 return self._format_local_mapping_result(who_matches, condition, "who_term")
             
             return None
@@ -192,15 +201,17 @@ class RealNAMASTEService:
             logger.error("Failed to search local mappings", error=str(e))
             return None
     
-    def _format_local_mapping_result(self, matches: pd.DataFrame, condition: str, match_type: str) -> Dict[str, Any]:
-        """Format local mapping search results"""
+    def _format_local_mapping_result(self, matches: np.ndarray, condition: str, match_type: str) -> Dict[str, Any]:
+        """Format local mapping search results (matches are row positions in the store)"""
         try:
+            store = self.local_mappings
+            rows = store.records(matches)
             # Get the best match (highest similarity score)
-            best_match = matches.loc[matches['Similarity_Score'].idxmax()]
+            best_match = rows[int(np.argmax(store.similarity[matches]))]
             
             # Get all related mappings
             mappings = []
-            for _, row in matches.iterrows():
+            for row in rows:
                 mappings.append({
                     "target_system": row['Target_System'],
                     "code": row['WHO_Code_Candidate'],
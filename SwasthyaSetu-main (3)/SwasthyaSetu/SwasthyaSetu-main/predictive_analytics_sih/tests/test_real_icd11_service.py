@@ -0,0 +1,75 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+
+from app.services import real_icd11_service
+from app.services.real_icd11_service import RealICD11Service
+
+
+def _service(tmp_path, monkeypatch, handler):
+    settings = SimpleNamespace(
+        ICD11_API_BASE_URL="https://id.who.int/icd", ICD11_CLIENT_ID="id", ICD11_CLIENT_SECRET="secret",
+        ICD11_RELEASE="2024-01", ICD11_CACHE_PATH=str(tmp_path / "icd11.sqlite"), ICD11_CACHE_TTL_HOURS=168,
+    )
+    monkeypatch.setattr(real_icd11_service, "get_settings", lambda: settings)
+    service = RealICD11Service()
+    service._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return service
+
+
+def _who(calls):
+    """Mock WHO API: token endpoint, a TM2 search with five hits and their entities."""
+    def handler(request):
+        calls.append(request.url.path)
+        if request.url.path == "/connect/token":
+            return httpx.Response(200, json={"access_token": "token", "expires_in": 3600})
+        if request.url.path.endswith("/search"):
+            return httpx.Response(200, json={"destinationEntities": [
+                {"@id": f"https://id.who.int/icd/entity/{i}", "title": {"@value": f"fever {i}"}, "theCode": f"SA0{i}"}
+                for i in range(5)]})
+        i = request.url.path.rsplit("/", 1)[1]
+        return httpx.Response(200, json={"@id": str(request.url), "title": {"@value": f"fever {i}"},
+                                         "theCode": f"SA0{i}"})
+    return handler
+
+
+def test_repeat_lookups_stay_off_the_network(tmp_path, monkeypatch):
+    calls = []
+    service = _service(tmp_path, monkeypatch, _who(calls))
+
+    async def run():
+        first = await service.map_condition_to_tm2("fever")
+        assert len(calls) == 5  # token, search and the top three entities
+        again = await service.map_condition_to_tm2("fever")
+        assert len(calls) == 5 and again == first
+        assert len(first["tm2_mappings"]) == 3
+        await service.close()
+    asyncio.run(run())
+
+
+def test_cache_survives_a_new_service(tmp_path, monkeypatch):
+    calls = []
+
+    async def lookup():
+        service = _service(tmp_path, monkeypatch, _who(calls))
+        result = await service.map_condition_to_tm2("fever")
+        await service.close()
+        return result
+    first = asyncio.run(lookup())
+    before = len(calls)
+    assert asyncio.run(lookup()) == first and len(calls) == before
+
+
+def test_stale_entries_are_served_and_refreshed(tmp_path, monkeypatch):
+    calls = []
+    service = _service(tmp_path, monkeypatch, _who(calls))
+
+    async def run():
+        await service.map_condition_to_tm2("fever")
+        service.cache_ttl = -1
+        before = len(calls)
+        assert (await service.map_condition_to_tm2("fever"))["search_successful"]
+        await service.close()  # waits for the background refreshes
+        assert len(calls) - before == 4  # the search and three entities, the token is still valid
+    asyncio.run(run())
@@ -251,9 +251,15 @@ async def health_check():
             "predictive_analytics": "operational" if 'predictive' in services else "unavailable",
             "claim_validator": "operational" if 'claims' in services else "unavailable"
         },
-        "total_loaded": len(services)
+        "total_loaded": len(services),
+        "mapping_stores": _mapping_store_stats()
     }
 
+def _mapping_store_stats():
+    # mapping_store is importable once the AYUSH service has put its directory on sys.path
+    store_module = sys.modules.get("mapping_store")
+    return store_module.loaded_stores() if store_module else []
+
 # ============= CONVENIENCE ENDPOINTS (from your original design) =============
 
 @app.get("/search/{term}")